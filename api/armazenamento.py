@@ -0,0 +1,679 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import asyncio
+import bisect
+import datetime
+import errno
+import hashlib
+import heapq
+import os
+import posixpath
+import re
+import tempfile
+from collections import namedtuple
+
+# Camada de armazenamento dos bytes dos documentos (PDFs assinados, originais,
+# metadados e contratos). As rotas falam só com a interface Armazenamento; o
+# backend é escolhido por ARMAZENAMENTO (local, fragmentado, gridfs, memoria).
+
+TAMANHO_CHUNK_ARMAZENAMENTO = 256 * 1024
+
+# versao muda sempre que o conteúdo da chave é regravado (serve de ETag)
+InfoObjeto = namedtuple("InfoObjeto", ["tamanho", "versao"])
+# Instantes (epoch, segundos) da última gravação e do último acesso; None quando o backend não sabe
+TemposObjeto = namedtuple("TemposObjeto", ["modificado", "acessado"])
+
+class ObjetoNaoEncontrado(FileNotFoundError):
+    pass
+
+_CHAVE_VALIDA = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._+=\-]*(/[A-Za-z0-9][A-Za-z0-9._+=\-]*)*$")
+
+def validar_chave(chave):
+    # Chaves são caminhos relativos simples: sem "..", sem barra inicial
+    if not chave or not _CHAVE_VALIDA.match(chave) or ".." in chave.split("/"):
+        raise ValueError(f"Chave de armazenamento inválida: {chave!r}")
+    return chave
+
+def gravar_atomico(caminho, dados):
+    """
+    Grava em um temporário no mesmo diretório e renomeia por cima do destino:
+    quem lê nunca vê um arquivo pela metade.
+    """
+    diretorio = os.path.dirname(caminho) or "."
+    fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+async def blocos_arquivo(caminho, inicio=0, quantidade=None):
+    # Lê um arquivo local em blocos, fora do event loop
+    arquivo = await asyncio.to_thread(open, caminho, "rb")
+    try:
+        if inicio:
+            arquivo.seek(inicio)
+        restante = quantidade
+        while restante is None or restante > 0:
+            tamanho = TAMANHO_CHUNK_ARMAZENAMENTO if restante is None else min(restante, TAMANHO_CHUNK_ARMAZENAMENTO)
+            bloco = await asyncio.to_thread(arquivo.read, tamanho)
+            if not bloco:
+                break
+            if restante is not None:
+                restante -= len(bloco)
+            yield bloco
+    finally:
+        arquivo.close()
+
+async def _blocos(dados):
+    # gravar() aceita bytes ou um iterador assíncrono de bytes
+    if isinstance(dados, (bytes, bytearray, memoryview)):
+        for posicao in range(0, len(dados), TAMANHO_CHUNK_ARMAZENAMENTO):
+            yield bytes(dados[posicao:posicao + TAMANHO_CHUNK_ARMAZENAMENTO])
+        return
+    async for bloco in dados:
+        yield bloco
+
+class Armazenamento:
+    """
+    Interface dos backends. Chaves são caminhos relativos ("abc.pdf",
+    "originais/ab/abc.pdf"); gravar substitui o conteúdo de forma atômica.
+    """
+    nome = "base"
+    fragmentado = False # True quando o próprio backend espalha as chaves em subpastas
+
+    async def gravar(self, chave, dados):
+        """Grava bytes ou um iterador assíncrono de bytes. Retorna o tamanho gravado."""
+        raise NotImplementedError
+
+    async def info(self, chave):
+        """InfoObjeto da chave; lança ObjetoNaoEncontrado."""
+        raise NotImplementedError
+
+    def ler_faixa(self, chave, inicio=0, quantidade=None):
+        """Iterador assíncrono com os bytes [inicio, inicio + quantidade)."""
+        raise NotImplementedError
+
+    async def remover(self, chave):
+        """Retorna True se a chave existia."""
+        raise NotImplementedError
+
+    def listar(self, prefixo="", recursivo=True):
+        """Iterador assíncrono das chaves sob o prefixo."""
+        raise NotImplementedError
+
+    async def listar_pagina(self, cursor=None, limite=1000):
+        """
+        Até `limite` chaves, em ordem estável, a partir do cursor devolvido pela
+        página anterior. Retorna (chaves, próximo cursor); o cursor é None na
+        última página. Varreduras longas retomam do cursor sem listar tudo de novo.
+        """
+        chaves = sorted([chave async for chave in self.listar()])
+        if cursor is not None:
+            chaves = chaves[bisect.bisect_right(chaves, cursor):]
+        chaves = chaves[:limite]
+        return chaves, (chaves[-1] if len(chaves) >= limite else None)
+
+    async def tempos(self, chave):
+        """TemposObjeto da chave; lança ObjetoNaoEncontrado."""
+        await self.info(chave)
+        return TemposObjeto(None, None)
+
+    def caminho_local(self, chave):
+        # Só backends em disco: permite FileResponse (sendfile/pathsend, sem cópia)
+        return None
+
+    async def criar_temporario(self):
+        """
+        Backends em disco: caminho de um temporário no mesmo sistema de arquivos,
+        para quem gera um arquivo grande escrever ali e depois importar_arquivo()
+        só renomear. Os demais retornam None (use um temporário qualquer).
+        """
+        return None
+
+    async def importar_arquivo(self, chave, caminho):
+        """
+        Grava o conteúdo de um arquivo local na chave, em blocos. Backends em
+        disco movem o arquivo (ele deixa de existir em caminho). Retorna o tamanho.
+        """
+        return await self.gravar(chave, blocos_arquivo(caminho))
+
+    async def existe(self, chave):
+        try:
+            await self.info(chave)
+            return True
+        except ObjetoNaoEncontrado:
+            return False
+
+    async def ler(self, chave):
+        return b"".join([bloco async for bloco in self.ler_faixa(chave)])
+
+    def estatisticas(self):
+        return {"backend": self.nome}
+
+def _filtrar_chave(chave, prefixo, recursivo):
+    if not chave.startswith(prefixo):
+        return False
+    return recursivo or "/" not in chave[len(prefixo):]
+
+class ArmazenamentoLocal(Armazenamento):
+    """Arquivos em um diretório, com o mesmo layout das chaves."""
+    nome = "local"
+
+    def __init__(self, diretorio):
+        self.diretorio = os.path.abspath(diretorio)
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, *validar_chave(chave).split("/"))
+
+    def _chave(self, caminho):
+        return os.path.relpath(caminho, self.diretorio).replace(os.sep, "/")
+
+    def caminho_local(self, chave):
+        return self._caminho(chave)
+
+    def _caminhos_leitura(self, chave):
+        # Onde a chave pode estar, na ordem de busca
+        return (self._caminho(chave),)
+
+    def _stat(self, chave):
+        for caminho in self._caminhos_leitura(chave):
+            try:
+                return os.stat(caminho)
+            except FileNotFoundError:
+                continue
+        raise ObjetoNaoEncontrado(chave)
+
+    def _abrir(self, chave):
+        for caminho in self._caminhos_leitura(chave):
+            try:
+                return open(caminho, "rb")
+            except FileNotFoundError:
+                continue
+        raise ObjetoNaoEncontrado(chave)
+
+    async def gravar(self, chave, dados):
+        caminho = self._caminho(chave)
+        if isinstance(dados, (bytes, bytearray, memoryview)):
+            def gravar_tudo():
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                gravar_atomico(caminho, dados)
+            await asyncio.to_thread(gravar_tudo)
+            return len(dados)
+
+        # Streaming: blocos vão para um temporário e só então substituem o destino
+        def abrir():
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+            return os.fdopen(fd, "wb"), temporario
+        arquivo, temporario = await asyncio.to_thread(abrir)
+        tamanho = 0
+        try:
+            async for bloco in dados:
+                await asyncio.to_thread(arquivo.write, bloco)
+                tamanho += len(bloco)
+            await asyncio.to_thread(arquivo.close)
+            await asyncio.to_thread(os.replace, temporario, caminho)
+        except BaseException:
+            arquivo.close()
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return tamanho
+
+    async def info(self, chave):
+        estado = await asyncio.to_thread(self._stat, chave)
+        return InfoObjeto(estado.st_size, f"{estado.st_mtime_ns:x}-{estado.st_size:x}")
+
+    async def tempos(self, chave):
+        # atime depende da montagem (relatime: atualizado no máximo uma vez por dia)
+        estado = await asyncio.to_thread(self._stat, chave)
+        return TemposObjeto(estado.st_mtime, max(estado.st_atime, estado.st_mtime))
+
+    async def ler_faixa(self, chave, inicio=0, quantidade=None):
+        arquivo = await asyncio.to_thread(self._abrir, chave)
+        try:
+            if inicio:
+                arquivo.seek(inicio)
+            restante = quantidade
+            while restante is None or restante > 0:
+                tamanho = TAMANHO_CHUNK_ARMAZENAMENTO if restante is None else min(restante, TAMANHO_CHUNK_ARMAZENAMENTO)
+                bloco = await asyncio.to_thread(arquivo.read, tamanho)
+                if not bloco:
+                    break
+                if restante is not None:
+                    restante -= len(bloco)
+                yield bloco
+        finally:
+            arquivo.close()
+
+    async def ler(self, chave):
+        def ler_tudo():
+            with self._abrir(chave) as f:
+                return f.read()
+        return await asyncio.to_thread(ler_tudo)
+
+    async def criar_temporario(self):
+        # Na raiz do backend: o rename para qualquer subpasta continua atômico
+        def criar():
+            fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+            os.close(fd)
+            return temporario
+        return await asyncio.to_thread(criar)
+
+    async def importar_arquivo(self, chave, caminho):
+        destino = self._caminho(chave)
+        def mover():
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            tamanho = os.path.getsize(caminho)
+            try:
+                os.replace(caminho, destino)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                return None # Outro sistema de arquivos: copia em blocos
+            return tamanho
+        tamanho = await asyncio.to_thread(mover)
+        if tamanho is None:
+            tamanho = await super().importar_arquivo(chave, caminho)
+            await asyncio.to_thread(os.remove, caminho)
+        return tamanho
+
+    async def remover(self, chave):
+        try:
+            await asyncio.to_thread(os.remove, self._caminho(chave))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _varrer(self):
+        chaves = []
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if not nome.endswith(".tmp"):
+                    chaves.append(self._chave(os.path.join(raiz, nome)))
+        return chaves
+
+    async def listar(self, prefixo="", recursivo=True):
+        if not recursivo:
+            # Só um nível: scandir da pasta do prefixo, sem descer na árvore
+            base = prefixo.rsplit("/", 1)[0] + "/" if "/" in prefixo else ""
+            pasta = os.path.join(self.diretorio, *base.split("/")) if base else self.diretorio
+            def varrer_pasta():
+                try:
+                    return [base + e.name for e in os.scandir(pasta) if e.is_file() and not e.name.endswith(".tmp")]
+                except FileNotFoundError:
+                    return []
+            chaves = await asyncio.to_thread(varrer_pasta)
+        else:
+            chaves = await asyncio.to_thread(self._varrer)
+        for chave in chaves:
+            if _filtrar_chave(chave, prefixo, recursivo):
+                yield chave
+
+    def _pagina_caminhos(self, cursor, limite):
+        # Percorre as pastas em ordem de nome a partir do cursor (caminho relativo
+        # do último arquivo devolvido). De cada pasta só os nomes necessários para
+        # completar a página ficam na memória, mesmo com milhões de arquivos nela.
+        caminhos = []
+        def visitar(pasta, partes_cursor):
+            if len(partes_cursor) > 1:
+                # Termina a pasta onde a página anterior parou
+                continuacao = os.path.join(pasta, partes_cursor[0])
+                if os.path.isdir(continuacao):
+                    visitar(continuacao, partes_cursor[1:])
+            apos = partes_cursor[0] if partes_cursor else None
+            while len(caminhos) < limite:
+                def candidatas():
+                    with os.scandir(pasta) as entradas:
+                        for entrada in entradas:
+                            if apos is None or entrada.name > apos:
+                                yield entrada.name, entrada
+                try:
+                    selecionadas = heapq.nsmallest(limite - len(caminhos), candidatas(), key=lambda par: par[0])
+                except FileNotFoundError:
+                    return
+                if not selecionadas:
+                    return
+                # Pastas vazias (ou só com .tmp) não completam a página: o laço busca as seguintes
+                for nome, entrada in selecionadas:
+                    if len(caminhos) >= limite:
+                        return
+                    caminho = os.path.join(pasta, nome)
+                    if entrada.is_dir(follow_symlinks=False):
+                        visitar(caminho, [])
+                    elif not nome.endswith(".tmp"):
+                        caminhos.append(caminho)
+                    apos = nome
+        visitar(self.diretorio, cursor.split("/") if cursor else [])
+        if len(caminhos) < limite:
+            return caminhos, None
+        return caminhos, os.path.relpath(caminhos[-1], self.diretorio).replace(os.sep, "/")
+
+    def _pagina(self, cursor, limite):
+        caminhos, proximo = self._pagina_caminhos(cursor, limite)
+        return [self._chave(caminho) for caminho in caminhos], proximo
+
+    async def listar_pagina(self, cursor=None, limite=1000):
+        # O cursor é o caminho no disco (no fragmentado, difere da chave)
+        return await asyncio.to_thread(self._pagina, cursor, limite)
+
+    def estatisticas(self):
+        return {"backend": self.nome, "diretorio": self.diretorio}
+
+_HEX = re.compile(r"^[0-9a-f]{4}")
+_FRAGMENTO = re.compile(r"^[0-9a-f]{2}$")
+
+def fragmentos_da_chave(nome):
+    # ab/cd a partir do início do nome (IDs e SHA-256 já são hex) ou do SHA-1 do nome
+    base = nome.lower()
+    if not _HEX.match(base):
+        base = hashlib.sha1(nome.encode("utf-8")).hexdigest()
+    return base[:2], base[2:4]
+
+class ChavesIguais:
+    """Tradução entre as chaves do layout plano e do fragmentado quando são as mesmas."""
+    def nova(self, chave_antiga):
+        return chave_antiga
+
+    def antiga(self, chave):
+        return chave
+
+class ArmazenamentoFragmentado(ArmazenamentoLocal):
+    """
+    Como o local, mas cada arquivo fica em <pasta da chave>/ab/cd/<nome>:
+    diretórios pequenos mesmo com milhões de documentos.
+
+    Com chaves_legado (ChavesIguais ou equivalente), o diretório pode ainda ter
+    arquivos do layout plano (ArmazenamentoLocal): enquanto `legado` for True,
+    leituras que não acham a chave no layout novo procuram no plano, e
+    migrar_pagina() move esses arquivos aos poucos. Gravações vão sempre para o
+    layout novo.
+    """
+    nome = "fragmentado"
+    fragmentado = True
+
+    def __init__(self, diretorio, chaves_legado=None):
+        super().__init__(diretorio)
+        self.chaves_legado = chaves_legado
+        self.legado = chaves_legado is not None
+
+    def _caminho(self, chave):
+        pasta, nome = posixpath.split(validar_chave(chave))
+        partes = (pasta.split("/") if pasta else []) + list(fragmentos_da_chave(nome)) + [nome]
+        return os.path.join(self.diretorio, *partes)
+
+    def _no_layout(self, caminho):
+        # No layout novo o arquivo está sob os dois fragmentos do próprio nome
+        partes = os.path.relpath(caminho, self.diretorio).split(os.sep)
+        return len(partes) >= 3 and tuple(partes[-3:-1]) == fragmentos_da_chave(partes[-1])
+
+    def _chave(self, caminho):
+        partes = os.path.relpath(caminho, self.diretorio).split(os.sep)
+        if self._no_layout(caminho):
+            # Remove os dois níveis de fragmento antes do nome
+            return "/".join(partes[:-3] + partes[-1:])
+        chave = "/".join(partes) # Ainda no layout plano
+        return self.chaves_legado.nova(chave) if self.chaves_legado else chave
+
+    def _caminho_legado(self, chave):
+        return os.path.join(self.diretorio, *validar_chave(self.chaves_legado.antiga(chave)).split("/"))
+
+    def _caminhos_leitura(self, chave):
+        if not self.legado:
+            return (self._caminho(chave),)
+        # O layout novo de novo no fim: a migração pode mover o arquivo entre as tentativas
+        novo = self._caminho(chave)
+        return (novo, self._caminho_legado(chave), novo)
+
+    def caminho_local(self, chave):
+        novo = self._caminho(chave)
+        if not self.legado or os.path.exists(novo) or not os.path.exists(self._caminho_legado(chave)):
+            return novo
+        # Só no layout plano: migrar_pagina() pode movê-lo antes de o FileResponse
+        # abrir o caminho. None faz a resposta ir por ler_faixa, que procura nos dois
+        return None
+
+    async def remover(self, chave):
+        removido = await super().remover(chave)
+        if self.legado:
+            try:
+                await asyncio.to_thread(os.remove, self._caminho_legado(chave))
+                removido = True
+            except FileNotFoundError:
+                pass
+        return removido
+
+    def _varrer_nivel(self, prefixo):
+        # Só as chaves diretamente na pasta do prefixo (<pasta>/ab/cd/<nome> e, com
+        # legado, os arquivos do layout plano), sem descer nas demais subpastas
+        base = prefixo.rsplit("/", 1)[0] + "/" if "/" in prefixo else ""
+        pasta = os.path.join(self.diretorio, *base.split("/")) if base else self.diretorio
+        def entradas(caminho):
+            try:
+                with os.scandir(caminho) as itens:
+                    return list(itens)
+            except (FileNotFoundError, NotADirectoryError):
+                return []
+        chaves = []
+        for nivel1 in entradas(pasta):
+            if not nivel1.is_dir(follow_symlinks=False):
+                if self.legado and not nivel1.name.endswith(".tmp"):
+                    chaves.append(self._chave(nivel1.path))
+                continue
+            if not _FRAGMENTO.match(nivel1.name):
+                continue
+            for nivel2 in entradas(nivel1.path):
+                if not nivel2.is_dir(follow_symlinks=False):
+                    # Layout plano com a pasta <sha[:2]> (ex.: originais, ver ChavesOriginaisPlano)
+                    if self.legado and not nivel2.name.endswith(".tmp"):
+                        chaves.append(self._chave(nivel2.path))
+                    continue
+                if not _FRAGMENTO.match(nivel2.name):
+                    continue
+                for arquivo in entradas(nivel2.path):
+                    if (arquivo.is_file(follow_symlinks=False) and not arquivo.name.endswith(".tmp")
+                            and fragmentos_da_chave(arquivo.name) == (nivel1.name, nivel2.name)):
+                        chaves.append(base + arquivo.name)
+        return chaves
+
+    async def listar(self, prefixo="", recursivo=True):
+        if recursivo:
+            chaves = await asyncio.to_thread(self._varrer)
+        else:
+            chaves = await asyncio.to_thread(self._varrer_nivel, prefixo)
+        # Durante a migração a mesma chave pode aparecer nos dois layouts
+        for chave in (dict.fromkeys(chaves) if self.legado else chaves):
+            if _filtrar_chave(chave, prefixo, recursivo):
+                yield chave
+
+    def migrar_pagina(self, cursor=None, limite=1000):
+        """
+        Move para o layout novo os arquivos do layout plano de uma página da
+        listagem, por rename (sem copiar bytes). Se a chave já foi regravada no
+        layout novo, a cópia antiga é só apagada. Síncrono (rode em thread).
+        Retorna (arquivos movidos, bytes movidos, próximo cursor ou None).
+        """
+        caminhos, proximo = self._pagina_caminhos(cursor, limite)
+        movidos = bytes_movidos = 0
+        for caminho in caminhos:
+            if self._no_layout(caminho):
+                continue
+            destino = self._caminho(self._chave(caminho))
+            try:
+                tamanho = os.path.getsize(caminho)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                try:
+                    # link nunca sobrescreve: uma gravação concorrente no layout novo prevalece
+                    os.link(caminho, destino)
+                except FileExistsError:
+                    pass
+                except OSError as e:
+                    if e.errno not in (errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP):
+                        raise
+                    # Sistema de arquivos sem hard link
+                    if not os.path.exists(destino):
+                        os.replace(caminho, destino)
+                os.remove(caminho)
+            except FileNotFoundError:
+                continue # Apagado (ou já movido) no meio do caminho
+            movidos += 1
+            bytes_movidos += tamanho
+        return movidos, bytes_movidos, proximo
+
+    def estatisticas(self):
+        return {"backend": self.nome, "diretorio": self.diretorio, "legado": self.legado}
+
+class ArmazenamentoMemoria(Armazenamento):
+    """Dicionário em memória (testes e benchmarks)."""
+    nome = "memoria"
+
+    def __init__(self):
+        self._objetos = {}
+        self._versao = 0
+
+    async def gravar(self, chave, dados):
+        validar_chave(chave)
+        conteudo = b"".join([bloco async for bloco in _blocos(dados)])
+        self._versao += 1
+        self._objetos[chave] = (conteudo, str(self._versao))
+        return len(conteudo)
+
+    async def info(self, chave):
+        if chave not in self._objetos:
+            raise ObjetoNaoEncontrado(chave)
+        conteudo, versao = self._objetos[chave]
+        return InfoObjeto(len(conteudo), versao)
+
+    async def ler(self, chave):
+        if chave not in self._objetos:
+            raise ObjetoNaoEncontrado(chave)
+        return self._objetos[chave][0]
+
+    async def ler_faixa(self, chave, inicio=0, quantidade=None):
+        conteudo = await self.ler(chave)
+        fim = len(conteudo) if quantidade is None else min(len(conteudo), inicio + quantidade)
+        visao = memoryview(conteudo)
+        for posicao in range(inicio, fim, TAMANHO_CHUNK_ARMAZENAMENTO):
+            yield bytes(visao[posicao:min(posicao + TAMANHO_CHUNK_ARMAZENAMENTO, fim)])
+
+    async def remover(self, chave):
+        return self._objetos.pop(chave, None) is not None
+
+    async def listar(self, prefixo="", recursivo=True):
+        for chave in sorted(self._objetos):
+            if _filtrar_chave(chave, prefixo, recursivo):
+                yield chave
+
+    def estatisticas(self):
+        return {"backend": self.nome, "objetos": len(self._objetos)}
+
+class ArmazenamentoGridFS(Armazenamento):
+    """
+    GridFS (Motor): a chave é o filename. Regravar cria uma nova revisão e
+    apaga as anteriores; o _id da revisão atual é a versão.
+    obter_bucket: função que devolve o AsyncIOMotorGridFSBucket (criado sob demanda).
+    """
+    nome = "gridfs"
+
+    def __init__(self, obter_bucket):
+        self._obter_bucket = obter_bucket
+
+    async def _atual(self, chave):
+        cursor = self._obter_bucket().find({"filename": chave}).sort("uploadDate", -1).limit(1)
+        async for grid_out in cursor:
+            return grid_out
+        raise ObjetoNaoEncontrado(chave)
+
+    async def gravar(self, chave, dados):
+        bucket = self._obter_bucket()
+        grid_in = bucket.open_upload_stream(validar_chave(chave))
+        tamanho = 0
+        try:
+            async for bloco in _blocos(dados):
+                await grid_in.write(bloco)
+                tamanho += len(bloco)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        async for antigo in bucket.find({"filename": chave, "_id": {"$ne": grid_in._id}}):
+            await bucket.delete(antigo._id)
+        return tamanho
+
+    async def info(self, chave):
+        grid_out = await self._atual(chave)
+        return InfoObjeto(grid_out.length, str(grid_out._id))
+
+    async def tempos(self, chave):
+        grid_out = await self._atual(chave)
+        modificado = grid_out.upload_date.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return TemposObjeto(modificado, None)
+
+    async def ler_faixa(self, chave, inicio=0, quantidade=None):
+        atual = await self._atual(chave)
+        grid_out = await self._obter_bucket().open_download_stream(atual._id)
+        if inicio:
+            grid_out.seek(inicio)
+        restante = quantidade
+        while restante is None or restante > 0:
+            tamanho = grid_out.chunk_size if restante is None else min(restante, grid_out.chunk_size)
+            bloco = await grid_out.read(tamanho)
+            if not bloco:
+                break
+            if restante is not None:
+                restante -= len(bloco)
+            yield bloco
+
+    async def remover(self, chave):
+        bucket = self._obter_bucket()
+        removido = False
+        async for grid_out in bucket.find({"filename": chave}):
+            await bucket.delete(grid_out._id)
+            removido = True
+        return removido
+
+    async def listar(self, prefixo="", recursivo=True):
+        vistas = set()
+        filtro = {"filename": {"$regex": "^" + re.escape(prefixo)}}
+        async for grid_out in self._obter_bucket().find(filtro):
+            chave = grid_out.filename
+            if chave not in vistas and _filtrar_chave(chave, prefixo, recursivo):
+                vistas.add(chave)
+                yield chave
+
+    async def listar_pagina(self, cursor=None, limite=1000):
+        # Pelo índice de filename do GridFS: sem carregar a lista inteira
+        chaves = []
+        filtro = {"filename": {"$gt": cursor}} if cursor is not None else {}
+        async for grid_out in self._obter_bucket().find(filtro).sort("filename", 1):
+            if not chaves or chaves[-1] != grid_out.filename: # Revisões da mesma chave
+                chaves.append(grid_out.filename)
+                if len(chaves) >= limite:
+                    break
+        return chaves, (chaves[-1] if len(chaves) >= limite else None)
+
+BACKENDS = ("local", "fragmentado", "gridfs", "memoria")
+
+def armazenamento_do_ambiente(diretorio_padrao=None, obter_bucket=None, padrao="local", chaves_legado=None):
+    """
+    Backend configurado por ARMAZENAMENTO (local, fragmentado, gridfs, memoria)
+    e ARMAZENAMENTO_DIR (diretório dos backends em disco). chaves_legado: ver
+    ArmazenamentoFragmentado (diretório com arquivos do layout plano a migrar).
+    """
+    nome = os.getenv("ARMAZENAMENTO", padrao)
+    diretorio = os.getenv("ARMAZENAMENTO_DIR") or diretorio_padrao
+    if nome == "local":
+        return ArmazenamentoLocal(diretorio)
+    if nome == "fragmentado":
+        return ArmazenamentoFragmentado(diretorio, chaves_legado)
+    if nome == "gridfs":
+        if obter_bucket is None:
+            raise ValueError("ARMAZENAMENTO=gridfs requer um bucket GridFS")
+        return ArmazenamentoGridFS(obter_bucket)
+    if nome == "memoria":
+        return ArmazenamentoMemoria()
+    raise ValueError(f"ARMAZENAMENTO desconhecido: {nome} (use {', '.join(BACKENDS)})")
@@ -0,0 +1,360 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import asyncio
+import datetime
+import html
+import io
+import re
+from collections import namedtuple
+
+# Contrato de adesão em duas partes: o corpo estático (por plano e idioma, ou
+# por modelo da coleção 'modelos') é renderizado uma vez com o reportlab, e
+# cada pagamento só acrescenta os campos variáveis (nome, CPF, data, txid)
+# como uma atualização incremental do PDF: um content stream novo, a página
+# apontando para ele e uma xref nova. Nenhum reportlab/pypdf por requisição.
+# reportlab e pypdf são importados só ao renderizar um modelo (cold start da api).
+
+LOCALE_PADRAO = "pt-BR"
+
+TEXTOS_CONTRATO = {
+    "pt-BR": {
+        "titulo": "CONTRATO DE ADESÃO - VERYSING",
+        "abertura": [
+            "Pelo presente instrumento particular, de um lado VERYSING DIGITAL LTDA., e de outro lado",
+            "o(a) CONTRATANTE abaixo qualificado(a).",
+        ],
+        "campos": [("nome", "CONTRATANTE: "), ("cpf", "CPF: ")],
+        "corpo": [
+            "O CONTRATANTE adere ao plano {plano}, com os benefícios descritos na plataforma.",
+            "",
+            "O pagamento foi confirmado e a assinatura deste contrato é realizada digitalmente neste ato.",
+        ],
+        "data": "Data: ",
+        "formato_data": "%d/%m/%Y %H:%M:%S",
+        "assinatura": "Assinado digitalmente por VerySing System",
+        "transacao": "Transação ID: ",
+    },
+    "en": {
+        "titulo": "MEMBERSHIP AGREEMENT - VERYSING",
+        "abertura": [
+            "By this private instrument, VERYSING DIGITAL LTDA., on one side, and on the other side",
+            "the CUSTOMER identified below.",
+        ],
+        "campos": [("nome", "CUSTOMER: "), ("cpf", "CPF: ")],
+        "corpo": [
+            "The CUSTOMER subscribes to the {plano} plan, with the benefits described on the platform.",
+            "",
+            "Payment has been confirmed and this agreement is digitally signed at this moment.",
+        ],
+        "data": "Date: ",
+        "formato_data": "%m/%d/%Y %H:%M:%S",
+        "assinatura": "Digitally signed by VerySing System",
+        "transacao": "Transaction ID: ",
+    },
+}
+
+def normalizar_locale(locale):
+    if not locale:
+        return LOCALE_PADRAO
+    if locale in TEXTOS_CONTRATO:
+        return locale
+    idioma = locale.split("-")[0].lower()
+    return next((l for l in TEXTOS_CONTRATO if l.split("-")[0].lower() == idioma), LOCALE_PADRAO)
+
+def formatar_data(locale, quando=None):
+    quando = quando or datetime.datetime.now()
+    return quando.strftime(TEXTOS_CONTRATO[normalizar_locale(locale)]["formato_data"])
+
+# Posição de um campo variável na página do modelo
+Campo = namedtuple("Campo", ["x", "y", "fonte", "tamanho", "largura_max"])
+
+MARGEM = 50
+
+def _escapar_texto_pdf(texto):
+    # String literal PDF em WinAnsi (codificação das fontes padrão do reportlab)
+    dados = texto.encode("cp1252", errors="replace")
+    return dados.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"").replace(b"\n", b" ")
+
+class ModeloContrato:
+    """
+    PDF do modelo já renderizado + posições dos campos. preencher() devolve o
+    contrato final acrescentando só os campos ao final dos bytes do modelo.
+    """
+    def __init__(self, pdf_modelo, indice_pagina, campos):
+        from pypdf import PdfReader
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+        self.pdf = pdf_modelo
+        self.campos = campos
+        leitor = PdfReader(io.BytesIO(pdf_modelo))
+        pagina = leitor.pages[indice_pagina]
+        referencia = pagina.indirect_reference
+
+        # Nome do recurso de cada fonte da página (/Helvetica -> /F1)
+        fontes = pagina["/Resources"]["/Font"]
+        self._recursos_fonte = {str(fontes[nome].get_object()["/BaseFont"])[1:]: str(nome) for nome in fontes}
+        for campo in campos.values():
+            if campo.fonte not in self._recursos_fonte:
+                raise ValueError(f"Fonte {campo.fonte} ausente na página do modelo")
+
+        # Objeto novo (content stream dos campos) e página reescrita apontando para ele
+        self._numero_conteudo = int(leitor.trailer["/Size"])
+        conteudo_original = pagina.raw_get("/Contents")
+        if isinstance(conteudo_original, ArrayObject):
+            conteudos = ArrayObject(list(conteudo_original))
+        else:
+            conteudos = ArrayObject([conteudo_original])
+        conteudos.append(IndirectObject(self._numero_conteudo, 0, None))
+        nova_pagina = DictionaryObject({NameObject(k): pagina.raw_get(k) for k in pagina.keys()})
+        nova_pagina[NameObject("/Contents")] = conteudos
+        saida = io.BytesIO()
+        nova_pagina.write_to_stream(saida)
+        self._numero_pagina = referencia.idnum
+        self._objeto_pagina = (
+            f"{referencia.idnum} {referencia.generation} obj\n".encode() + saida.getvalue() + b"\nendobj\n"
+        )
+        self._geracao_pagina = referencia.generation
+
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(self._numero_conteudo + 1),
+            NameObject("/Root"): leitor.trailer.raw_get("/Root"),
+            NameObject("/Prev"): NumberObject(int(pdf_modelo[pdf_modelo.rindex(b"startxref") + 9:].split()[0])),
+        })
+        for chave in ("/Info", "/ID"):
+            if chave in leitor.trailer:
+                trailer[NameObject(chave)] = leitor.trailer.raw_get(chave)
+        saida = io.BytesIO()
+        trailer.write_to_stream(saida)
+        self._trailer = saida.getvalue()
+
+    def _texto_campo(self, campo, valor):
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+
+        tamanho = campo.tamanho
+        largura = stringWidth(valor, campo.fonte, tamanho)
+        if largura > campo.largura_max:
+            # Reduz a fonte até caber (mínimo 6pt) e, se ainda não couber, corta
+            tamanho = max(6.0, tamanho * campo.largura_max / largura)
+            if stringWidth(valor, campo.fonte, tamanho) > campo.largura_max:
+                while valor and stringWidth(valor + "…", campo.fonte, tamanho) > campo.largura_max:
+                    valor = valor[:-1]
+                valor += "…"
+        return (
+            f"BT /{self._recursos_fonte[campo.fonte][1:]} {tamanho:.2f} Tf 1 0 0 1 {campo.x:.2f} {campo.y:.2f} Tm (".encode()
+            + _escapar_texto_pdf(valor) + b") Tj ET\n"
+        )
+
+    def preencher(self, valores):
+        """valores: {campo: texto}. Campos sem valor ficam em branco."""
+        fluxo = b"q 0 g\n" + b"".join(
+            self._texto_campo(campo, str(valores[nome]))
+            for nome, campo in self.campos.items() if valores.get(nome)
+        ) + b"Q\n"
+
+        partes = [self.pdf, b"\n"]
+        deslocamento = len(self.pdf) + 1
+        offset_pagina = deslocamento
+        partes.append(self._objeto_pagina)
+        deslocamento += len(self._objeto_pagina)
+        objeto_conteudo = (
+            f"{self._numero_conteudo} 0 obj\n<< /Length {len(fluxo)} >>\nstream\n".encode()
+            + fluxo + b"endstream\nendobj\n"
+        )
+        offset_conteudo = deslocamento
+        partes.append(objeto_conteudo)
+        deslocamento += len(objeto_conteudo)
+        partes.append(
+            # Subseção 0 (entrada livre) primeiro: leitores tratam xref sem ela como corrompida
+            f"xref\n0 1\n0000000000 65535 f \n{self._numero_pagina} 1\n{offset_pagina:010d} {self._geracao_pagina:05d} n \n"
+            f"{self._numero_conteudo} 1\n{offset_conteudo:010d} 00000 n \ntrailer\n".encode()
+        )
+        partes.append(self._trailer)
+        partes.append(f"\nstartxref\n{deslocamento}\n%%EOF\n".encode())
+        return b"".join(partes)
+
+def _desenhar_rotulo(c, campos, nome, x, y, rotulo, fonte, tamanho, largura_pagina):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    c.setFont(fonte, tamanho)
+    c.drawString(x, y, rotulo)
+    inicio = x + stringWidth(rotulo, fonte, tamanho)
+    campos[nome] = Campo(inicio, y, fonte, tamanho, largura_pagina - MARGEM - inicio)
+
+def renderizar_contrato_padrao(plano, locale=None):
+    """Contrato de adesão embutido, para um plano e idioma."""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    textos = TEXTOS_CONTRATO[normalizar_locale(locale)]
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    width, height = A4
+    campos = {}
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width / 2, height - 50, textos["titulo"])
+
+    y = height - 100
+    c.setFont("Helvetica", 12)
+    for linha in textos["abertura"]:
+        c.drawString(MARGEM, y, linha)
+        y -= 14.4
+    y -= 14.4
+    for nome, rotulo in textos["campos"]:
+        _desenhar_rotulo(c, campos, nome, MARGEM, y, rotulo, "Helvetica", 12, width)
+        y -= 14.4
+    y -= 14.4
+    c.setFont("Helvetica", 12)
+    for linha in textos["corpo"]:
+        c.drawString(MARGEM, y, linha.format(plano=(plano or "").upper()))
+        y -= 14.4
+    y -= 14.4
+    _desenhar_rotulo(c, campos, "data", MARGEM, y, textos["data"], "Helvetica", 12, width)
+
+    c.setFont("Helvetica-Oblique", 10)
+    c.drawString(MARGEM, height - 300, textos["assinatura"])
+    _desenhar_rotulo(c, campos, "txid", MARGEM, height - 315, textos["transacao"], "Helvetica-Oblique", 10, width)
+
+    c.save()
+    return ModeloContrato(packet.getvalue(), 0, campos)
+
+# --- Modelos da coleção 'modelos' (scripts/initMongo.js) ---
+_BLOCOS_HTML = re.compile(r"<\s*(?:p|div|h[1-6]|li|br)\b[^>]*>|<\s*/\s*(?:p|div|h[1-6]|li)\s*>", re.IGNORECASE)
+_TAG_HTML = re.compile(r"<\s*(/?)\s*(\w+)[^>]*>")
+_INLINE_PERMITIDO = {"b": "b", "strong": "b", "i": "i", "em": "i", "u": "u"}
+_VARIAVEL = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+def versao_modelo(doc):
+    # 'version' (incrementado a cada edição) ou, na falta dele, updatedAt/createdAt
+    for chave in ("version", "versao"):
+        if doc.get(chave) is not None:
+            return str(doc[chave])
+    quando = doc.get("updatedAt") or doc.get("createdAt")
+    return quando.isoformat() if isinstance(quando, datetime.datetime) else str(quando)
+
+def _paragrafos_html(conteudo_html, rotulos):
+    """contentHtml -> parágrafos com a marcação inline que o reportlab entende."""
+    def texto(trecho):
+        trecho = html.escape(html.unescape(trecho), quote=False)
+        # Variáveis no corpo apontam para o quadro de campos (preenchido por requisição)
+        return _VARIAVEL.sub(lambda m: f"<b>{html.escape(rotulos.get(m.group(1), m.group(1)))}</b>", trecho)
+
+    def inline(trecho):
+        # Mantém só as tags inline permitidas; o resto do HTML é descartado
+        partes, posicao = [], 0
+        for m in _TAG_HTML.finditer(trecho):
+            partes.append(texto(trecho[posicao:m.start()]))
+            nome = _INLINE_PERMITIDO.get(m.group(2).lower())
+            if nome:
+                partes.append(f"<{m.group(1)}{nome}>")
+            posicao = m.end()
+        partes.append(texto(trecho[posicao:]))
+        return "".join(partes)
+    return [inline(bloco).strip() for bloco in _BLOCOS_HTML.split(conteudo_html or "") if bloco.strip()]
+
+def renderizar_contrato_modelo(doc, locale=None):
+    """
+    Modelo da coleção 'modelos': título, corpo (contentHtml, com quebra de
+    linha e páginas automáticas) e um quadro com os campos de 'fields', cujos
+    valores são preenchidos por requisição.
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.platypus import Frame, Paragraph
+
+    textos = TEXTOS_CONTRATO[normalizar_locale(locale)]
+    campos_modelo = [f for f in doc.get("fields") or [] if f.get("key")]
+    rotulos = {f["key"]: f.get("label") or f["key"] for f in campos_modelo}
+    estilo = ParagraphStyle("corpo", fontName="Helvetica", fontSize=11, leading=14, spaceAfter=8)
+
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    width, height = A4
+    historia = []
+    for paragrafo in _paragrafos_html(doc.get("contentHtml"), rotulos):
+        try:
+            historia.append(Paragraph(paragrafo, estilo))
+        except ValueError:
+            # Marcação desbalanceada no modelo: usa o texto puro do parágrafo
+            historia.append(Paragraph(html.escape(re.sub(r"<[^>]*>", "", html.unescape(paragrafo)), quote=False), estilo))
+
+    pagina = 0
+    topo = height - 80
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width / 2, height - 50, doc.get("title", ""))
+    while True:
+        quadro = Frame(MARGEM, MARGEM, width - 2 * MARGEM, topo - MARGEM, leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+        quadro.addFromList(historia, c)
+        if not historia:
+            break
+        c.showPage()
+        pagina += 1
+        topo = height - MARGEM
+    y = quadro._y - 20
+
+    # Quadro de campos (+ data e transação) sempre numa página só
+    linhas = [(f["key"], f"{rotulos[f['key']]}: ") for f in campos_modelo if f["key"] not in ("data", "txid")]
+    linhas += [("data", textos["data"]), ("txid", textos["transacao"])]
+    if y - 16 * len(linhas) < MARGEM:
+        c.showPage()
+        pagina += 1
+        y = height - MARGEM
+    campos = {}
+    for nome, rotulo in linhas:
+        _desenhar_rotulo(c, campos, nome, MARGEM, y, rotulo, "Helvetica", 11, width)
+        y -= 16
+    c.setFont("Helvetica-Oblique", 10)
+    c.drawString(MARGEM, y - 10, textos["assinatura"])
+
+    c.save()
+    return ModeloContrato(packet.getvalue(), pagina, campos)
+
+def valores_contrato(dados, locale=None, quando=None):
+    """Valores dos campos a partir da confirmação de pagamento."""
+    return {
+        "nome": dados.nome,
+        "cpf": dados.cpf,
+        "plano": dados.plano.upper(),
+        "email": dados.email or "",
+        "txid": dados.txid,
+        "data": formatar_data(locale, quando),
+    }
+
+PROJECAO_VERSAO_MODELO = {"version": 1, "updatedAt": 1, "createdAt": 1}
+
+class CacheModelosContrato:
+    """
+    Modelos de contrato já renderizados, por (plano, idioma) ou (slug, versão,
+    idioma), guardados num CacheLRU. A cada requisição de um modelo da coleção
+    só a versão é consultada; quando ela muda, a renderização anterior é descartada.
+    """
+    def __init__(self, cache):
+        self._cache = cache
+        self._versoes = {}
+
+    async def obter(self, colecao_modelos, plano, slug=None, locale=None):
+        """Retorna o ModeloContrato, ou None se o slug não existe."""
+        locale = normalizar_locale(locale)
+        if not slug:
+            plano = (plano or "").upper()
+            return await self._cache.obter_assincrono(
+                ("padrao", plano, locale),
+                lambda: asyncio.to_thread(renderizar_contrato_padrao, plano, locale)
+            )
+
+        resumo = await colecao_modelos.find_one({"slug": slug}, projection=PROJECAO_VERSAO_MODELO)
+        if not resumo:
+            return None
+        chave = ("modelo", slug, versao_modelo(resumo), locale)
+        anterior = self._versoes.get((slug, locale))
+        if anterior and anterior != chave:
+            self._cache.remover(anterior)
+        self._versoes[(slug, locale)] = chave
+
+        async def renderizar():
+            doc = await colecao_modelos.find_one({"slug": slug})
+            return await asyncio.to_thread(renderizar_contrato_modelo, doc, locale)
+        return await self._cache.obter_assincrono(chave, renderizar)
+
+    def estatisticas(self):
+        return self._cache.estatisticas()
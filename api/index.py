@@ -1,28 +1,28 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response
 from fastapi.responses import StreamingResponse, RedirectResponse, FileResponse, JSONResponse
 import json
+import asyncio
 import datetime
 from fastapi.middleware.cors import CORSMiddleware
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
 import os
 import base64
 import io
-import qrcode
 import urllib.parse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from pypdf import PdfReader, PdfWriter, PageObject
 import hashlib
-from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field, EmailStr
 from typing import Optional
 from dotenv import load_dotenv
 
 # Importa utils do mesmo diretório
+# (reportlab, qrcode/PIL, cryptography e motor são importados só nas rotas que
+# os usam: login e listagem não pagam esse custo no cold start da Vercel)
 from .pix_utils import gerar_payload_pix
+from .cache_utils import CacheLRU
+from .metricas import RegistroMetricas, CONTENT_TYPE_METRICAS
+from .respostas_http import CACHE_REVALIDAR, etag_confere, etag_forte, leitor_de_bytes, resposta_armazenada, resposta_nao_modificada, resposta_parcial
+from .armazenamento import armazenamento_do_ambiente, ObjetoNaoEncontrado
+from .senhas import gerar_hash_senha, verificar_senha
+from .contratos import CacheModelosContrato, valores_contrato
 
 # Carrega .env se existir (local development)
 load_dotenv()
@@ -31,11 +31,58 @@ MONGODB_URI = os.getenv("MONGODB_URI")
 if not MONGODB_URI:
     print("⚠️ MONGODB_URI não encontrada. O banco não vai funcionar.")
 
-client = AsyncIOMotorClient(MONGODB_URI) if MONGODB_URI else AsyncIOMotorClient()
-db = client.verysing
+# Cliente Mongo criado no primeiro uso e reaproveitado enquanto a instância
+# serverless estiver quente
+_cliente_mongo = None
+_bucket_arquivos = None
+
+def obter_cliente_mongo():
+    global _cliente_mongo
+    if _cliente_mongo is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        _cliente_mongo = AsyncIOMotorClient(MONGODB_URI) if MONGODB_URI else AsyncIOMotorClient()
+    return _cliente_mongo
+
+class _BancoPreguicoso:
+    # db.colecao funciona como antes; o cliente só é criado no primeiro acesso
+    def __getattr__(self, nome):
+        return getattr(obter_cliente_mongo().verysing, nome)
+
+db = _BancoPreguicoso()
+
+# Binários (uploads e contratos) ficam no GridFS, em chunks.
+# Nos documentos do Mongo guardamos só a referência 'arquivo_id'.
+def obter_fs():
+    global _bucket_arquivos
+    if _bucket_arquivos is None:
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        _bucket_arquivos = AsyncIOMotorGridFSBucket(obter_cliente_mongo().verysing, bucket_name="arquivos")
+    return _bucket_arquivos
+
+# Uploads e contratos passam pelo backend de armazenamento (ver armazenamento.py).
+# Na Vercel não há disco persistente: o padrão é o GridFS acima (ARMAZENAMENTO=gridfs);
+# local/fragmentado usam ARMAZENAMENTO_DIR
+armazenamento = armazenamento_do_ambiente(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivos"),
+    obter_bucket=obter_fs,
+    padrao="gridfs"
+)
+
+TAMANHO_CHUNK_UPLOAD = 1024 * 1024
 
 app = FastAPI()
 
+# --- Métricas (formato Prometheus em /metrics) ---
+metricas = RegistroMetricas()
+metrica_listagem = metricas.histograma("verysing_listagem_documentos_segundos", "Duração do GET /api/documentos")
+metrica_pix_qr = metricas.histograma(
+    "verysing_pix_qr_geracao_segundos", "Duração da renderização do QR Code PIX", rotulos=("formato",)
+)
+
+@app.get("/api/metrics")
+async def exportar_metricas():
+    return Response(content=metricas.exportar(), media_type=CONTENT_TYPE_METRICAS)
+
 # Modelo de Dados para Cadastro
 class UsuarioCreate(BaseModel):
     nome: str
@@ -56,18 +103,36 @@ class UsuarioUpdate(BaseModel):
     cargo: Optional[str] = None
     senha: Optional[str] = None
 
+# Só os campos que o login usa
+PROJECAO_LOGIN = {"nome": 1, "email": 1, "tipoPlano": 1, "senhaHash": 1}
+
+def mensagem_usuario_duplicado(erro):
+    # O índice único que falhou (email ou cpf, ver scripts/initMongo.js) diz qual campo repetiu
+    detalhes = erro.details or {}
+    campos = set(detalhes.get("keyPattern") or detalhes.get("keyValue") or {})
+    if "cpf" in campos or (not campos and "cpf" in str(erro)):
+        return "CPF já cadastrado."
+    return "E-mail já cadastrado."
+
 @app.post("/api/login")
 async def login(dados: UsuarioLogin):
-    usuario = await db.usuarios.find_one({"email": dados.email})
+    usuario = await db.usuarios.find_one({"email": dados.email}, PROJECAO_LOGIN)
     
     if not usuario:
         raise HTTPException(status_code=400, detail="E-mail ou senha incorretos.")
     
-    senha_hash = hashlib.sha256(dados.senha.encode()).hexdigest()
+    confere, novo_hash = await verificar_senha(dados.senha, usuario.get("senhaHash"))
     
-    if usuario["senhaHash"] != senha_hash:
+    if not confere:
         raise HTTPException(status_code=400, detail="E-mail ou senha incorretos.")
     
+    if novo_hash:
+        # Hash legado (SHA-256) ou parâmetros antigos: refaz com o KDF atual
+        await db.usuarios.update_one(
+            {"_id": usuario["_id"], "senhaHash": usuario["senhaHash"]},
+            {"$set": {"senhaHash": novo_hash}}
+        )
+    
     return {
         "id": str(usuario["_id"]),
         "nome": usuario["nome"],
@@ -78,13 +143,7 @@ async def login(dados: UsuarioLogin):
 
 @app.post("/api/usuarios")
 async def criar_usuario(usuario: UsuarioCreate):
-    if await db.usuarios.find_one({"email": usuario.email}):
-        raise HTTPException(status_code=400, detail="E-mail já cadastrado.")
-    
-    if await db.usuarios.find_one({"cpf": usuario.cpf}):
-        raise HTTPException(status_code=400, detail="CPF já cadastrado.")
-
-    senha_hash = hashlib.sha256(usuario.senha.encode()).hexdigest()
+    senha_hash = await gerar_hash_senha(usuario.senha)
     
     inicio_trial = None
     fim_trial = None
@@ -109,7 +168,12 @@ async def criar_usuario(usuario: UsuarioCreate):
         "atualizadoEm": datetime.datetime.utcnow()
     }
 
-    resultado = await db.usuarios.insert_one(novo_usuario)
+    # Índices únicos de email e cpf garantem a unicidade: um único round trip
+    from pymongo.errors import DuplicateKeyError
+    try:
+        resultado = await db.usuarios.insert_one(novo_usuario)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=mensagem_usuario_duplicado(e))
     
     return {
         "id": str(resultado.inserted_id),
@@ -128,14 +192,18 @@ async def atualizar_usuario(user_id: str, dados: UsuarioUpdate):
     update_data = {k: v for k, v in dados.dict().items() if v is not None}
     
     if "senha" in update_data:
-         update_data["senhaHash"] = hashlib.sha256(update_data.pop("senha").encode()).hexdigest()
+         update_data["senhaHash"] = await gerar_hash_senha(update_data.pop("senha"))
          
     if not update_data:
         return {"mensagem": "Nada para atualizar"}
         
     update_data["atualizadoEm"] = datetime.datetime.utcnow()
     
-    result = await db.usuarios.update_one({"_id": obj_id}, {"$set": update_data})
+    from pymongo.errors import DuplicateKeyError
+    try:
+        result = await db.usuarios.update_one({"_id": obj_id}, {"$set": update_data})
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=mensagem_usuario_duplicado(e))
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -148,11 +216,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Proximo-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 CAMINHO_CHAVE_PRIVADA = "chave_privada_assinatura.pem"
 
 def carregar_chave_privada():
+    from cryptography.hazmat.primitives import serialization
+    
     # 1. Tenta carregar da variável de ambiente (Produção/Vercel)
     private_key_env = os.getenv("PRIVATE_KEY_PEM")
     if private_key_env:
@@ -176,6 +247,11 @@ def carregar_chave_privada():
     return None
 
 def gerar_carimbo_pdf(hash_doc, link_validacao, width, height):
+    import qrcode
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    
     packet = io.BytesIO()
     c = canvas.Canvas(packet, pagesize=(width, height))
     
@@ -236,46 +312,111 @@ class ConfirmacaoPagamento(BaseModel):
     cpf: str
     plano: str
     email: Optional[str] = None
+    modelo: Optional[str] = None  # slug da coleção 'modelos'; sem ele, o contrato de adesão padrão
+    locale: Optional[str] = None
+
+# Contratos já renderizados (o corpo estático), por plano/modelo e idioma
+_cache_modelos_contrato = CacheModelosContrato(CacheLRU(int(os.getenv("CONTRATOS_CACHE_MAX", "64"))))
 
 from bson import ObjectId
 
 # --- Gestão de Documentos ---
 
+# Listagem: só os campos exibidos (nunca os binários), do mais recente para o mais antigo.
+# documentos usa o índice {ownerEmail: 1, createdAt: -1, _id: -1} e contratos
+# {email: 1, criado_em: -1, _id: -1} (ver scripts/initMongo.js): a ordenação da página sai do índice.
+# Documentos ainda não migrados por api/migrar_gridfs.py têm email_usuario/criado_em
+# no lugar de ownerEmail/createdAt: entram como uma terceira fonte da mesma página.
+PROJECAO_DOCUMENTOS = {"nome_arquivo": 1, "createdAt": 1, "tamanho": 1, "tipo": 1, "categoria": 1, "pasta_id": 1}
+PROJECAO_DOCUMENTOS_LEGADO = {"nome_arquivo": 1, "criado_em": 1, "tamanho": 1, "tipo": 1, "categoria": 1, "pasta_id": 1}
+PROJECAO_CONTRATOS = {"nome_arquivo": 1, "criado_em": 1}
+LIMITE_LISTAGEM_PADRAO = 100
+LIMITE_LISTAGEM_MAX = 500
+
+def codificar_cursor(data, obj_id):
+    # Itens sem data (vêm por último) têm o cursor com a data vazia
+    bruto = f"{data.isoformat() if data else ''}|{obj_id}"
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        data_iso, obj_id = bruto.split("|", 1)
+        return (datetime.datetime.fromisoformat(data_iso) if data_iso else None), ObjectId(obj_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def filtro_pagina(filtro, campo_data, cursor):
+    # Keyset pagination: itens estritamente "depois" do cursor na ordem (data desc, _id desc).
+    # Na ordenação do Mongo os itens sem data ({campo: None}) vêm depois de todos os datados.
+    if not cursor:
+        return filtro
+    data, obj_id = cursor
+    if data is None:
+        return {**filtro, campo_data: None, "_id": {"$lt": obj_id}}
+    return {
+        **filtro,
+        "$or": [
+            {campo_data: {"$lt": data}},
+            {campo_data: data, "_id": {"$lt": obj_id}},
+            {campo_data: None}
+        ]
+    }
+
+async def buscar_pagina(colecao, filtro, campo_data, projecao, cursor, limite):
+    consulta = colecao.find(filtro_pagina(filtro, campo_data, cursor), projection=projecao)
+    consulta = consulta.sort([(campo_data, -1), ("_id", -1)]).limit(limite)
+    return await consulta.to_list(length=limite)
+
 @app.get("/api/documentos")
-async def listar_documentos(email: str):
-    # Busca documentos enviados pelo usuário
-    docs_cursor = db.documentos.find({"email_usuario": email})
-    docs = await docs_cursor.to_list(length=100)
+async def listar_documentos(email: str, response: Response, limite: int = LIMITE_LISTAGEM_PADRAO, cursor: Optional[str] = None):
+    limite = max(1, min(limite, LIMITE_LISTAGEM_MAX))
+    posicao = decodificar_cursor(cursor) if cursor else None
+    
+    # Busca documentos enviados e contratos gerados (pagamentos) em paralelo
+    with metrica_listagem.medir():
+        docs, docs_legado, contratos = await asyncio.gather(
+            buscar_pagina(db.documentos, {"ownerEmail": email}, "createdAt", PROJECAO_DOCUMENTOS, posicao, limite + 1),
+            buscar_pagina(db.documentos, {"email_usuario": email}, "criado_em", PROJECAO_DOCUMENTOS_LEGADO, posicao, limite + 1),
+            buscar_pagina(db.contratos, {"email": email}, "criado_em", PROJECAO_CONTRATOS, posicao, limite + 1)
+        )
     
-    # Busca contratos gerados (pagamentos) vinculados ao email
-    contratos_cursor = db.contratos.find({"email": email})
-    contratos = await contratos_cursor.to_list(length=100)
+    itens = []
     
-    resultado = []
-    
-    # Formata Documentos Uploaded
-    for d in docs:
-        resultado.append({
+    # Formata Documentos Uploaded (campos novos e, antes da migração, os antigos)
+    for d in docs + docs_legado:
+        itens.append((d.get("createdAt", d.get("criado_em")), d["_id"], {
             "id": str(d["_id"]),
             "name": d["nome_arquivo"],
-            "date": d["criado_em"].strftime("%d/%m/%Y") if isinstance(d.get("criado_em"), datetime.datetime) else "N/A",
             "size": d.get("tamanho", "0 MB"),
             "type": d.get("tipo", "doc"),
             "category": d.get("categoria", "Geral"),
             "folderId": d.get("pasta_id")
-        })
+        }))
         
     # Formata Contratos Gerados
     for c in contratos:
-        resultado.append({
+        itens.append((c.get("criado_em"), c["_id"], {
             "id": str(c["_id"]),
             "name": c.get("nome_arquivo", "Contrato.pdf"),
-            "date": c["criado_em"].strftime("%d/%m/%Y") if isinstance(c.get("criado_em"), datetime.datetime) else "N/A",
             "size": "PDF",
             "type": "pdf",
             "category": "Contrato",
             "folderId": None
-        })
+        }))
+    
+    # Intercala as fontes pela data (mais recente primeiro)
+    itens.sort(key=lambda item: (item[0] or datetime.datetime.min, item[1]), reverse=True)
+    
+    resultado = []
+    for data, _, item in itens[:limite]:
+        item["date"] = data.strftime("%d/%m/%Y") if isinstance(data, datetime.datetime) else "N/A"
+        resultado.append(item)
+    
+    # Próxima página vai no header para manter o corpo como lista
+    if len(itens) > limite:
+        data, obj_id, _ = itens[limite - 1]
+        response.headers["X-Proximo-Cursor"] = codificar_cursor(data, obj_id)
         
     return resultado
 
@@ -288,21 +429,36 @@ async def upload_documento(
     assunto: Optional[str] = Form(None),
     mensagem: Optional[str] = Form(None)
 ):
-    contents = await file.read()
-    size_mb = len(contents) / (1024 * 1024)
+    # Grava o upload no armazenamento em blocos, sem carregar o arquivo inteiro na memória
+    doc_id = ObjectId()
+    chave = f"documentos/{doc_id}"
+    
+    async def blocos_upload():
+        while True:
+            chunk = await file.read(TAMANHO_CHUNK_UPLOAD)
+            if not chunk:
+                break
+            yield chunk
+    
+    tamanho_bytes = await armazenamento.gravar(chave, blocos_upload())
+    
+    size_mb = tamanho_bytes / (1024 * 1024)
     size_str = f"{size_mb:.1f} MB"
     
     doc = {
+        "_id": doc_id,
         "nome_arquivo": file.filename,
-        "conteudo": contents,
-        "email_usuario": email,
+        "arquivo_chave": chave, # Referência no armazenamento
+        "content_type": file.content_type,
+        "ownerEmail": email,
         "tamanho": size_str,
+        "tamanho_bytes": tamanho_bytes,
         "tipo": file.filename.split('.')[-1].lower() if '.' in file.filename else 'unknown',
         "categoria": categoria,
         "destinatarios": destinatarios,
         "assunto": assunto,
         "mensagem": mensagem,
-        "criado_em": datetime.datetime.utcnow(),
+        "createdAt": datetime.datetime.utcnow(),
         "pasta_id": None
     }
     
@@ -312,7 +468,7 @@ async def upload_documento(
         "id": str(result.inserted_id), 
         "mensagem": "Upload realizado com sucesso",
         "name": doc["nome_arquivo"],
-        "date": doc["criado_em"].strftime("%d/%m/%Y"),
+        "date": doc["createdAt"].strftime("%d/%m/%Y"),
         "size": size_str,
         "type": doc["tipo"],
         "category": categoria
@@ -322,27 +478,102 @@ async def upload_documento(
 async def deletar_documento(doc_id: str):
     try:
         # Tenta deletar de documentos
-        res = await db.documentos.delete_one({"_id": ObjectId(doc_id)})
-        if res.deleted_count > 0:
+        doc = await db.documentos.find_one({"_id": ObjectId(doc_id)}, projection=PROJECAO_ARQUIVO)
+        if doc:
+            await registrar_remocao("documento", doc)
+            await db.documentos.delete_one({"_id": doc["_id"]})
+            await remover_arquivo(doc)
             return {"mensagem": "Documento removido"}
             
         # Tenta deletar de contratos
-        res = await db.contratos.delete_one({"_id": ObjectId(doc_id)})
-        if res.deleted_count > 0:
+        contrato = await db.contratos.find_one({"_id": ObjectId(doc_id)}, projection=PROJECAO_ARQUIVO)
+        if contrato:
+            await registrar_remocao("contrato", contrato)
+            await db.contratos.delete_one({"_id": contrato["_id"]})
+            await remover_arquivo(contrato)
             return {"mensagem": "Contrato removido"}
             
         raise HTTPException(status_code=404, detail="Documento não encontrado")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Referência do binário: 'arquivo_chave' (armazenamento) ou 'arquivo_id' (GridFS, registros anteriores);
+# hash/nome_arquivo identificam os arquivos no armazenamento do servidor (lápide)
+PROJECAO_ARQUIVO = {"arquivo_chave": 1, "arquivo_id": 1, "hash": 1, "nome_arquivo": 1}
+
+async def registrar_remocao(tipo, doc):
+    # Lápide para o varredor do servidor (servidor/varredor_armazenamento.py): os
+    # arquivos de assinados e contratos ficam no armazenamento do servidor, não
+    # no desta API. Gravada antes de apagar o registro; sem ela o varredor o recriaria.
+    identificador = doc.get("hash") if tipo == "documento" else doc.get("nome_arquivo")
+    if identificador:
+        await db.documentos_removidos.insert_one({
+            "tipo": tipo,
+            "hash": doc.get("hash"),
+            "nome_arquivo": doc.get("nome_arquivo"),
+            "removido_em": datetime.datetime.utcnow()
+        })
+
+async def remover_arquivo(doc):
+    try:
+        if doc.get("arquivo_chave"):
+            await armazenamento.remover(doc["arquivo_chave"])
+        elif doc.get("arquivo_id"):
+            await obter_fs().delete(doc["arquivo_id"])
+    except Exception as e:
+        print(f"⚠️ Erro ao remover arquivo do armazenamento (não crítico): {e}")
+
+def leitor_gridfs(grid_out):
+    # Lê [inicio, inicio + quantidade) do GridFS chunk a chunk (memória constante),
+    # para respostas inteiras ou com Range
+    async def ler_faixa(inicio, quantidade):
+        grid_out.seek(inicio)
+        restante = quantidade
+        while restante > 0:
+            chunk = await grid_out.read(min(restante, grid_out.chunk_size))
+            if not chunk:
+                break
+            restante -= len(chunk)
+            yield chunk
+    return ler_faixa
+
 # --- Fim Gestão de Documentos ---
 
+# Dados do recebedor PIX
+# IMPORTANTE: Coloque sua chave PIX real aqui para receber de verdade!
+CHAVE_PIX = os.getenv("CHAVE_PIX", "00000000000") # SUBSTITUA POR SUA CHAVE PIX
+NOME_RECEBEDOR = "VerySing Digital"
+CIDADE_RECEBEDOR = "Sao Paulo"
+
+# Imagens de QR Code já renderizadas, por (payload, formato)
+_cache_qr_pix = CacheLRU(int(os.getenv("PIX_QR_CACHE_MAX", "256")))
+FORMATOS_QR_PIX = {"png": "image/png", "svg": "image/svg+xml"}
+
+def renderizar_qr_pix(payload_pix, formato):
+    import qrcode
+    
+    if formato == "svg":
+        import qrcode.image.svg
+        img_qr = qrcode.make(payload_pix, image_factory=qrcode.image.svg.SvgPathImage, box_size=10, border=2)
+        buffered = io.BytesIO()
+        img_qr.save(buffered)
+        return buffered.getvalue()
+
+    qr = qrcode.QRCode(box_size=10, border=2)
+    qr.add_data(payload_pix)
+    qr.make(fit=True)
+    img_qr = qr.make_image(fill_color="black", back_color="white")
+    
+    buffered = io.BytesIO()
+    img_qr.save(buffered, format="PNG")
+    return buffered.getvalue()
+
 @app.post("/api/pagamento/pix")
 async def criar_pagamento_pix(dados: DadosPagamento):
-    txid = uuid.uuid4().hex[:20]
-    CHAVE_PIX = "00000000000" # Configure via ENV em produção
-    NOME_RECEBEDOR = "VerySing Digital"
-    CIDADE_RECEBEDOR = "Sao Paulo"
+    # Gera um ID de transação único
+    txid = uuid.uuid4().hex[:20] # Limite do PIX é muitas vezes 25 chars, mas vamos manter seguro
     
     payload_pix = gerar_payload_pix(
         chave=CHAVE_PIX,
@@ -352,59 +583,54 @@ async def criar_pagamento_pix(dados: DadosPagamento):
         txid=txid
     )
     
-    qr = qrcode.QRCode(box_size=10, border=2)
-    qr.add_data(payload_pix)
-    qr.make(fit=True)
-    img_qr = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img_qr.save(buffered, format="PNG")
-    qr_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
+    # A imagem do QR Code é servida (e cacheada) pela rota GET abaixo
     return {
         "txid": txid,
         "payload_pix": payload_pix,
-        "qr_code_base64": qr_base64,
+        "qr_code_url": f"/api/pagamento/pix/{txid}/qr.png?valor={dados.valor:.2f}",
         "valor": dados.valor
     }
 
-@app.post("/api/pagamento/confirmar")
-async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
-    # Gera o PDF do Contrato
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=A4)
-    width, height = A4
-    
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width/2, height - 50, "CONTRATO DE ADESÃO - VERYSING")
-    
-    c.setFont("Helvetica", 12)
-    texto = f"""
-    Pelo presente instrumento particular, de um lado VERYSING DIGITAL LTDA., e de outro lado
-    {dados.nome}, portador(a) do CPF {dados.cpf}, doravante denominado(a) CONTRATANTE.
-    
-    O CONTRATANTE adere ao plano {dados.plano.upper()}, com os benefícios descritos na plataforma.
-    
-    O pagamento foi confirmado e a assinatura deste contrato é realizada digitalmente neste ato.
-    
-    Data: {datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
-    """
+@app.get("/api/pagamento/pix/{txid}/qr.{formato}")
+async def imagem_qr_pix(txid: str, formato: str, valor: float, request: Request):
+    if formato not in FORMATOS_QR_PIX:
+        raise HTTPException(status_code=404, detail="Formato não suportado")
+    if not txid.isalnum() or len(txid) > 25 or valor <= 0:
+        raise HTTPException(status_code=400, detail="Cobrança inválida")
+    
+    # O payload é determinístico (recebedor + valor + txid): mesma URL, mesma imagem
+    payload_pix = gerar_payload_pix(
+        chave=CHAVE_PIX,
+        nome=NOME_RECEBEDOR,
+        cidade=CIDADE_RECEBEDOR,
+        valor=valor,
+        txid=txid
+    )
+    etag = '"' + hashlib.sha256(f"{formato}:{payload_pix}".encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
     
-    text_object = c.beginText(50, height - 100)
-    for line in texto.split("\n"):
-        text_object.textLine(line)
-    c.drawText(text_object)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
     
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawString(50, height - 300, f"Assinado digitalmente por VerySing System")
-    c.drawString(50, height - 315, f"Transação ID: {dados.txid}")
+    def gerar():
+        with metrica_pix_qr.medir(formato=formato):
+            return renderizar_qr_pix(payload_pix, formato)
     
-    c.save()
-    packet.seek(0)
-    pdf_bytes = packet.read()
+    imagem = _cache_qr_pix.obter((payload_pix, formato), gerar)
+    return Response(content=imagem, media_type=FORMATOS_QR_PIX[formato], headers=headers)
+
+@app.post("/api/pagamento/confirmar")
+async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
+    # Gera o PDF do Contrato: modelo estático em cache + campos do pagamento
+    modelo = await _cache_modelos_contrato.obter(db.modelos, dados.plano, dados.modelo, dados.locale)
+    if modelo is None:
+        raise HTTPException(status_code=404, detail="Modelo de contrato não encontrado")
+    pdf_contrato = modelo.preencher(valores_contrato(dados, dados.locale))
     
-    # Salva no MongoDB (Binary)
+    # Salva o PDF no armazenamento e só a referência no contrato
     nome_arquivo = f"contrato_{dados.txid}.pdf"
+    chave = f"contratos/{nome_arquivo}"
+    await armazenamento.gravar(chave, pdf_contrato)
     
     await db.contratos.insert_one({
         "txid": dados.txid,
@@ -412,7 +638,7 @@ async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
         "cpf": dados.cpf,
         "email": dados.email, # Salva o email para vincular ao usuário
         "nome_arquivo": nome_arquivo,
-        "conteudo_pdf": pdf_bytes, # Salva o binário do PDF
+        "arquivo_chave": chave, # Referência do PDF no armazenamento
         "criado_em": datetime.datetime.utcnow()
     })
     
@@ -423,16 +649,37 @@ async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
     }
 
 @app.get("/download/{nome_arquivo}")
-async def download_arquivo(nome_arquivo: str):
-    # Busca no MongoDB
-    contrato = await db.contratos.find_one({"nome_arquivo": nome_arquivo})
-    
-    if contrato and "conteudo_pdf" in contrato:
-        pdf_stream = io.BytesIO(contrato["conteudo_pdf"])
-        return StreamingResponse(
-            pdf_stream, 
-            media_type='application/pdf', 
-            headers={"Content-Disposition": f"attachment; filename={nome_arquivo}"}
+async def download_arquivo(nome_arquivo: str, request: Request):
+    # Busca no MongoDB (sem trazer binários legados desnecessariamente)
+    contrato = await db.contratos.find_one({"nome_arquivo": nome_arquivo}, projection=PROJECAO_ARQUIVO)
+    headers = {"Content-Disposition": f"attachment; filename={nome_arquivo}"}
+    # O mesmo nome pode passar a apontar para outro conteúdo (txid confirmado de novo): revalida sempre
+    
+    if contrato and contrato.get("arquivo_chave"):
+        try:
+            info = await armazenamento.info(contrato["arquivo_chave"])
+        except ObjetoNaoEncontrado:
+            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+        # A versão muda a cada regravação da chave: serve de ETag forte
+        return await resposta_armazenada(
+            request, armazenamento, contrato["arquivo_chave"], etag_forte(info.versao), info=info, headers=headers, cache=CACHE_REVALIDAR
         )
+    
+    # Contratos gravados direto no GridFS, antes da camada de armazenamento
+    if contrato and contrato.get("arquivo_id"):
+        # Arquivo do GridFS nunca é alterado: o id serve de ETag forte
+        etag = etag_forte(contrato["arquivo_id"])
+        if etag_confere(request.headers.get("if-none-match"), etag):
+            return resposta_nao_modificada(etag, CACHE_REVALIDAR)
+        grid_out = await obter_fs().open_download_stream(contrato["arquivo_id"])
+        return resposta_parcial(request, grid_out.length, etag, leitor_gridfs(grid_out), headers=headers, cache=CACHE_REVALIDAR)
+    
+    # Contratos antigos, ainda com o binário inline (antes da migração)
+    if contrato:
+        legado = await db.contratos.find_one({"_id": contrato["_id"]}, projection={"conteudo_pdf": 1})
+        if legado and "conteudo_pdf" in legado:
+            conteudo = bytes(legado["conteudo_pdf"])
+            etag = etag_forte(hashlib.sha256(conteudo).hexdigest())
+            return resposta_parcial(request, len(conteudo), etag, leitor_de_bytes(conteudo), headers=headers, cache=CACHE_REVALIDAR)
         
-    raise HTTPException(status_code=404, detail="Arquivo não encontrado")
\ No newline at end of file
+    raise HTTPException(status_code=404, detail="Arquivo não encontrado")
@@ -0,0 +1,150 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets de latência (segundos), no estilo do cliente Prometheus
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+def _formatar_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rótulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(rotulos[n] for n in self.rotulos)
+
+    def _cabecalho(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exportar(self):
+        linhas = self._cabecalho()
+        with self._lock:
+            for chave, valor in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = self._valores[chave] = {"buckets": [0] * len(self.buckets), "soma": 0.0, "total": 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["buckets"][i] += 1
+                    break
+            serie["soma"] += valor
+            serie["total"] += 1
+
+    @contextmanager
+    def medir(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def exportar(self):
+        linhas = self._cabecalho()
+        with self._lock:
+            for chave, serie in sorted(self._valores.items()):
+                acumulado = 0
+                for limite, quantidade in zip(self.buckets, serie["buckets"]):
+                    acumulado += quantidade
+                    rotulos = _formatar_rotulos(self.rotulos, chave, ("le", _formatar_numero(limite)))
+                    linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+                rotulos = _formatar_rotulos(self.rotulos, chave)
+                linhas.append(f"{self.nome}_sum{rotulos} {_formatar_numero(serie['soma'])}")
+                linhas.append(f"{self.nome}_count{rotulos} {serie['total']}")
+        return linhas
+
+class Medidor(_Metrica):
+    """Gauge lido na hora da exportação. funcao() retorna um número ou {valor_rotulo: número}."""
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, funcao, rotulo=None):
+        super().__init__(nome, ajuda, (rotulo,) if rotulo else ())
+        self.funcao = funcao
+
+    def exportar(self):
+        linhas = self._cabecalho()
+        try:
+            valor = self.funcao()
+        except Exception:
+            return linhas
+        if isinstance(valor, dict):
+            for rotulo, v in sorted(valor.items()):
+                linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, (rotulo,))} {_formatar_numero(v)}")
+        else:
+            linhas.append(f"{self.nome} {_formatar_numero(valor)}")
+        return linhas
+
+class RegistroMetricas:
+    """Registro de métricas do processo, exportado no formato texto do Prometheus."""
+    def __init__(self):
+        self._metricas = {}
+
+    def _registrar(self, metrica):
+        if metrica.nome in self._metricas:
+            raise ValueError(f"Métrica já registrada: {metrica.nome}")
+        self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome, ajuda, funcao, rotulo=None):
+        return self._registrar(Medidor(nome, ajuda, funcao, rotulo))
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas.values():
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+# Tipo de conteúdo do formato texto do Prometheus
+CONTENT_TYPE_METRICAS = "text/plain; version=0.0.4; charset=utf-8"
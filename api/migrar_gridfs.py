@@ -0,0 +1,75 @@
+"""
+Migração única: move os binários inline ('conteudo' em documentos e
+'conteudo_pdf' em contratos) para o GridFS, deixando só 'arquivo_id'.
+Também renomeia os campos antigos de documentos (email_usuario/criado_em)
+para ownerEmail/createdAt, usados pelo índice da listagem.
+
+Uso: python -m api.migrar_gridfs
+
+Pode ser executada mais de uma vez; só processa registros ainda não migrados.
+"""
+import asyncio
+import io
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from dotenv import load_dotenv
+
+# (coleção, campo do binário, campo do e-mail)
+COLECOES = [
+    ("documentos", "conteudo", "ownerEmail"),
+    ("contratos", "conteudo_pdf", "email"),
+]
+
+async def migrar_colecao(db, fs, colecao, campo_binario, campo_email):
+    migrados = 0
+    bytes_movidos = 0
+    filtro = {campo_binario: {"$exists": True}, "arquivo_id": {"$exists": False}}
+
+    # Só o _id no cursor; o binário é buscado um registro por vez
+    async for ref in db[colecao].find(filtro, projection={"_id": 1}):
+        registro = await db[colecao].find_one(
+            {"_id": ref["_id"]},
+            projection={campo_binario: 1, "nome_arquivo": 1, campo_email: 1}
+        )
+        if not registro or campo_binario not in registro:
+            continue
+
+        conteudo = registro[campo_binario]
+        arquivo_id = await fs.upload_from_stream(
+            registro.get("nome_arquivo") or str(registro["_id"]),
+            io.BytesIO(conteudo),
+            metadata={"email_usuario": registro.get(campo_email), "migrado_de": colecao}
+        )
+        await db[colecao].update_one(
+            {"_id": registro["_id"]},
+            {"$set": {"arquivo_id": arquivo_id, "tamanho_bytes": len(conteudo)}, "$unset": {campo_binario: ""}}
+        )
+        migrados += 1
+        bytes_movidos += len(conteudo)
+
+    print(f"✅ {colecao}: {migrados} registros migrados ({bytes_movidos / (1024 * 1024):.1f} MB)")
+    return migrados
+
+async def normalizar_campos_documentos(db):
+    resultado = await db.documentos.update_many(
+        {"email_usuario": {"$exists": True}},
+        {"$rename": {"email_usuario": "ownerEmail", "criado_em": "createdAt"}}
+    )
+    print(f"✅ documentos: {resultado.modified_count} registros com campos renomeados")
+
+async def main():
+    load_dotenv()
+    uri = os.getenv("MONGODB_URI")
+    client = AsyncIOMotorClient(uri) if uri else AsyncIOMotorClient()
+    db = client.verysing
+    fs = AsyncIOMotorGridFSBucket(db, bucket_name="arquivos")
+    try:
+        await normalizar_campos_documentos(db)
+        for colecao, campo_binario, campo_email in COLECOES:
+            await migrar_colecao(db, fs, colecao, campo_binario, campo_email)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import re
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Conteúdo guardado sob um id nunca muda: navegadores e CDNs podem guardar por 1 ano
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+# URLs cujo conteúdo pode ser regravado (ex.: /download/contrato_<txid>.pdf): sempre revalida pelo ETag
+CACHE_REVALIDAR = "no-cache"
+TAMANHO_CHUNK_RESPOSTA = 256 * 1024
+
+_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+
+class FaixaInvalida(ValueError):
+    """Range fora do tamanho do conteúdo (responder 416)."""
+    pass
+
+def etag_forte(identificador):
+    return f'"{identificador}"'
+
+def etag_confere(if_none_match, etag):
+    # If-None-Match usa comparação fraca: W/"x" também confere com "x"
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    alvo = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == alvo for candidato in if_none_match.split(","))
+
+def cabecalhos_cache(etag, extras=None, cache=CACHE_IMUTAVEL):
+    cabecalhos = {"ETag": etag, "Cache-Control": cache, "Accept-Ranges": "bytes"}
+    if extras:
+        cabecalhos.update(extras)
+    return cabecalhos
+
+def resposta_nao_modificada(etag, cache=CACHE_IMUTAVEL):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache})
+
+def interpretar_range(cabecalho, tamanho):
+    """
+    Retorna (inicio, fim) inclusivos para um Range de faixa única, ou None para
+    responder o conteúdo inteiro (sem Range, múltiplas faixas ou sintaxe inválida).
+    Lança FaixaInvalida se a faixa começa depois do fim do conteúdo.
+    """
+    if not cabecalho:
+        return None
+    encontrado = _RANGE.match(cabecalho)
+    if not encontrado:
+        return None
+    inicio, fim = encontrado.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # Sufixo: os últimos N bytes
+        quantidade = int(fim)
+        if quantidade == 0:
+            raise FaixaInvalida(cabecalho)
+        return max(0, tamanho - quantidade), tamanho - 1
+    inicio = int(inicio)
+    if inicio >= tamanho:
+        raise FaixaInvalida(cabecalho)
+    fim = int(fim) if fim else tamanho - 1
+    if inicio > fim:
+        return None
+    return inicio, min(fim, tamanho - 1)
+
+def resposta_arquivo(request, caminho, etag, media_type="application/pdf", filename=None, headers=None, cache=CACHE_IMUTAVEL):
+    """
+    FileResponse com ETag forte, Cache-Control `cache` (padrão: imutável) e
+    If-None-Match -> 304. Range/If-Range (206) ficam com o FileResponse, que usa o nosso ETag.
+    """
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return resposta_nao_modificada(etag, cache)
+    return FileResponse(caminho, media_type=media_type, filename=filename, headers=cabecalhos_cache(etag, headers, cache))
+
+def resposta_parcial(request, tamanho, etag, ler_faixa, media_type="application/pdf", headers=None, cache=CACHE_IMUTAVEL):
+    """
+    Resposta com Range/206 para conteúdo fora do disco (GridFS, bytes em memória).
+    ler_faixa(inicio, quantidade) devolve um iterador assíncrono de bytes.
+    """
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return resposta_nao_modificada(etag, cache)
+    cabecalhos = cabecalhos_cache(etag, headers, cache)
+
+    faixa = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            faixa = interpretar_range(request.headers.get("range"), tamanho)
+        except FaixaInvalida:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{tamanho}"})
+
+    if faixa is None:
+        cabecalhos["Content-Length"] = str(tamanho)
+        return StreamingResponse(ler_faixa(0, tamanho), media_type=media_type, headers=cabecalhos)
+
+    inicio, fim = faixa
+    cabecalhos["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+    cabecalhos["Content-Length"] = str(fim - inicio + 1)
+    return StreamingResponse(ler_faixa(inicio, fim - inicio + 1), status_code=206, media_type=media_type, headers=cabecalhos)
+
+async def resposta_armazenada(request, armazenamento, chave, etag, info=None, media_type="application/pdf", filename=None, headers=None, cache=CACHE_IMUTAVEL):
+    """
+    Serve uma chave de um backend de armazenamento (ver armazenamento.py).
+    Backends em disco vão pelo FileResponse (sendfile/pathsend quando o servidor
+    ASGI suporta); os demais são lidos em faixas, com Range/206.
+    """
+    caminho = armazenamento.caminho_local(chave)
+    if caminho is not None:
+        return resposta_arquivo(request, caminho, etag, media_type=media_type, filename=filename, headers=headers, cache=cache)
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return resposta_nao_modificada(etag, cache)
+    if info is None:
+        info = await armazenamento.info(chave)
+    if filename:
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})}
+    def ler_faixa(inicio, quantidade):
+        return armazenamento.ler_faixa(chave, inicio, quantidade)
+    return resposta_parcial(request, info.tamanho, etag, ler_faixa, media_type=media_type, headers=headers, cache=cache)
+
+def leitor_de_bytes(dados):
+    async def ler_faixa(inicio, quantidade):
+        for posicao in range(inicio, inicio + quantidade, TAMANHO_CHUNK_RESPOSTA):
+            yield dados[posicao:min(posicao + TAMANHO_CHUNK_RESPOSTA, inicio + quantidade)]
+    return ler_faixa
@@ -0,0 +1,111 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Hashes no formato "<kdf>$<parâmetros>$<sal>$<hash>". Hashes antigos (SHA-256
+# hex sem sal) continuam aceitos e são refeitos com o KDF atual no login.
+
+class KdfScrypt:
+    """scrypt (memory-hard) da hashlib. Memória por hash: 128 * r * n bytes."""
+    nome = "scrypt"
+
+    def __init__(self, n=2 ** 14, r=8, p=1, tamanho=32):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.tamanho = tamanho
+
+    def _derivar(self, senha, sal, n, r, p, tamanho):
+        return hashlib.scrypt(
+            senha.encode("utf-8"), salt=sal, n=n, r=r, p=p, dklen=tamanho,
+            maxmem=128 * r * n + 1024 * 1024
+        )
+
+    def gerar(self, senha):
+        sal = os.urandom(16)
+        derivado = self._derivar(senha, sal, self.n, self.r, self.p, self.tamanho)
+        return "$".join([
+            self.nome, f"{self.n},{self.r},{self.p}",
+            base64.b64encode(sal).decode(), base64.b64encode(derivado).decode()
+        ])
+
+    def _ler(self, armazenado):
+        _, parametros, sal, derivado = armazenado.split("$")
+        n, r, p = (int(v) for v in parametros.split(","))
+        return n, r, p, base64.b64decode(sal), base64.b64decode(derivado)
+
+    def verificar(self, senha, armazenado):
+        n, r, p, sal, derivado = self._ler(armazenado)
+        return hmac.compare_digest(self._derivar(senha, sal, n, r, p, len(derivado)), derivado)
+
+    def precisa_rehash(self, armazenado):
+        n, r, p, _, derivado = self._ler(armazenado)
+        return (n, r, p, len(derivado)) != (self.n, self.r, self.p, self.tamanho)
+
+class KdfSha256Legado:
+    """SHA-256 sem sal usado antes do KDF: só verificação, nunca para hashes novos."""
+    nome = "sha256"
+
+    def verificar(self, senha, armazenado):
+        return hmac.compare_digest(hashlib.sha256(senha.encode()).hexdigest(), armazenado)
+
+    def precisa_rehash(self, armazenado):
+        return True
+
+# KDFs disponíveis por nome (prefixo do hash armazenado)
+KDFS = {"scrypt": KdfScrypt}
+
+def registrar_kdf(classe):
+    KDFS[classe.nome] = classe
+
+def kdf_do_ambiente():
+    nome = os.getenv("SENHA_KDF", "scrypt")
+    if nome == "scrypt":
+        return KdfScrypt(
+            n=int(os.getenv("SENHA_SCRYPT_N", str(2 ** 14))),
+            r=int(os.getenv("SENHA_SCRYPT_R", "8")),
+            p=int(os.getenv("SENHA_SCRYPT_P", "1"))
+        )
+    return KDFS[nome]()
+
+kdf_atual = kdf_do_ambiente()
+
+# Pool próprio e limitado: o hash é lento de propósito (e usa memória), então
+# roda fora do event loop sem ocupar o executor padrão
+_executor_senhas = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SENHA_WORKERS", "4")), thread_name_prefix="senhas"
+)
+
+def _kdf_do_hash(armazenado):
+    if "$" not in armazenado:
+        return KdfSha256Legado()
+    nome = armazenado.split("$", 1)[0]
+    if nome == kdf_atual.nome:
+        return kdf_atual
+    return KDFS[nome]()
+
+def verificar_senha_sync(senha, armazenado):
+    """Retorna (confere, novo_hash). novo_hash vem preenchido quando o hash deve ser refeito."""
+    if not armazenado:
+        return False, None
+    try:
+        kdf = _kdf_do_hash(armazenado)
+        if not kdf.verificar(senha, armazenado):
+            return False, None
+    except (KeyError, ValueError):
+        return False, None
+    if kdf.nome != kdf_atual.nome or kdf.precisa_rehash(armazenado):
+        return True, kdf_atual.gerar(senha)
+    return True, None
+
+async def gerar_hash_senha(senha):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor_senhas, kdf_atual.gerar, senha)
+
+async def verificar_senha(senha, armazenado):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor_senhas, verificar_senha_sync, senha, armazenado)
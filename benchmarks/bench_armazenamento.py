@@ -0,0 +1,107 @@
+"""
+Vazão dos backends de armazenamento (armazenamento.py): gravação (bytes e em
+streaming), leitura inteira, leitura em faixas (streaming) e consulta de info,
+para objetos pequenos, médios e grandes.
+
+Backends: local, fragmentado e memoria sempre; gridfs quando BENCH_MONGODB_URI
+aponta para um MongoDB (o mongomock não implementa GridFS).
+
+Uso: python benchmarks/bench_armazenamento.py [escala]
+  escala multiplica a quantidade de objetos de cada tamanho (padrão 1)
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "servidor"))
+
+from armazenamento import (
+    ArmazenamentoFragmentado, ArmazenamentoGridFS, ArmazenamentoLocal, ArmazenamentoMemoria,
+    TAMANHO_CHUNK_ARMAZENAMENTO
+)
+
+# (rótulo, tamanho do objeto, quantidade)
+CARGAS = [("64 KB", 64 * 1024, 200), ("1 MB", 1024 * 1024, 50), ("16 MB", 16 * 1024 * 1024, 4)]
+
+def criar_backends(diretorio):
+    backends = {
+        "local": ArmazenamentoLocal(os.path.join(diretorio, "local")),
+        "fragmentado": ArmazenamentoFragmentado(os.path.join(diretorio, "fragmentado")),
+        "memoria": ArmazenamentoMemoria(),
+    }
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+        banco = AsyncIOMotorClient(uri).verysing_bench
+        bucket = AsyncIOMotorGridFSBucket(banco, bucket_name="bench_armazenamento")
+        backends["gridfs"] = ArmazenamentoGridFS(lambda: bucket)
+    else:
+        print("ℹ️ gridfs pulado (defina BENCH_MONGODB_URI)")
+    return backends
+
+async def blocos(dados):
+    for posicao in range(0, len(dados), TAMANHO_CHUNK_ARMAZENAMENTO):
+        yield dados[posicao:posicao + TAMANHO_CHUNK_ARMAZENAMENTO]
+
+async def medir(operacao, chaves):
+    inicio = time.perf_counter()
+    total = 0
+    for chave in chaves:
+        total += await operacao(chave) or 0
+    return time.perf_counter() - inicio, total
+
+def vazao(total_bytes, segundos):
+    return total_bytes / (1024 * 1024) / segundos if segundos else float("inf")
+
+async def bench_backend(nome, backend, escala):
+    for rotulo, tamanho, quantidade in CARGAS:
+        quantidade *= escala
+        dados = os.urandom(tamanho)
+        # Nomes hex, como os IDs de documento (o fragmentado usa o prefixo)
+        chaves = [f"bench/{i:08x}{os.urandom(4).hex()}.pdf" for i in range(quantidade)]
+
+        t_gravar, bytes_gravados = await medir(lambda c: backend.gravar(c, dados), chaves)
+        t_stream, _ = await medir(lambda c: backend.gravar(c, blocos(dados)), chaves)
+        t_ler, bytes_lidos = await medir(lambda c: _tamanho(backend.ler(c)), chaves)
+        t_faixas, bytes_faixas = await medir(lambda c: _consumir(backend.ler_faixa(c)), chaves)
+        t_info, _ = await medir(lambda c: _nada(backend.info(c)), chaves)
+        assert bytes_lidos == bytes_faixas == bytes_gravados
+
+        print(f"{nome:<12} {rotulo:>6} x{quantidade:<4} "
+              f"{vazao(bytes_gravados, t_gravar):>10.0f} {vazao(bytes_gravados, t_stream):>10.0f} "
+              f"{vazao(bytes_lidos, t_ler):>10.0f} {vazao(bytes_faixas, t_faixas):>10.0f} "
+              f"{t_info / quantidade * 1e6:>10.1f}")
+
+        for chave in chaves:
+            await backend.remover(chave)
+
+async def _tamanho(corrotina):
+    return len(await corrotina)
+
+async def _consumir(iterador):
+    total = 0
+    async for bloco in iterador:
+        total += len(bloco)
+    return total
+
+async def _nada(corrotina):
+    await corrotina
+    return 0
+
+async def main():
+    escala = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    diretorio = tempfile.mkdtemp(prefix="verysing-armazenamento-")
+    try:
+        backends = criar_backends(diretorio)
+        print(f"{'backend':<12} {'objeto':>6} {'qtd':<5} {'grava MB/s':>10} {'stream MB/s':>10} "
+              f"{'lê MB/s':>10} {'faixas MB/s':>10} {'info µs':>10}")
+        for nome, backend in backends.items():
+            await bench_backend(nome, backend, escala)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
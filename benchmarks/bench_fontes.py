@@ -0,0 +1,89 @@
+"""
+Custo das fontes das assinaturas (fontes_assinatura.py): tempo para gerar a
+página de assinaturas (gerar_pagina_assinaturas) e bytes que cada fonte
+acrescenta ao PDF, comparando:
+
+- padrao:       fonte padrão do PDF (Times-Italic), nada embutido;
+- registro:     TTF registrada uma vez no processo, subset em cache;
+- sem_cache:    TTF registrada uma vez, subset gerado a cada página;
+- ingenuo:      TTF lida e registrada de novo a cada página.
+
+As TTFs vêm de FONTES_ASSINATURA/FONTES_ASSINATURA_DIR (como no servidor);
+sem nenhuma configurada, usa as TTFs que acompanham o reportlab só para
+medir o mecanismo (os números reais dependem das fontes manuscritas).
+
+Uso: python benchmarks/bench_fontes.py [repetições]   (padrão: 50)
+"""
+import os
+import sys
+import tempfile
+import time
+
+from bench_suite import preparar_ambiente, silenciar, percentil
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+NOMES = ["Fulano de Tal", "Maria da Conceição", "João Araújo", "Ana Beatriz Gonçalves"]
+
+def ttfs_configuradas():
+    from fontes_assinatura import RegistroFontes
+    registro = RegistroFontes.do_ambiente().carregar()
+    ttfs = {os.path.basename(caminho): caminho for caminho in registro._ttfs}
+    if not ttfs:
+        import reportlab
+        pasta = os.path.join(os.path.dirname(reportlab.__file__), "fonts")
+        ttfs = {nome: os.path.join(pasta, nome) for nome in ("Vera.ttf", "VeraIt.ttf")}
+        print("ℹ️ Nenhuma TTF em FONTES_ASSINATURA: usando as do reportlab")
+    return ttfs
+
+def medir(pipeline, repeticoes, preparar):
+    # Uma assinatura por página, alternando os nomes (como pedidos de usuários diferentes)
+    tempos = []
+    tamanho = 0
+    for i in range(repeticoes):
+        nome = NOMES[i % len(NOMES)]
+        inicio = time.perf_counter()
+        preparar()
+        pagina = pipeline.gerar_pagina_assinaturas(nome, "VerySing Digital", "manuscrita", 595, 842, eh_nova_pagina=True)
+        tempos.append(time.perf_counter() - inicio)
+        tamanho += len(pagina.getvalue())
+    tempos.sort()
+    return percentil(tempos, 0.5) * 1000, percentil(tempos, 0.9) * 1000, tamanho / repeticoes
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    preparar_ambiente(tempfile.mkdtemp(prefix="verysing-bench-fontes-"))
+    with silenciar():
+        import pipeline_assinatura as pipeline
+    from fontes_assinatura import RegistroFontes
+
+    print(f"{'fonte':<22} {'cenário':<10} {'p50 ms':>8} {'p90 ms':>8} {'bytes/pág':>10} {'+ bytes':>8}")
+    pipeline.registro_fontes = RegistroFontes({})
+    p50, p90, base = medir(pipeline, repeticoes, lambda: None)
+    print(f"{'Times-Italic':<22} {'padrao':<10} {p50:>8.2f} {p90:>8.2f} {base:>10.0f} {0:>8}")
+
+    for arquivo, caminho in ttfs_configuradas().items():
+        registro = RegistroFontes({"manuscrita": caminho}).carregar()
+        pipeline.registro_fontes = registro
+        p50, p90, tamanho = medir(pipeline, repeticoes, lambda: None)
+        print(f"{arquivo:<22} {'registro':<10} {p50:>8.2f} {p90:>8.2f} {tamanho:>10.0f} {tamanho - base:>8.0f}")
+
+        # Mesmo registro, mas sem o cache: subset refeito a cada página
+        nome_sem_cache = f"SemCache-{arquivo}"
+        pdfmetrics.registerFont(TTFont(nome_sem_cache, caminho))
+        registro.fontes["manuscrita"] = nome_sem_cache
+        p50, p90, tamanho = medir(pipeline, repeticoes, lambda: None)
+        print(f"{arquivo:<22} {'sem_cache':<10} {p50:>8.2f} {p90:>8.2f} {tamanho:>10.0f} {tamanho - base:>8.0f}")
+
+        # Sem registro: a TTF é lida e registrada de novo a cada página
+        nome_ingenuo = f"Ingenuo-{arquivo}"
+        registro.fontes["manuscrita"] = nome_ingenuo
+        p50, p90, tamanho = medir(
+            pipeline, max(5, repeticoes // 5), lambda: pdfmetrics.registerFont(TTFont(nome_ingenuo, caminho))
+        )
+        print(f"{arquivo:<22} {'ingenuo':<10} {p50:>8.2f} {p90:>8.2f} {tamanho:>10.0f} {tamanho - base:>8.0f}")
+        print(f"{'':<22} cache de subsets: {registro.estatisticas()['ttfs']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Orçamento de cold start do api/index.py (entrada serverless na Vercel).
+
+Mede, em interpretadores novos, o tempo de importar api.index e de preparar
+as rotas de login/listagem (import + criação preguiçosa do cliente Mongo, sem
+rede). Falha se a mediana passar do orçamento ou se a pilha pesada de PDF
+(reportlab, pypdf, qrcode, PIL, cryptography) voltar a ser carregada no import.
+
+Uso: python benchmarks/bench_importacao.py [orcamento_segundos] [repeticoes]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULOS_PESADOS = ("reportlab", "pypdf", "qrcode", "PIL", "cryptography")
+
+SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+import api.index as index
+importacao = time.perf_counter() - inicio
+pesados = [m for m in %r if m in sys.modules]
+index.obter_cliente_mongo()
+rotas = time.perf_counter() - inicio
+print(json.dumps({"importacao": importacao, "rotas": rotas, "pesados": pesados}))
+""" % (MODULOS_PESADOS,)
+
+def medir_uma_vez():
+    saida = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=RAIZ,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+def main():
+    orcamento = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    medir_uma_vez() # Aquece o cache de bytecode (.pyc)
+    resultados = [medir_uma_vez() for _ in range(repeticoes)]
+    importacao = statistics.median(r["importacao"] for r in resultados)
+    rotas = statistics.median(r["rotas"] for r in resultados)
+    pesados = sorted({m for r in resultados for m in r["pesados"]})
+
+    print(f"{'import api.index (mediana)':<40} {importacao * 1000:10.1f} ms")
+    print(f"{'login/listagem prontos (mediana)':<40} {rotas * 1000:10.1f} ms")
+    print(f"{'orçamento':<40} {orcamento * 1000:10.1f} ms")
+
+    falhou = False
+    if pesados:
+        print(f"❌ Módulos pesados carregados no import: {', '.join(pesados)}")
+        falhou = True
+    if rotas > orcamento:
+        print(f"❌ Cold start acima do orçamento ({rotas * 1000:.0f} ms > {orcamento * 1000:.0f} ms)")
+        falhou = True
+    if falhou:
+        sys.exit(1)
+    print("✅ Cold start dentro do orçamento")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Layout de DIRETORIO_ASSINADOS com muitos documentos: plano (tudo em uma
+pasta, ArmazenamentoLocal) contra fragmentado (ab/cd/<nome>,
+ArmazenamentoFragmentado), e a migração online de um para o outro.
+
+Com N documentos (3 arquivos cada: .pdf, .json e o original no armazém),
+mede o custo por operação de:
+- info de uma chave existente e de uma inexistente (as sondagens do /validar);
+- leitura inteira de um arquivo pequeno;
+- criar e apagar um arquivo;
+- uma página de 1000 chaves de listar_pagina (o que o varredor faz por lote);
+e o tempo da migração do plano para o fragmentado (arquivos por segundo).
+O cache de diretórios do kernel está quente: em disco frio e com milhões de
+arquivos a diferença entre os layouts é maior.
+
+Uso: python benchmarks/bench_layout_assinados.py [documentos]   (padrão: 100000)
+"""
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "servidor"))
+
+from armazenamento import ArmazenamentoFragmentado, ArmazenamentoLocal
+from armazem_originais import ArmazemOriginais, ChavesOriginaisPlano
+from migracao_layout import MigracaoLayout
+
+AMOSTRAS = 2000
+
+def criar_arquivos(armazenamento, documentos):
+    # Direto no disco (sem o event loop): só o layout importa aqui
+    originais = ArmazemOriginais(armazenamento)
+    ids = []
+    for i in range(documentos):
+        id_documento = hashlib.sha256(f"doc-{i}".encode()).hexdigest()
+        sha256 = hashlib.sha256(f"original-{i % (documentos // 3 + 1)}".encode()).hexdigest()
+        for chave in (f"{id_documento}.pdf", f"{id_documento}.json", originais.chave(sha256)):
+            caminho = armazenamento._caminho(chave)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, "wb") as f:
+                f.write(b"%PDF-1.4 bench")
+        ids.append(id_documento)
+    return ids
+
+async def por_operacao(operacao, argumentos):
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        await operacao(argumento)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1e6
+
+async def medir(nome, armazenamento, ids):
+    aleatorio = random.Random(42)
+    existentes = [f"{i}.json" for i in aleatorio.sample(ids, min(AMOSTRAS, len(ids)))]
+    inexistentes = [f"{os.urandom(32).hex()}.json" for _ in range(AMOSTRAS)]
+    novas = [f"{os.urandom(32).hex()}.pdf" for _ in range(AMOSTRAS // 4)]
+
+    info = await por_operacao(armazenamento.info, existentes)
+    ausente = await por_operacao(armazenamento.existe, inexistentes)
+    leitura = await por_operacao(armazenamento.ler, existentes)
+    async def criar_apagar(chave):
+        await armazenamento.gravar(chave, b"x")
+        await armazenamento.remover(chave)
+    escrita = await por_operacao(criar_apagar, novas)
+
+    inicio = time.perf_counter()
+    cursor, paginas = None, 0
+    for _ in range(5):
+        _, cursor = await armazenamento.listar_pagina(cursor, 1000)
+        paginas += 1
+        if cursor is None:
+            break
+    pagina = (time.perf_counter() - inicio) / paginas * 1000
+    print(f"{nome:<24} {info:>9.1f} {ausente:>9.1f} {leitura:>9.1f} {escrita:>11.1f} {pagina:>10.1f}")
+
+async def main():
+    documentos = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    diretorio = tempfile.mkdtemp(prefix="verysing-bench-layout-")
+    try:
+        plano = ArmazenamentoLocal(os.path.join(diretorio, "plano"))
+        fragmentado_limpo = ArmazenamentoFragmentado(os.path.join(diretorio, "fragmentado"))
+        print(f"Criando {documentos} documentos ({documentos * 3} arquivos) em cada layout...")
+        ids = criar_arquivos(plano, documentos)
+        criar_arquivos(fragmentado_limpo, documentos)
+
+        print(f"{'layout':<24} {'info µs':>9} {'ausente µs':>9} {'ler µs':>9} {'grava+apaga':>11} {'página ms':>10}")
+        await medir("plano", plano, ids)
+        await medir("fragmentado", fragmentado_limpo, ids)
+
+        # Migração online: leituras com fallback antes, depois o layout novo
+        migrando = ArmazenamentoFragmentado(plano.diretorio, ChavesOriginaisPlano())
+        await medir("fragmentado (fallback)", migrando, ids)
+        migracao = MigracaoLayout(migrando, tamanho_lote=1000)
+        inicio = time.perf_counter()
+        while not await migracao.passo():
+            pass
+        segundos = time.perf_counter() - inicio
+        await medir("fragmentado (migrado)", migrando, ids)
+        print(f"Migração: {migracao.estado['movidos']} arquivos em {segundos:.1f}s "
+              f"({migracao.estado['movidos'] / segundos:.0f} arquivos/s)")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
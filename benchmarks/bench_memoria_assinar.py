@@ -0,0 +1,96 @@
+"""
+Pico de memória por requisição do /assinar, em função do tamanho do PDF.
+
+Cada medição roda num processo novo, que chama a rota direto (sem cliente
+HTTP, que guardaria request e resposta inteiros na memória), com o upload
+vindo de um arquivo em disco, como o multipart do Starlette entrega. O
+pipeline roda no próprio processo (ASSINATURA_WORKERS=0) e o resultado é o
+pico de RSS acima do que o processo já usava depois dos imports.
+
+Compara o upload mantido em memória (limiar infinito) com o upload em disco
+(limiar 0, ver ASSINAR_SPOOL_LIMIAR). Em ambos o PDF assinado é escrito
+direto em arquivo e a resposta é um FileResponse.
+
+Uso: python benchmarks/bench_memoria_assinar.py [MB ...]   (padrão: 5 20 50)
+"""
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+
+os.environ["ASSINATURA_WORKERS"] = "0"
+
+from bench_suite import preparar_ambiente, isolar_ancoras, cliente_mongo_local, silenciar
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from PIL import Image
+
+LADO_IMAGEM = 1000 # 1000x1000 RGB com ruído: ~3 MB incompressíveis por página
+
+def gerar_pdf_grande(megabytes, caminho):
+    aleatorio = random.Random(megabytes)
+    c = canvas.Canvas(caminho, pagesize=A4, invariant=1)
+    for i in range(max(1, round(megabytes / 3))):
+        ruido = Image.frombytes("RGB", (LADO_IMAGEM, LADO_IMAGEM), aleatorio.randbytes(LADO_IMAGEM * LADO_IMAGEM * 3))
+        c.drawImage(ImageReader(ruido), 50, 250, width=495, height=495)
+        c.setFont("Helvetica", 11)
+        c.drawString(50, 780, f"Página {i + 1}")
+        c.showPage()
+    c.save()
+    return os.path.getsize(caminho)
+
+async def assinar(principal, caminho):
+    from starlette.datastructures import UploadFile
+    with open(caminho, "rb") as f:
+        upload = UploadFile(file=f, filename="grande.pdf")
+        resposta = await principal.assinar_contrato(
+            arquivo=upload, nome_contratante="Fulano de Tal", nome_contratada="VerySing Digital",
+            fonte="padrao", img_contratante=None, img_contratada=None
+        )
+    # O arquivo servido pelo FileResponse (ou o corpo, em respostas em memória)
+    return os.path.getsize(resposta.path) if hasattr(resposta, "path") else len(resposta.body)
+
+def rss_pico():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # Linux: KB
+
+def medir(diretorio, caminho, limiar):
+    # Processo filho: importa o servidor, assina uma vez e informa o pico de RSS
+    preparar_ambiente(diretorio)
+    with silenciar():
+        import principal
+    isolar_ancoras(diretorio)
+    cliente_mongo = cliente_mongo_local()
+    if cliente_mongo is not None:
+        principal.db = cliente_mongo.verysing_bench
+    principal.ASSINAR_SPOOL_LIMIAR = limiar
+    antes = rss_pico()
+    with silenciar():
+        tamanho_saida = asyncio.run(assinar(principal, caminho))
+    principal.motor_assinatura.encerrar()
+    print(rss_pico() - antes, tamanho_saida)
+
+def main():
+    if sys.argv[1:2] == ["--medir"]:
+        return medir(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+
+    tamanhos = [int(a) for a in sys.argv[1:]] or [5, 20, 50]
+    diretorio = tempfile.mkdtemp(prefix="verysing-bench-memoria-")
+    print(f"{'PDF MB':>8} {'upload':<8} {'pico MB':>9} {'pico/PDF':>9} {'saída MB':>9}")
+    for megabytes in tamanhos:
+        caminho = os.path.join(diretorio, f"grande_{megabytes}.pdf")
+        tamanho = gerar_pdf_grande(megabytes, caminho)
+        for modo, limiar in (("memoria", sys.maxsize), ("disco", 0)):
+            saida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--medir", diretorio, caminho, str(limiar)],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            pico, tamanho_saida = int(saida[-2]), int(saida[-1])
+            print(f"{tamanho / 2**20:>8.1f} {modo:<8} {pico / 2**20:>9.1f} {pico / tamanho:>9.2f} {tamanho_saida / 2**20:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark do BR Code (pix_utils): CRC16 bit a bit (implementação
+anterior) vs. por tabela, e geração unitária vs. em lote.
+
+Uso: python benchmarks/bench_pix.py [quantidade]
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "servidor"))
+
+from pix_utils import crc16_ccitt, gerar_payload_pix, gerar_payloads_pix, validar_payload_pix
+
+CHAVE = "00000000000"
+NOME = "VerySing Digital"
+CIDADE = "Sao Paulo"
+
+def crc16_ccitt_bit_a_bit(data: str) -> str:
+    # Implementação anterior, mantida aqui só como referência de comparação
+    crc = 0xFFFF
+    poly = 0x1021
+    for byte in data.encode('utf-8'):
+        crc ^= (byte << 8)
+        for _ in range(8):
+            if (crc & 0x8000):
+                crc = (crc << 1) ^ poly
+            else:
+                crc <<= 1
+        crc &= 0xFFFF
+    return f"{crc:04X}"
+
+def medir(nome, funcao, repeticoes=1):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    total = time.perf_counter() - inicio
+    print(f"{nome:<40} {total * 1000:10.2f} ms")
+    return total
+
+def main():
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cobrancas = [(round(10 + i * 0.37, 2), uuid.uuid4().hex[:20]) for i in range(quantidade)]
+    amostra = gerar_payload_pix(CHAVE, NOME, CIDADE, 49.90, cobrancas[0][1])[:-4]
+
+    assert crc16_ccitt(amostra) == crc16_ccitt_bit_a_bit(amostra)
+
+    print(f"--- CRC16 ({quantidade} payloads de {len(amostra)} chars) ---")
+    t_antigo = medir("bit a bit (anterior)", lambda: [crc16_ccitt_bit_a_bit(amostra) for _ in range(quantidade)])
+    t_novo = medir("tabela (binascii.crc_hqx)", lambda: [crc16_ccitt(amostra) for _ in range(quantidade)])
+    print(f"{'ganho':<40} {t_antigo / t_novo:10.1f}x")
+
+    print(f"--- Geração de {quantidade} payloads ---")
+    t_unit = medir("gerar_payload_pix (um por chamada)", lambda: [gerar_payload_pix(CHAVE, NOME, CIDADE, v, t) for v, t in cobrancas])
+    t_lote = medir("gerar_payloads_pix (lote)", lambda: gerar_payloads_pix(CHAVE, NOME, CIDADE, cobrancas))
+    print(f"{'ganho':<40} {t_unit / t_lote:10.1f}x")
+
+    payloads = gerar_payloads_pix(CHAVE, NOME, CIDADE, cobrancas)
+    print(f"--- Validação de {quantidade} payloads ---")
+    medir("validar_payload_pix", lambda: all(validar_payload_pix(p) for p in payloads))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+Suíte de benchmarks reprodutível da assinatura, validação, listagem e PIX.
+
+Gera PDFs sintéticos determinísticos (1, 10, 100 e 500 páginas; só texto, com
+linhas de assinatura "___" e com tamanhos de página mistos) e mede:
+
+- funções: aplicar_assinatura_visual, gerar_carimbo_pdf,
+  encontrar_coordenadas_assinatura e gerar_payload_pix;
+- rotas HTTP, com TestClient (no mesmo processo) e um Mongo local: /assinar,
+  /validar/dados, /validar/arquivo, PIX (servidor) e /api/documentos (api).
+
+O Mongo usado é BENCH_MONGODB_URI, se definido; senão mongomock_motor (se
+instalado); sem nenhum dos dois as rotas HTTP são puladas. Sem chave de
+assinatura configurada, uma chave RSA temporária é gerada.
+
+Para cada cenário registra percentis de latência, quanto o pico de RSS do
+processo subiu acima do RSS de início do cenário (só Linux) e bytes de saída. O resultado sai em JSON e pode ser comparado com um baseline
+guardado: sai com código 1 se algum cenário regredir além da tolerância.
+
+Uso:
+  python benchmarks/bench_suite.py [--rapido] [--saida resultados.json]
+      [--baseline benchmarks/baseline.json] [--gravar-baseline]
+      [--tolerancia 0.25] [--piso-ms 2] [--sem-http] [--repeticoes-http 10]
+
+O baseline depende da máquina: grave-o com --gravar-baseline no mesmo
+ambiente em que as comparações vão rodar (ex.: o runner de CI).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(RAIZ, "servidor"))
+sys.path.insert(0, RAIZ)
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4, letter
+from pypdf import PdfReader
+
+ID_DOCUMENTO = "a" * 64
+HASH_VISUAL = "Yd1nkHG0hpuAyAwie8UwIeTcV44OotlhELRG4fjvtw4V6ohj70uCfoNQM63tZE5u"
+LINK = f"https://localhost:8000/validar?hash={ID_DOCUMENTO}"
+EMAIL_LISTAGEM = "bench@verysing.com"
+
+# Repetições medidas por tamanho de documento (fora o aquecimento)
+REPETICOES_POR_PAGINAS = {1: 20, 10: 10, 100: 5, 500: 2}
+VARIANTES = {
+    "texto": {"linhas": False, "mistas": False},
+    "linhas": {"linhas": True, "mistas": False},
+    "mistas": {"linhas": True, "mistas": True},
+}
+
+# --- PDFs sintéticos ---
+def gerar_pdf_sintetico(paginas, linhas=False, mistas=False):
+    """Mesmo conteúdo a cada execução: os bytes de entrada não variam entre rodadas."""
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4, invariant=1)
+    for i in range(paginas):
+        c.setPageSize(letter if mistas and i % 3 == 1 else A4)
+        c.setFont("Helvetica", 11)
+        for j in range(40):
+            c.drawString(50, 780 - j * 18, f"Página {i + 1}, cláusula {j}: texto de contrato de exemplo")
+        if linhas and i == paginas - 1:
+            c.drawString(60, 120, "_______________________")
+            c.drawString(330, 120, "_______________________")
+            c.drawString(80, 105, "CONTRATANTE")
+            c.drawString(350, 105, "CONTRATADA")
+        c.showPage()
+    c.save()
+    return packet.getvalue()
+
+# --- Medição ---
+def reiniciar_pico_rss():
+    # ru_maxrss é o pico da vida toda do processo: no Linux, escrever 5 em
+    # /proc/self/clear_refs zera o VmHWM e o pico passa a valer só do cenário
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def memoria_mb(campo):
+    # VmRSS (atual) ou VmHWM (pico desde o último reinício)
+    with open("/proc/self/status") as f:
+        for linha in f:
+            if linha.startswith(campo + ":"):
+                return int(linha.split()[1]) / 1024
+
+def percentil(ordenadas, fracao):
+    # Nearest-rank: estável para amostras pequenas
+    indice = min(len(ordenadas) - 1, max(0, int(round(fracao * (len(ordenadas) - 1)))))
+    return ordenadas[indice]
+
+def resumir(amostras, bytes_saida=None, rss_delta_mb=None):
+    ordenadas = sorted(amostras)
+    return {
+        "n": len(ordenadas),
+        "p50_ms": round(percentil(ordenadas, 0.50) * 1000, 3),
+        "p90_ms": round(percentil(ordenadas, 0.90) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 0.99) * 1000, 3),
+        "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 3),
+        "max_ms": round(ordenadas[-1] * 1000, 3),
+        "bytes_saida": bytes_saida,
+        "rss_delta_mb": rss_delta_mb,
+    }
+
+@contextlib.contextmanager
+def silenciar():
+    # Os logs (print) das rotas e do carimbo não entram na tabela. O descritor 1
+    # também é redirecionado: os workers do motor de assinatura herdam o stdout
+    sys.stdout.flush()
+    original = os.dup(1)
+    nulo = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(nulo, 1)
+    os.close(nulo)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(original, 1)
+        os.close(original)
+
+def medir(funcao, repeticoes, aquecimento=1):
+    """funcao() devolve o tamanho da saída em bytes (ou None)."""
+    amostras = []
+    bytes_saida = None
+    # Sem como zerar o pico (fora do Linux), o RSS do cenário fica de fora
+    rss_inicio = memoria_mb("VmRSS") if reiniciar_pico_rss() else None
+    with silenciar():
+        for _ in range(aquecimento):
+            funcao()
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            bytes_saida = funcao()
+            amostras.append(time.perf_counter() - inicio)
+    rss_delta = round(memoria_mb("VmHWM") - rss_inicio, 1) if rss_inicio is not None else None
+    return resumir(amostras, bytes_saida, rss_delta)
+
+class Relatorio:
+    def __init__(self):
+        self.resultados = {}
+
+    def registrar(self, nome, resultado):
+        self.resultados[nome] = resultado
+        print(f"{nome:<46} {resultado['p50_ms']:>10.2f} {resultado['p90_ms']:>10.2f} {resultado['p99_ms']:>10.2f} "
+              f"{resultado['bytes_saida'] if resultado['bytes_saida'] is not None else '-':>10} "
+              f"{resultado['rss_delta_mb'] if resultado['rss_delta_mb'] is not None else '-':>8}", flush=True)
+
+# --- Ambiente isolado ---
+def preparar_ambiente(diretorio):
+    # O benchmark roda num diretório temporário: a chave vai por PRIVATE_KEY_PEM
+    # (a de servidor/, se existir, ou uma chave RSA temporária)
+    caminho_chave = os.path.join(RAIZ, "servidor", "chave_privada_assinatura.pem")
+    if not os.getenv("PRIVATE_KEY_PEM") and os.path.exists(caminho_chave):
+        with open(caminho_chave, "r", encoding="utf-8") as f:
+            os.environ["PRIVATE_KEY_PEM"] = f.read()
+    if not os.getenv("PRIVATE_KEY_PEM"):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        os.environ["PRIVATE_KEY_PEM"] = chave.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+    os.environ.setdefault("CHAVES_DIR", os.path.join(diretorio, "chaves"))
+    # Documentos assinados no benchmark ficam no diretório temporário, não em servidor/assinados
+    os.environ["ARMAZENAMENTO_DIR"] = os.path.join(diretorio, "assinados")
+    os.chdir(diretorio)
+
+def isolar_ancoras(diretorio):
+    import pipeline_assinatura
+    from indice_ancoras import IndiceAncoras
+    pipeline_assinatura.indice_ancoras = IndiceAncoras(os.path.join(diretorio, "ancoras"))
+
+def cliente_mongo_local():
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(uri)
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        return None
+    return AsyncMongoMockClient()
+
+# --- Cenários ---
+def bench_funcoes(pipeline, relatorio, paginas_lista):
+    from pix_utils import gerar_payload_pix
+    from contratos import renderizar_contrato_padrao
+
+    for paginas in paginas_lista:
+        repeticoes = REPETICOES_POR_PAGINAS[paginas]
+        for variante, opcoes in VARIANTES.items():
+            pdf_bytes = gerar_pdf_sintetico(paginas, **opcoes)
+            relatorio.registrar(
+                f"aplicar_assinatura_visual/{paginas}p/{variante}",
+                medir(lambda: len(pipeline.aplicar_assinatura_visual(
+                    pdf_bytes, ID_DOCUMENTO, HASH_VISUAL, "Fulano de Tal", "VerySing Digital"
+                ).getvalue()), repeticoes)
+            )
+            paginas_pdf = PdfReader(io.BytesIO(pdf_bytes)).pages
+            def procurar_linhas():
+                for pagina in paginas_pdf:
+                    pipeline.encontrar_coordenadas_assinatura(pagina)
+            relatorio.registrar(
+                f"encontrar_coordenadas_assinatura/{paginas}p/{variante}",
+                medir(procurar_linhas, repeticoes)
+            )
+
+    for nome, (largura, altura) in (("a4", A4), ("carta", letter)):
+        relatorio.registrar(
+            f"gerar_carimbo_pdf/{nome}",
+            medir(lambda: len(pipeline.gerar_carimbo_pdf(HASH_VISUAL, LINK, largura, altura).getvalue()), 50)
+        )
+
+    # Contrato de adesão: renderização completa (falha do cache) x preenchimento do modelo
+    valores = {"nome": "Fulano de Tal", "cpf": "123.456.789-00", "data": "01/01/2025 12:00:00", "txid": "BENCH0000000000000001"}
+    relatorio.registrar(
+        "contrato/renderizar_modelo",
+        medir(lambda: len(renderizar_contrato_padrao("profissional").pdf), 50)
+    )
+    modelo = renderizar_contrato_padrao("profissional")
+    relatorio.registrar(
+        "contrato/preencher",
+        medir(lambda: len(modelo.preencher(valores)), 2000, aquecimento=10)
+    )
+
+    relatorio.registrar(
+        "gerar_payload_pix",
+        medir(lambda: len(gerar_payload_pix("00000000000", "VerySing Digital", "Sao Paulo", 49.90, "BENCH0000000000000001")), 2000, aquecimento=10)
+    )
+
+def bench_servidor(principal, relatorio, cliente_mongo, repeticoes):
+    from fastapi.testclient import TestClient
+
+    principal.db = cliente_mongo.verysing_bench
+    pdf_bytes = gerar_pdf_sintetico(10, linhas=True)
+    with TestClient(principal.app) as cliente, silenciar():
+        def assinar():
+            resposta = cliente.post(
+                "/assinar",
+                files={"arquivo": ("contrato.pdf", pdf_bytes, "application/pdf")},
+                data={"nome_contratante": "Fulano de Tal", "nome_contratada": "VerySing Digital"}
+            )
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        resultado_assinar = medir(assinar, repeticoes)
+
+        id_documento = sorted(principal.indice_documentos.ids)[0]
+        def validar_dados():
+            resposta = cliente.get(f"/validar/dados/{id_documento}")
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        def validar_arquivo():
+            resposta = cliente.get(f"/validar/arquivo/{id_documento}")
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        resultado_dados = medir(validar_dados, repeticoes * 5)
+        resultado_arquivo = medir(validar_arquivo, repeticoes * 5)
+
+        def criar_pix():
+            resposta = cliente.post("/api/pagamento/pix", json={"nome": "Fulano", "cpf": "00000000000", "plano": "profissional", "valor": 49.90})
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        valores = iter(range(1, 10 ** 6))
+        def qr_pix_frio():
+            # Valor novo a cada chamada: QR renderizado, sem cache
+            resposta = cliente.get(f"/api/pagamento/pix/BENCH01/qr.png?valor={next(valores)}.00")
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        def qr_pix_cache():
+            resposta = cliente.get("/api/pagamento/pix/BENCH01/qr.png?valor=49.90")
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        resultado_pix = medir(criar_pix, repeticoes * 5)
+        resultado_qr_frio = medir(qr_pix_frio, repeticoes)
+        resultado_qr_cache = medir(qr_pix_cache, repeticoes * 5)
+
+    relatorio.registrar("http/servidor/POST /assinar (10p)", resultado_assinar)
+    relatorio.registrar("http/servidor/GET /validar/dados", resultado_dados)
+    relatorio.registrar("http/servidor/GET /validar/arquivo", resultado_arquivo)
+    relatorio.registrar("http/servidor/POST /api/pagamento/pix", resultado_pix)
+    relatorio.registrar("http/servidor/GET qr.png (frio)", resultado_qr_frio)
+    relatorio.registrar("http/servidor/GET qr.png (cache)", resultado_qr_cache)
+
+def bench_api(relatorio, cliente_mongo, repeticoes, quantidade=500):
+    from fastapi.testclient import TestClient
+    with silenciar():
+        import api.index as index
+
+    index._cliente_mongo = cliente_mongo
+    inicio = datetime.datetime(2024, 1, 1)
+
+    async def popular():
+        await index.db.documentos.delete_many({"ownerEmail": EMAIL_LISTAGEM})
+        await index.db.contratos.delete_many({"email": EMAIL_LISTAGEM})
+        await index.db.documentos.insert_many([
+            {"ownerEmail": EMAIL_LISTAGEM, "nome_arquivo": f"documento_{i}.pdf", "tamanho": "0.10 MB",
+             "tipo": "pdf", "categoria": "Geral", "createdAt": inicio + datetime.timedelta(minutes=i)}
+            for i in range(quantidade)
+        ])
+        await index.db.contratos.insert_many([
+            {"email": EMAIL_LISTAGEM, "nome_arquivo": f"contrato_{i}.pdf",
+             "criado_em": inicio + datetime.timedelta(minutes=i, seconds=30)}
+            for i in range(quantidade)
+        ])
+
+    with TestClient(index.app) as cliente, silenciar():
+        cliente.portal.call(popular)
+        proximo = {}
+        def listar_primeira():
+            resposta = cliente.get("/api/documentos", params={"email": EMAIL_LISTAGEM, "limite": 50})
+            assert resposta.status_code == 200, resposta.text
+            proximo["cursor"] = resposta.headers.get("X-Proximo-Cursor")
+            return len(resposta.content)
+        def listar_seguinte():
+            resposta = cliente.get("/api/documentos", params={"email": EMAIL_LISTAGEM, "limite": 50, "cursor": proximo["cursor"]})
+            assert resposta.status_code == 200, resposta.text
+            return len(resposta.content)
+        resultado_primeira = medir(listar_primeira, repeticoes * 5)
+        resultado_seguinte = medir(listar_seguinte, repeticoes * 5)
+
+    relatorio.registrar(f"http/api/GET /api/documentos ({quantidade * 2} itens)", resultado_primeira)
+    relatorio.registrar("http/api/GET /api/documentos (cursor)", resultado_seguinte)
+
+# --- Baseline ---
+def comparar(resultados, baseline, tolerancia, piso_ms):
+    """Lista de regressões: latência p50 acima de (1 + tolerancia) ou saída 5% maior."""
+    regressoes = []
+    print(f"\n{'cenário':<46} {'p50 base':>10} {'p50 atual':>10} {'variação':>9}")
+    for nome, atual in resultados.items():
+        base = baseline.get(nome)
+        if not base:
+            continue
+        variacao = (atual["p50_ms"] - base["p50_ms"]) / base["p50_ms"] if base["p50_ms"] else 0.0
+        # Diferenças abaixo do piso são ruído da máquina, não regressão
+        lento = variacao > tolerancia and atual["p50_ms"] - base["p50_ms"] > piso_ms
+        maior = (base.get("bytes_saida") and atual.get("bytes_saida")
+                 and atual["bytes_saida"] > base["bytes_saida"] * 1.05)
+        marca = "❌" if lento or maior else "  "
+        print(f"{nome:<46} {base['p50_ms']:>10.2f} {atual['p50_ms']:>10.2f} {variacao * 100:>+8.1f}% {marca}")
+        if lento:
+            regressoes.append(f"{nome}: p50 {base['p50_ms']:.2f} -> {atual['p50_ms']:.2f} ms")
+        if maior:
+            regressoes.append(f"{nome}: saída {base['bytes_saida']} -> {atual['bytes_saida']} bytes")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Suíte de benchmarks do VerySing")
+    parser.add_argument("--rapido", action="store_true", help="sem os cenários de 500 páginas")
+    parser.add_argument("--sem-http", action="store_true", help="só as funções, sem as rotas HTTP")
+    parser.add_argument("--repeticoes-http", type=int, default=10)
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    parser.add_argument("--baseline", default=os.path.join(RAIZ, "benchmarks", "baseline.json"))
+    parser.add_argument("--gravar-baseline", action="store_true", help="grava os resultados como novo baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="aumento de p50 tolerado (0.25 = 25%%)")
+    parser.add_argument("--piso-ms", type=float, default=2.0, help="diferença de p50 (ms) abaixo da qual não há regressão")
+    args = parser.parse_args()
+
+    # Caminhos relativos à pasta de onde o benchmark foi chamado
+    args.baseline = os.path.abspath(args.baseline)
+    args.saida = os.path.abspath(args.saida) if args.saida else None
+
+    paginas_lista = [1, 10, 100] if args.rapido else [1, 10, 100, 500]
+    diretorio = tempfile.mkdtemp(prefix="verysing-bench-")
+    preparar_ambiente(diretorio)
+
+    with silenciar():
+        import principal
+        import pipeline_assinatura
+    isolar_ancoras(diretorio)
+
+    relatorio = Relatorio()
+    print(f"{'cenário':<46} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'bytes':>10} {'ΔRSS MB':>8}")
+    bench_funcoes(pipeline_assinatura, relatorio, paginas_lista)
+
+    if not args.sem_http:
+        cliente_mongo = cliente_mongo_local()
+        if cliente_mongo is None:
+            print("⚠️ Sem BENCH_MONGODB_URI nem mongomock_motor: rotas HTTP puladas")
+        else:
+            bench_servidor(principal, relatorio, cliente_mongo, args.repeticoes_http)
+            bench_api(relatorio, cliente_mongo, args.repeticoes_http)
+    principal.motor_assinatura.encerrar()
+
+    saida = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "modo_escrita": pipeline_assinatura.PDF_MODO_ESCRITA,
+            "workers_assinatura": principal.motor_assinatura.workers,
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "resultados": relatorio.resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(saida, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 Resultados em {args.saida}")
+
+    if args.gravar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(saida, f, ensure_ascii=False, indent=2)
+        print(f"📌 Baseline gravado em {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ Sem baseline em {args.baseline} (use --gravar-baseline)")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["resultados"]
+    regressoes = comparar(relatorio.resultados, baseline, args.tolerancia, args.piso_ms)
+    if regressoes:
+        print("❌ Regressões:")
+        for regressao in regressoes:
+            print(f"   {regressao}")
+        sys.exit(1)
+    print("✅ Nenhuma regressão em relação ao baseline")
+
+if __name__ == "__main__":
+    main()
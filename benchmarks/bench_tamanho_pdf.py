@@ -0,0 +1,93 @@
+"""
+Regressão de tamanho do PDF assinado (aplicar_assinatura_visual): bytes por
+página do carimbo mesclado em cada página (implementação anterior) vs. form
+XObject compartilhado + compressão dos content streams, e o tempo/tamanho do
+modo de atualização incremental (PDF_MODO_ESCRITA=incremental).
+
+Uso: python benchmarks/bench_tamanho_pdf.py [limite_bytes_por_pagina]
+Sai com código 1 se o acréscimo por página (100 páginas) passar do limite.
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "servidor"))
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4, letter
+from pypdf import PdfReader, PdfWriter, PageObject
+
+import pipeline_assinatura
+
+ID_DOCUMENTO = "a" * 64
+HASH_VISUAL = "Yd1nkHG0hpuAyAwie8UwIeTcV44OotlhELRG4fjvtw4V6ohj70uCfoNQM63tZE5u"
+LINK = f"https://localhost:8000/validar?hash={ID_DOCUMENTO}"
+
+def gerar_pdf_sintetico(paginas, tamanhos_mistos=False):
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    for i in range(paginas):
+        c.setPageSize(letter if tamanhos_mistos and i % 3 == 1 else A4)
+        c.setFont("Helvetica", 11)
+        for j in range(40):
+            c.drawString(50, 780 - j * 18, f"Página {i + 1}, cláusula {j}: texto de contrato de exemplo")
+        c.showPage()
+    c.save()
+    return packet.getvalue()
+
+def carimbar_anterior(pdf_bytes):
+    # Implementação anterior, mantida aqui só como referência de comparação:
+    # carimbo completo mesclado em cada página, sem compressão
+    leitor = PdfReader(io.BytesIO(pdf_bytes))
+    escritor = PdfWriter()
+    for pagina in leitor.pages:
+        width = float(pagina.mediabox.width)
+        height = float(pagina.mediabox.height)
+        nova_pagina = PageObject.create_blank_page(width=width, height=height)
+        nova_pagina.merge_page(pagina)
+        carimbo = PdfReader(pipeline_assinatura.gerar_carimbo_pdf(HASH_VISUAL, LINK, width, height)).pages[0]
+        nova_pagina.merge_page(carimbo)
+        escritor.add_page(nova_pagina)
+    output = io.BytesIO()
+    escritor.write(output)
+    return output.getvalue()
+
+def carimbar_atual(pdf_bytes):
+    return pipeline_assinatura.aplicar_assinatura_visual(pdf_bytes, ID_DOCUMENTO, HASH_VISUAL, incremental=False).getvalue()
+
+def carimbar_incremental(pdf_bytes):
+    return pipeline_assinatura.aplicar_assinatura_visual(pdf_bytes, ID_DOCUMENTO, HASH_VISUAL, incremental=True).getvalue()
+
+def medir(funcao, pdf_bytes):
+    inicio = time.perf_counter()
+    saida = funcao(pdf_bytes)
+    return saida, time.perf_counter() - inicio
+
+def main():
+    limite = float(sys.argv[1]) if len(sys.argv) > 1 else 512
+    print(f"{'cenário':<22} {'original':>10} {'anterior':>10} {'atual':>10} {'B/pág ant':>10} {'B/pág atual':>12} "
+          f"{'ms ant':>8} {'ms atual':>9} {'incremental':>12} {'ms incr':>8}")
+    acrescimo_100 = None
+    for paginas, mistos in [(1, False), (10, False), (100, False), (100, True)]:
+        pdf_bytes = gerar_pdf_sintetico(paginas, mistos)
+        anterior, t_anterior = medir(carimbar_anterior, pdf_bytes)
+        atual, t_atual = medir(carimbar_atual, pdf_bytes)
+        incremental, t_incremental = medir(carimbar_incremental, pdf_bytes)
+        assert incremental.startswith(pdf_bytes)
+        por_pagina_anterior = (len(anterior) - len(pdf_bytes)) / paginas
+        por_pagina_atual = (len(atual) - len(pdf_bytes)) / paginas
+        nome = f"{paginas} pág{' (mistas)' if mistos else ''}"
+        print(f"{nome:<22} {len(pdf_bytes):>10} {len(anterior):>10} {len(atual):>10} "
+              f"{por_pagina_anterior:>10.0f} {por_pagina_atual:>12.0f} {t_anterior * 1000:>8.0f} {t_atual * 1000:>9.0f} "
+              f"{len(incremental):>12} {t_incremental * 1000:>8.0f}")
+        if paginas == 100 and not mistos:
+            acrescimo_100 = por_pagina_atual
+
+    if acrescimo_100 > limite:
+        print(f"❌ Regressão: {acrescimo_100:.0f} B/página acima do limite de {limite:.0f}")
+        sys.exit(1)
+    print(f"✅ Acréscimo por página dentro do limite ({acrescimo_100:.0f} <= {limite:.0f} B)")
+
+if __name__ == "__main__":
+    main()
@@ -69,7 +69,24 @@ async function run() {
       }
     }).catch(() => {}); // Ignora se já existe
     await db.collection('documentos').createIndex({ hash: 1 }, { unique: true });
-    await db.collection('documentos').createIndex({ ownerEmail: 1, createdAt: -1 });
+    await db.collection('documentos').createIndex({ ownerEmail: 1, createdAt: -1, _id: -1 }); // listagem paginada (data, _id)
+    // Listagem dos documentos com os campos antigos (email_usuario/criado_em) até rodar api/migrar_gridfs.py
+    await db.collection('documentos').createIndex(
+      { email_usuario: 1, criado_em: -1, _id: -1 },
+      { partialFilterExpression: { email_usuario: { $exists: true } } }
+    );
+    // Varredor do armazenamento: quais originais (armazém por SHA-256) ainda são referenciados
+    await db.collection('documentos').createIndex({ 'metadata.sha256_original': 1 }, { sparse: true });
+
+    // Contratos de adesão gerados no pagamento (listados junto com os documentos)
+    await db.collection('contratos').createIndex({ email: 1, criado_em: -1, _id: -1 }); // listagem paginada (data, _id)
+    await db.collection('contratos').createIndex({ nome_arquivo: 1 });
+
+    // Lápides do DELETE /api/documentos: o varredor do servidor apaga os arquivos
+    // (e a lápide). Expiram em 90 dias, bem mais que um ciclo do varredor.
+    await db.collection('documentos_removidos').createIndex({ tipo: 1, hash: 1 });
+    await db.collection('documentos_removidos').createIndex({ tipo: 1, nome_arquivo: 1 });
+    await db.collection('documentos_removidos').createIndex({ removido_em: 1 }, { expireAfterSeconds: 90 * 86400 });
 
     // 2) ENVELOPES (envio para assinatura)
     // "envelopes" já é igual em pt/en, mantendo.
@@ -136,6 +153,27 @@ async function run() {
     await db.collection('assinaturas').createIndex({ documentId: 1 });
     await db.collection('assinaturas').createIndex({ email: 1 });
 
+    // 3b) ASSINATURAS SALVAS (biblioteca por usuário; a imagem normalizada fica no armazenamento)
+    await db.createCollection('assinaturas_salvas', {
+      validator: {
+        $jsonSchema: {
+          bsonType: 'object',
+          required: ['email', 'sha256', 'criadoEm'],
+          properties: {
+            email: { bsonType: 'string' },
+            nome: { bsonType: 'string' },
+            sha256: { bsonType: 'string' }, // do PNG normalizado: o mesmo envio não duplica
+            largura: { bsonType: 'int' },
+            altura: { bsonType: 'int' },
+            tamanho: { bsonType: 'int' },
+            criadoEm: { bsonType: 'date' }
+          }
+        }
+      }
+    }).catch(() => {});
+    await db.collection('assinaturas_salvas').createIndex({ email: 1, sha256: 1 }, { unique: true });
+    await db.collection('assinaturas_salvas').createIndex({ email: 1, criadoEm: -1 });
+
     // 4) MODELOS DE CONTRATO
     await db.createCollection('modelos', {
       validator: {
@@ -158,6 +196,7 @@ async function run() {
               }
             },
             contentHtml: { bsonType: 'string' },
+            version: { bsonType: ['int', 'long'] }, // incrementar a cada edição: invalida o modelo renderizado em cache
             createdAt: { bsonType: 'date' },
             updatedAt: { bsonType: 'date' }
           }
@@ -0,0 +1,52 @@
+"""
+Confere que os módulos compartilhados entre api/ e servidor/ continuam
+idênticos. As cópias são intencionais: o @vercel/python empacota só a pasta
+de api/index.py (imports relativos) e o servidor roda da própria pasta
+(imports planos), então nenhum dos dois enxerga um pacote na raiz.
+
+Altere uma cópia, copie para a outra e rode:
+    python scripts/verificar_copias.py
+Sai com código 1 (e mostra o diff) se alguma cópia divergiu.
+"""
+import difflib
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS_COMPARTILHADOS = [
+    "armazenamento.py",
+    "cache_utils.py",
+    "contratos.py",
+    "metricas.py",
+    "pix_utils.py",
+    "respostas_http.py",
+    "senhas.py"
+]
+
+def ler(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return f.read()
+
+def main():
+    divergentes = 0
+    for nome in MODULOS_COMPARTILHADOS:
+        api = os.path.join("api", nome)
+        servidor = os.path.join("servidor", nome)
+        conteudo_api = ler(os.path.join(RAIZ, api))
+        conteudo_servidor = ler(os.path.join(RAIZ, servidor))
+        if conteudo_api == conteudo_servidor:
+            continue
+        divergentes += 1
+        print(f"❌ {api} e {servidor} divergiram:")
+        sys.stdout.writelines(difflib.unified_diff(
+            conteudo_api.splitlines(keepends=True), conteudo_servidor.splitlines(keepends=True), api, servidor
+        ))
+    if divergentes:
+        print(f"❌ {divergentes} módulo(s) compartilhado(s) diferente(s) entre api/ e servidor/")
+        return 1
+    print(f"✅ {len(MODULOS_COMPARTILHADOS)} módulos compartilhados idênticos em api/ e servidor/")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+try:
+    import fcntl # Só Unix: trava entre processos
+except ImportError:
+    fcntl = None
+
+from armazenamento import ChavesIguais, ObjetoNaoEncontrado
+
+NIVEL_COMPRESSAO_FRIO = 6
+
+class TravaProcessos:
+    """
+    Exclusão mútua entre as corrotinas do processo (asyncio.Lock) e entre os
+    processos do host (flock em um arquivo): workers do uvicorn e o varredor
+    atualizam os mesmos contadores. Sem fcntl (Windows), só dentro do processo.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = asyncio.Lock()
+        self._fd = None
+
+    async def __aenter__(self):
+        await self._lock.acquire()
+        if fcntl is None:
+            return self
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o600)
+            # Sem bloquear o event loop (nem deixar uma thread presa com a trava se cancelado)
+            while True:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return self
+                except BlockingIOError:
+                    await asyncio.sleep(0.005)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    async def __aexit__(self, *excecao):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+class TravasPorPrefixo:
+    """Uma TravaProcessos por prefixo do SHA-256 (<diretorio>/<sha[:2]>.lock): hashes diferentes raramente disputam."""
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._travas = {}
+
+    def __call__(self, sha256):
+        prefixo = sha256[:2]
+        trava = self._travas.get(prefixo)
+        if trava is None:
+            os.makedirs(self.diretorio, exist_ok=True)
+            trava = self._travas[prefixo] = TravaProcessos(os.path.join(self.diretorio, f"{prefixo}.lock"))
+        return trava
+
+def diretorio_travas_padrao(armazenamento):
+    # Mesmo diretório em todos os processos do host que usam o mesmo armazenamento
+    identidade = getattr(armazenamento, "diretorio", None) or armazenamento.nome
+    return os.path.join(tempfile.gettempdir(), f"verysing_originais_{hashlib.sha1(identidade.encode()).hexdigest()[:16]}")
+
+async def _comprimir(blocos):
+    # gzip em streaming: memória limitada a um bloco, CPU fora do event loop
+    compressor = zlib.compressobj(NIVEL_COMPRESSAO_FRIO, zlib.DEFLATED, 31)
+    async for bloco in blocos:
+        saida = await asyncio.to_thread(compressor.compress, bloco)
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+async def _descomprimir(blocos):
+    descompressor = zlib.decompressobj(31)
+    async for bloco in blocos:
+        saida = await asyncio.to_thread(descompressor.decompress, bloco)
+        if saida:
+            yield saida
+    yield descompressor.flush()
+
+class ChavesOriginaisPlano(ChavesIguais):
+    """
+    Chaves dos originais entre o layout plano (<prefixo><sha[:2]>/<sha>.pdf) e
+    o fragmentado (<prefixo><sha>.pdf), inclusive .refs e a camada fria. Para
+    migrar um ArmazenamentoLocal para ArmazenamentoFragmentado.
+    """
+    def __init__(self, prefixo="originais/", prefixo_frio="frio/"):
+        prefixos = "|".join(re.escape(p) for p in (prefixo_frio + prefixo, prefixo))
+        self._plano = re.compile(rf"^({prefixos})[0-9a-f]{{2}}/([0-9a-f]{{64}}\.(?:pdf|refs|pdf\.gz))$")
+        self._fragmentado = re.compile(rf"^({prefixos})([0-9a-f]{{64}}\.(?:pdf|refs|pdf\.gz))$")
+
+    def nova(self, chave_antiga):
+        m = self._plano.match(chave_antiga)
+        return m.group(1) + m.group(2) if m else chave_antiga
+
+    def antiga(self, chave):
+        m = self._fragmentado.match(chave)
+        return f"{m.group(1)}{m.group(2)[:2]}/{m.group(2)}" if m else chave
+
+class ArmazemOriginais:
+    """
+    Armazém endereçado por conteúdo dos PDFs originais: cada original fica uma
+    única vez em <prefixo><sha[:2]>/<sha>.pdf, com a contagem de referências
+    em <sha>.refs. Assinar o mesmo modelo centenas de vezes guarda uma cópia só.
+    Funciona sobre qualquer backend de armazenamento (ver armazenamento.py); em
+    backends que já fragmentam as chaves, a pasta <sha[:2]> é dispensada.
+
+    Originais sem acesso há muito tempo podem ir para a camada fria
+    (arquivar): <prefixo_frio><chave>.gz, comprimido. A primeira leitura
+    (restaurar) ou uma nova assinatura do mesmo conteúdo os traz de volta.
+
+    Contadores e remoções de um SHA-256 passam pela trava do seu prefixo em
+    `diretorio_travas` (padrão: no diretório temporário, por armazenamento),
+    que vale para os processos de um host; com várias máquinas, aponte para
+    um diretório comum. Os bytes do original são gravados fora da trava:
+    mesmo SHA-256, mesmo conteúdo, e a gravação é um rename atômico.
+    """
+    def __init__(self, armazenamento, prefixo="originais/", prefixo_frio="frio/", diretorio_travas=None):
+        self.armazenamento = armazenamento
+        self.prefixo = prefixo
+        self.prefixo_frio = prefixo_frio
+        self._trava = TravasPorPrefixo(diretorio_travas or diretorio_travas_padrao(armazenamento))
+
+    def chave(self, sha256):
+        if self.armazenamento.fragmentado:
+            return f"{self.prefixo}{sha256}.pdf"
+        return f"{self.prefixo}{sha256[:2]}/{sha256}.pdf"
+
+    def chave_fria(self, sha256):
+        return f"{self.prefixo_frio}{self.chave(sha256)}.gz"
+
+    def chave_refs(self, sha256):
+        return self.chave(sha256)[:-len(".pdf")] + ".refs"
+
+    async def _contador(self, sha256):
+        # Valor do <sha>.refs; None sem contador
+        try:
+            return int((await self.armazenamento.ler(self.chave_refs(sha256))).decode("ascii").strip() or 0)
+        except (ObjetoNaoEncontrado, ValueError):
+            return None
+
+    async def referencias(self, sha256):
+        contador = await self._contador(sha256)
+        if contador is None:
+            # Original sem contador (gravado por fora): conta como uma referência
+            return 1 if await self.existe(sha256) else 0
+        return contador
+
+    async def _gravar_refs(self, sha256, quantidade):
+        await self.armazenamento.gravar(self.chave_refs(sha256), str(quantidade).encode("ascii"))
+
+    async def guardar(self, sha256, conteudo):
+        """Guarda o original (se ainda não existe) e soma uma referência. Retorna True se gravou bytes."""
+        # A referência é reservada sob a trava (curta): com ela, liberar() não apaga
+        # o original enquanto os bytes são gravados
+        async with self._trava(sha256):
+            contador = await self._contador(sha256)
+            if contador is None:
+                # Original sem contador (gravado por fora): conta como uma referência
+                contador = 1 if await self.existe(sha256) else 0
+            await self._gravar_refs(sha256, contador + 1)
+        # Fora da trava: gravações concorrentes do mesmo SHA-256 gravam os mesmos bytes
+        # (rename atômico). Novo, ou arquivado: o conteúdo recebido já é o original
+        gravou = False
+        try:
+            if not await self.armazenamento.existe(self.chave(sha256)):
+                await self.armazenamento.gravar(self.chave(sha256), conteudo)
+                gravou = True
+        except Exception:
+            await self.liberar(sha256)
+            raise
+        if await self.armazenamento.existe(self.chave_fria(sha256)):
+            async with self._trava(sha256):
+                if await self.armazenamento.existe(self.chave(sha256)):
+                    await self.armazenamento.remover(self.chave_fria(sha256))
+        return gravou
+
+    async def liberar(self, sha256):
+        """Remove uma referência; apaga o original quando não sobra nenhuma."""
+        async with self._trava(sha256):
+            restantes = await self.referencias(sha256) - 1
+            if restantes > 0:
+                await self._gravar_refs(sha256, restantes)
+                return restantes
+            await self.armazenamento.remover(self.chave(sha256))
+            await self.armazenamento.remover(self.chave_fria(sha256))
+            await self.armazenamento.remover(self.chave_refs(sha256))
+            return 0
+
+    async def remover(self, sha256):
+        """Apaga o original (quente e frio) e o contador, sem olhar as referências. Retorna os bytes liberados."""
+        liberados = 0
+        async with self._trava(sha256):
+            for chave in (self.chave(sha256), self.chave_fria(sha256), self.chave_refs(sha256)):
+                try:
+                    liberados += (await self.armazenamento.info(chave)).tamanho
+                except ObjetoNaoEncontrado:
+                    continue
+                await self.armazenamento.remover(chave)
+        return liberados
+
+    async def arquivar(self, sha256):
+        """Move o original para a camada fria. Retorna os bytes economizados (None se não estava quente)."""
+        async with self._trava(sha256):
+            try:
+                tamanho = (await self.armazenamento.info(self.chave(sha256))).tamanho
+            except ObjetoNaoEncontrado:
+                return None
+            comprimido = await self.armazenamento.gravar(
+                self.chave_fria(sha256), _comprimir(self.armazenamento.ler_faixa(self.chave(sha256)))
+            )
+            await self.armazenamento.remover(self.chave(sha256))
+            return tamanho - comprimido
+
+    async def restaurar(self, sha256):
+        """Garante o original na camada quente, descomprimindo se estiver arquivado. False se não existe."""
+        if await self.armazenamento.existe(self.chave(sha256)):
+            return True
+        async with self._trava(sha256):
+            if await self.armazenamento.existe(self.chave(sha256)):
+                return True
+            try:
+                await self.armazenamento.gravar(
+                    self.chave(sha256), _descomprimir(self.armazenamento.ler_faixa(self.chave_fria(sha256)))
+                )
+            except ObjetoNaoEncontrado:
+                return False
+            await self.armazenamento.remover(self.chave_fria(sha256))
+            return True
+
+    async def existe(self, sha256):
+        return await self.armazenamento.existe(self.chave(sha256)) or await self.armazenamento.existe(self.chave_fria(sha256))
@@ -0,0 +1,131 @@
+import asyncio
+import datetime
+import hashlib
+import io
+import secrets
+
+from armazenamento import ObjetoNaoEncontrado
+
+# Caixa em que a assinatura é desenhada no PDF (pontos) e resolução guardada
+LARGURA_ASSINATURA_PT = 150
+ALTURA_ASSINATURA_PT = 60
+PIXELS_POR_PONTO = 2
+# Imagens sem transparência: pixels mais claros que isto viram fundo
+LIMIAR_FUNDO = 240
+
+def _mascara_por_luminosidade(imagem):
+    # Tinta escura fica opaca, fundo claro transparente, com borda suave entre os dois
+    escuro = 64
+    tabela = [max(0, min(255, round((LIMIAR_FUNDO - v) * 255 / (LIMIAR_FUNDO - escuro)))) for v in range(256)]
+    return imagem.convert("L").point(tabela)
+
+def preparar_imagem_assinatura(dados):
+    """
+    Prepara uma imagem de assinatura (PNG do canvas, foto, etc.) para ser
+    embutida: recorta o espaço em branco, reduz para a resolução da caixa de
+    150x60 pt e deixa a máscara suave (canal alfa) pronta. Retorna a imagem
+    PIL em RGBA. ValueError se a imagem for inválida ou vazia.
+    """
+    from PIL import Image
+
+    try:
+        imagem = Image.open(io.BytesIO(dados))
+        imagem.load()
+    except Exception as e:
+        raise ValueError(f"Imagem de assinatura inválida: {e}")
+
+    transparente = imagem.mode in ("RGBA", "LA", "PA") or (imagem.mode == "P" and "transparency" in imagem.info)
+    imagem = imagem.convert("RGBA")
+    alfa = imagem.getchannel("A")
+    if not transparente or alfa.getextrema() == (255, 255):
+        # Sem transparência útil (ex.: canvas exportado com fundo branco)
+        alfa = _mascara_por_luminosidade(imagem)
+
+    caixa = alfa.point(lambda v: 255 if v > 8 else 0).getbbox()
+    if caixa is None:
+        raise ValueError("Imagem de assinatura vazia")
+    imagem = imagem.crop(caixa)
+    imagem.putalpha(alfa.crop(caixa))
+
+    # Só reduz: imagens menores que a caixa ficam como estão
+    imagem.thumbnail(
+        (LARGURA_ASSINATURA_PT * PIXELS_POR_PONTO, ALTURA_ASSINATURA_PT * PIXELS_POR_PONTO),
+        Image.LANCZOS
+    )
+    return imagem
+
+def normalizar_imagem_assinatura(dados):
+    """preparar_imagem_assinatura() em PNG: retorna (png, largura_px, altura_px)."""
+    imagem = preparar_imagem_assinatura(dados)
+    saida = io.BytesIO()
+    imagem.save(saida, format="PNG", optimize=True)
+    return saida.getvalue(), imagem.width, imagem.height
+
+PROJECAO_ASSINATURA = {"_id": 1, "nome": 1, "largura": 1, "altura": 1, "tamanho": 1, "criadoEm": 1}
+
+class BibliotecaAssinaturas:
+    """
+    Assinaturas salvas por usuário (e-mail). A imagem é normalizada uma vez, no
+    envio, e guardada em assinaturas/<id>.png no armazenamento; os metadados
+    ficam na coleção 'assinaturas_salvas'. O /assinar referencia a assinatura pelo id
+    em vez de reenviar e redecodificar a imagem a cada documento.
+    """
+    def __init__(self, obter_colecao, armazenamento, cache):
+        self._obter_colecao = obter_colecao
+        self.armazenamento = armazenamento
+        self._imagens = cache # CacheLRU id -> PNG normalizado
+
+    def chave(self, id_assinatura):
+        return f"assinaturas/{id_assinatura}.png"
+
+    async def salvar(self, email, dados, nome=None):
+        """Normaliza e guarda. A mesma imagem enviada de novo pelo usuário devolve a já salva."""
+        png, largura, altura = await asyncio.to_thread(normalizar_imagem_assinatura, dados)
+        sha256 = hashlib.sha256(png).hexdigest()
+        colecao = self._obter_colecao()
+
+        existente = await colecao.find_one({"email": email, "sha256": sha256}, projection=PROJECAO_ASSINATURA)
+        if existente:
+            return existente
+
+        documento = {
+            "_id": secrets.token_hex(16), # O id vai no /assinar: não pode ser adivinhável
+            "email": email,
+            "nome": nome or "Assinatura",
+            "sha256": sha256,
+            "largura": largura,
+            "altura": altura,
+            "tamanho": len(png),
+            "criadoEm": datetime.datetime.utcnow()
+        }
+        # Import local: os workers do motor de assinatura usam este módulo sem o pymongo
+        from pymongo.errors import DuplicateKeyError
+        await self.armazenamento.gravar(self.chave(documento["_id"]), png)
+        try:
+            await colecao.insert_one(documento)
+        except DuplicateKeyError:
+            # Mesmo envio concorrente: fica a que chegou primeiro
+            await self.armazenamento.remover(self.chave(documento["_id"]))
+            return await colecao.find_one({"email": email, "sha256": sha256}, projection=PROJECAO_ASSINATURA)
+        return {k: documento[k] for k in PROJECAO_ASSINATURA}
+
+    async def listar(self, email):
+        cursor = self._obter_colecao().find({"email": email}, projection=PROJECAO_ASSINATURA).sort("criadoEm", -1)
+        return await cursor.to_list(length=None)
+
+    async def imagem(self, id_assinatura):
+        """PNG normalizado da assinatura, ou None se não existe."""
+        async def carregar():
+            return await self.armazenamento.ler(self.chave(id_assinatura))
+        try:
+            return await self._imagens.obter_assincrono(id_assinatura, carregar)
+        except (ObjetoNaoEncontrado, ValueError):
+            return None
+
+    async def remover(self, id_assinatura, email):
+        resultado = await self._obter_colecao().delete_one({"_id": id_assinatura, "email": email})
+        if not resultado.deleted_count:
+            return False
+        self._imagens.remover(id_assinatura)
+        await self.armazenamento.remover(self.chave(id_assinatura))
+        return True
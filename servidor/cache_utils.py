@@ -0,0 +1,112 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
+import threading
+import time
+from collections import OrderedDict
+
+class CacheLRU:
+    """
+    Cache LRU limitado, seguro entre threads, com contadores de acerto/falha.
+    """
+    def __init__(self, tamanho_max: int = 32):
+        self.tamanho_max = max(1, int(tamanho_max))
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, gerar):
+        # Retorna o valor em cache ou gera (fora do lock) e guarda
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+
+        valor = gerar()
+
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+        return valor
+
+    async def obter_assincrono(self, chave, gerar):
+        # Como obter(), para geradores assíncronos (ex.: leitura do armazenamento)
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+
+        valor = await gerar()
+
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+        return valor
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def estatisticas(self) -> dict:
+        return {
+            "itens": len(self._itens),
+            "tamanho_max": self.tamanho_max,
+            "acertos": self.acertos,
+            "falhas": self.falhas
+        }
+
+class CacheNegativo:
+    """
+    Conjunto limitado de chaves com expiração curta (TTL, em segundos).
+    Usado para lembrar por pouco tempo que algo não existe.
+    """
+    def __init__(self, ttl: float = 30.0, tamanho_max: int = 10000):
+        self.ttl = float(ttl)
+        self.tamanho_max = max(1, int(tamanho_max))
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+
+    def contem(self, chave) -> bool:
+        agora = time.monotonic()
+        with self._lock:
+            expira = self._itens.get(chave)
+            if expira is None:
+                return False
+            if expira < agora:
+                del self._itens[chave]
+                return False
+            self.acertos += 1
+            return True
+
+    def adicionar(self, chave):
+        with self._lock:
+            self._itens[chave] = time.monotonic() + self.ttl
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def estatisticas(self) -> dict:
+        return {
+            "itens": len(self._itens),
+            "ttl": self.ttl,
+            "acertos": self.acertos
+        }
@@ -0,0 +1,99 @@
+import os
+import threading
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from cache_utils import CacheLRU
+
+DIRETORIO_FONTES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fontes")
+
+# Estilo escolhido no /assinar (campo 'fonte') -> fonte padrão do PDF, usada
+# quando o estilo não tem TTF configurada (ou o arquivo não existe)
+FONTES_PADRAO = {
+    "padrao": "Helvetica",
+    "serif": "Times-Roman",
+    "manuscrita": "Times-Italic",
+    "cursiva_simples": "Times-Italic",
+}
+
+# TTFs procuradas em FONTES_ASSINATURA_DIR quando FONTES_ASSINATURA não é definida
+ARQUIVOS_PADRAO = {
+    "manuscrita": "Caveat-Regular.ttf",
+    "cursiva_simples": "DancingScript-Regular.ttf",
+}
+
+def _cachear_subsets(fonte, cache):
+    # O reportlab já embute só os glifos usados em cada documento, mas gera o
+    # subset de novo a cada PDF. Os mesmos nomes se repetem muito: o subset
+    # pronto é reaproveitado. O lock protege o leitor da TTF, que não é
+    # seguro entre threads (motor com ASSINATURA_WORKERS=0).
+    face = fonte.face
+    gerar_subset = face.makeSubset
+    lock = threading.Lock()
+    def gerar(subset):
+        with lock:
+            return gerar_subset(subset)
+    face.makeSubset = lambda subset: cache.obter(tuple(subset), lambda: gerar(subset))
+
+class RegistroFontes:
+    """
+    Fontes das assinaturas por estilo. As TTFs são lidas e registradas no
+    reportlab uma vez por processo (as tabelas ficam em memória para todos os
+    PDFs); cada documento embute só o subset dos glifos que usa.
+    arquivos: {estilo: caminho da TTF}; caminhos relativos são buscados em diretorio.
+    """
+    def __init__(self, arquivos, diretorio=DIRETORIO_FONTES, tamanho_cache_subsets=128):
+        self.arquivos = dict(arquivos)
+        self.diretorio = diretorio
+        self.tamanho_cache_subsets = tamanho_cache_subsets
+        self.fontes = dict(FONTES_PADRAO)
+        self._ttfs = {} # caminho -> (nome registrado, cache de subsets)
+
+    @classmethod
+    def do_ambiente(cls):
+        # FONTES_ASSINATURA="manuscrita=Caveat-Regular.ttf,cursiva_simples=/opt/fontes/Dancing.ttf"
+        configuracao = os.getenv("FONTES_ASSINATURA")
+        arquivos = ARQUIVOS_PADRAO
+        if configuracao is not None:
+            arquivos = {}
+            for item in configuracao.split(","):
+                if "=" in item:
+                    estilo, caminho = item.split("=", 1)
+                    arquivos[estilo.strip()] = caminho.strip()
+        return cls(
+            arquivos,
+            diretorio=os.getenv("FONTES_ASSINATURA_DIR", DIRETORIO_FONTES),
+            tamanho_cache_subsets=int(os.getenv("FONTES_SUBSETS_CACHE_MAX", "128"))
+        )
+
+    def _registrar(self, caminho):
+        if caminho not in self._ttfs:
+            nome = "VerySing-" + os.path.splitext(os.path.basename(caminho))[0]
+            fonte = TTFont(nome, caminho)
+            cache = CacheLRU(self.tamanho_cache_subsets)
+            _cachear_subsets(fonte, cache)
+            pdfmetrics.registerFont(fonte)
+            self._ttfs[caminho] = (nome, cache)
+        return self._ttfs[caminho][0]
+
+    def carregar(self):
+        """Registra as TTFs configuradas. Estilos sem arquivo ficam na fonte padrão."""
+        for estilo, arquivo in self.arquivos.items():
+            caminho = arquivo if os.path.isabs(arquivo) else os.path.join(self.diretorio, arquivo)
+            if not os.path.exists(caminho):
+                continue
+            try:
+                self.fontes[estilo] = self._registrar(caminho)
+            except Exception as e:
+                print(f"⚠️ Fonte {caminho} inválida ({e}). Estilo '{estilo}' usa {self.fontes.get(estilo, 'Helvetica')}.")
+        return self
+
+    def fonte(self, estilo):
+        return self.fontes.get(estilo, FONTES_PADRAO["padrao"])
+
+    def estatisticas(self):
+        return {
+            "fontes": dict(self.fontes),
+            "ttfs": {nome: {"arquivo": caminho, "subsets": cache.estatisticas()} for caminho, (nome, cache) in self._ttfs.items()}
+        }
@@ -0,0 +1,155 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, utils
+
+class ChaveNaoEncontradaError(Exception):
+    pass
+
+def id_da_chave(chave_privada):
+    # ID estável: SHA-256 da chave pública (DER), 16 primeiros hex
+    publica = chave_privada.public_key().public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(publica).hexdigest()[:16]
+
+class GerenciadorChaves:
+    """
+    Carrega as chaves de assinatura uma única vez e as mantém em memória.
+
+    Fontes: variável PRIVATE_KEY_PEM, o arquivo principal e os *.pem de
+    diretorio_chaves (para rotação). Cada chave é identificada pelo id_da_chave.
+    A chave ativa é a do arquivo 'ativa' em diretorio_chaves (contendo o id),
+    ou a variável CHAVE_ATIVA, ou a chave principal.
+
+    Recarga a quente: a cada `intervalo` segundos as datas de modificação dos
+    arquivos são conferidas e as chaves alteradas são recarregadas.
+    """
+    def __init__(self, caminho_principal, diretorio_chaves=None, intervalo=5.0):
+        self.caminho_principal = caminho_principal
+        self.diretorio_chaves = diretorio_chaves
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._chaves = {}
+        self._assinatura_arquivos = None
+        self._proxima_verificacao = 0.0
+        self._id_principal = None
+        self._id_rotacionado = None # rotacionar() sem diretorio_chaves: vale só neste processo
+        self.id_ativo = None
+
+    def _arquivos(self):
+        arquivos = [self.caminho_principal]
+        if self.diretorio_chaves and os.path.isdir(self.diretorio_chaves):
+            arquivos += sorted(glob.glob(os.path.join(self.diretorio_chaves, "*.pem")))
+            arquivos.append(os.path.join(self.diretorio_chaves, "ativa"))
+        return arquivos
+
+    def _estado_arquivos(self):
+        estado = []
+        for caminho in self._arquivos():
+            try:
+                estado.append((caminho, os.stat(caminho).st_mtime_ns))
+            except FileNotFoundError:
+                pass
+        return tuple(estado)
+
+    def _carregar(self, estado):
+        chaves = {}
+        id_principal = None
+
+        pem_env = os.getenv("PRIVATE_KEY_PEM")
+        if pem_env:
+            # Corrige quebras de linha se vierem escapadas
+            chave = serialization.load_pem_private_key(pem_env.replace('\\n', '\n').encode('utf-8'), password=None)
+            id_principal = id_da_chave(chave)
+            chaves[id_principal] = chave
+
+        for caminho, _ in estado:
+            if not caminho.endswith(".pem"):
+                continue
+            with open(caminho, "rb") as arquivo_chave:
+                chave = serialization.load_pem_private_key(arquivo_chave.read(), password=None)
+            kid = id_da_chave(chave)
+            chaves[kid] = chave
+            if caminho == self.caminho_principal and id_principal is None:
+                id_principal = kid
+
+        id_ativo = self._id_rotacionado or os.getenv("CHAVE_ATIVA") or id_principal
+        if self.diretorio_chaves:
+            caminho_ativa = os.path.join(self.diretorio_chaves, "ativa")
+            if os.path.exists(caminho_ativa):
+                with open(caminho_ativa, "r", encoding="utf-8") as f:
+                    id_ativo = f.read().strip() or id_ativo
+
+        if id_ativo is None and chaves:
+            id_ativo = next(iter(chaves))
+
+        self._chaves = chaves
+        self._id_principal = id_principal
+        self.id_ativo = id_ativo
+        self._assinatura_arquivos = estado
+        print(f"🔑 Chaves de assinatura carregadas: {len(chaves)} (ativa: {id_ativo})")
+
+    def _garantir_carregado(self):
+        agora = time.monotonic()
+        if self._assinatura_arquivos is not None and agora < self._proxima_verificacao:
+            return
+        with self._lock:
+            estado = self._estado_arquivos()
+            if estado != self._assinatura_arquivos:
+                self._carregar(estado)
+            self._proxima_verificacao = agora + self.intervalo
+
+    def recarregar(self):
+        with self._lock:
+            self._carregar(self._estado_arquivos())
+            self._proxima_verificacao = time.monotonic() + self.intervalo
+
+    def rotacionar(self, kid):
+        """
+        Troca a chave ativa. Com diretorio_chaves, o id é gravado no arquivo
+        'ativa': vale para todos os workers e sobrevive às recargas.
+        """
+        self._garantir_carregado()
+        with self._lock:
+            if kid not in self._chaves:
+                raise ChaveNaoEncontradaError(f"Chave {kid} não carregada")
+            self._id_rotacionado = kid
+            if self.diretorio_chaves:
+                os.makedirs(self.diretorio_chaves, exist_ok=True)
+                fd, temporario = tempfile.mkstemp(dir=self.diretorio_chaves, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(kid + "\n")
+                os.replace(temporario, os.path.join(self.diretorio_chaves, "ativa"))
+            self.id_ativo = kid
+
+    def chave(self, kid=None):
+        self._garantir_carregado()
+        kid = kid or self.id_ativo
+        if kid not in self._chaves:
+            raise ChaveNaoEncontradaError("Chave de assinatura nao encontrada. Rode o script de seguranca.")
+        return self._chaves[kid]
+
+    def assinar_digest(self, digest, kid=None):
+        """
+        Assina um SHA-256 já calculado (modo Prehashed), equivalente a assinar
+        o conteúdo inteiro. Retorna (assinatura, id_da_chave).
+        """
+        self._garantir_carregado()
+        kid = kid or self.id_ativo
+        assinatura = self.chave(kid).sign(
+            digest,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+            utils.Prehashed(hashes.SHA256())
+        )
+        return assinatura, kid
+
+    def ids(self):
+        self._garantir_carregado()
+        return sorted(self._chaves)
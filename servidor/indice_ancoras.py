@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import time
+
+from armazenamento import fragmentos_da_chave
+from cache_utils import CacheLRU
+
+# Incrementar quando a lógica de detecção mudar, para ignorar entradas antigas
+VERSAO_ANCORAS = 1
+# Uso de uma entrada é marcado no disco (mtime) no máximo uma vez por intervalo
+INTERVALO_TOQUE_ANCORAS = 86400
+
+class IndiceAncoras:
+    """
+    Índice persistente das âncoras de assinatura (labels CONTRATANTE/CONTRATADA
+    e linhas ___) por SHA-256 do PDF original. Assinar de novo o mesmo modelo
+    pula a detecção. Um JSON pequeno por modelo em <diretorio>/ab/cd/, gravado
+    de forma atômica, para que os workers do motor de assinatura compartilhem o
+    índice. Entradas sem uso há muito tempo são apagadas por limpar() (o
+    varredor do armazenamento chama ao fim de cada ciclo).
+    """
+    def __init__(self, diretorio, tamanho_memoria=256):
+        self.diretorio = diretorio
+        self._memoria = CacheLRU(tamanho_memoria)
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, sha256):
+        return os.path.join(self.diretorio, *fragmentos_da_chave(sha256), f"{sha256}.json")
+
+    def _caminhos_leitura(self, sha256):
+        # Entradas anteriores à fragmentação ficam na raiz até expirar
+        return (self._caminho(sha256), os.path.join(self.diretorio, f"{sha256}.json"))
+
+    def _ler_disco(self, sha256):
+        for caminho in self._caminhos_leitura(sha256):
+            try:
+                with open(caminho, "r", encoding="utf-8") as f:
+                    entrada = json.load(f)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                return None
+            if entrada.get("versao") != VERSAO_ANCORAS:
+                return None
+            entrada["_caminho"] = caminho
+            entrada["_tocado"] = os.stat(caminho).st_mtime
+            return entrada
+        return None
+
+    def _tocar(self, entrada):
+        # Marca o uso no disco para limpar(); no máximo uma vez por intervalo
+        agora = time.time()
+        if agora - entrada["_tocado"] < INTERVALO_TOQUE_ANCORAS:
+            return
+        entrada["_tocado"] = agora
+        try:
+            os.utime(entrada["_caminho"])
+        except OSError:
+            pass
+
+    def obter(self, sha256):
+        """Retorna {'pagina': int, 'coords': dict} ou None se o modelo é desconhecido."""
+        entrada = self._memoria.obter(sha256, lambda: self._ler_disco(sha256))
+        if entrada is None:
+            # Não guarda a ausência: outro worker pode gravar a entrada depois
+            self._memoria.remover(sha256)
+            return None
+        self._tocar(entrada)
+        return entrada
+
+    def salvar(self, sha256, pagina, coords):
+        entrada = {"versao": VERSAO_ANCORAS, "pagina": pagina, "coords": coords}
+        destino = self._caminho(sha256)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entrada, f)
+            os.replace(temporario, destino)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        self._memoria.remover(sha256)
+        return entrada
+
+    def limpar(self, idade_maxima):
+        """Apaga as entradas sem uso há mais de idade_maxima segundos. Retorna quantas apagou."""
+        limite = time.time() - idade_maxima
+        removidas = 0
+        pastas = [self.diretorio]
+        while pastas:
+            with os.scandir(pastas.pop()) as entradas:
+                for entrada in entradas:
+                    if entrada.is_dir(follow_symlinks=False):
+                        pastas.append(entrada.path)
+                        continue
+                    try:
+                        if entrada.stat(follow_symlinks=False).st_mtime < limite:
+                            os.remove(entrada.path)
+                            removidas += 1
+                    except FileNotFoundError:
+                        continue
+        return removidas
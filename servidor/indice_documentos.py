@@ -0,0 +1,103 @@
+import re
+import urllib.parse
+
+from cache_utils import CacheLRU, CacheNegativo
+
+# IDs atuais são o SHA256 (hex) da assinatura; documentos antigos usavam o
+# base64 da assinatura como nome, por isso as variantes abaixo.
+_CARACTERES_VALIDOS = re.compile(r"^[A-Za-z0-9+=_\-]{1,700}$")
+_ID_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+def variantes_id(hash_recebido):
+    """Formas canônicas possíveis de um hash vindo da URL/QR Code, sem repetição."""
+    h = hash_recebido.strip()
+    candidatos = [
+        h,
+        h.replace(' ', '+'), # Correção comum de query param
+        h.replace('+', '-').replace('/', '_').rstrip('='), # URL Safe
+        urllib.parse.unquote(h) # Decoded
+    ]
+    vistos = []
+    for c in candidatos:
+        if c and c not in vistos and _CARACTERES_VALIDOS.match(c):
+            vistos.append(c)
+    return vistos
+
+class IndiceDocumentos:
+    """
+    Resolve hashes de validação para o ID do documento sem sondar o armazenamento.
+
+    - ids: índice em memória (carregado do Mongo na inicialização e
+      atualizado a cada nova assinatura)
+    - metadados: LRU com o JSON de validação já parseado
+    - negativo: hashes desconhecidos lembrados por alguns segundos, para
+      que bots testando hashes aleatórios não gerem trabalho no armazenamento
+
+    existe: função assíncrona (id -> bool) que confere o armazenamento
+    """
+    def __init__(self, existe, tamanho_metadados=1024, ttl_negativo=30.0):
+        self._existe = existe
+        self.ids = set()
+        self.carregado = False
+        self.metadados = CacheLRU(tamanho_metadados)
+        self.negativo = CacheNegativo(ttl_negativo)
+        self.sondagens_armazenamento = 0
+
+    def adicionar(self, id_documento):
+        self.ids.add(id_documento)
+        self.negativo.remover(id_documento)
+
+    def remover(self, id_documento):
+        self.ids.discard(id_documento)
+        self.metadados.remover(id_documento)
+
+    async def carregar_do_mongo(self, colecao):
+        # Só o campo 'hash' (ID curto) de cada documento
+        total = 0
+        async for doc in colecao.find({}, projection={"hash": 1, "_id": 0}):
+            if doc.get("hash"):
+                self.ids.add(doc["hash"])
+                total += 1
+        self.carregado = True
+        return total
+
+    async def carregar_do_armazenamento(self, armazenamento):
+        # Alternativa quando o Mongo não está disponível: os metadados {id}.json
+        total = 0
+        async for chave in armazenamento.listar(recursivo=False):
+            if chave.endswith(".json"):
+                self.ids.add(chave[:-5])
+                total += 1
+        self.carregado = True
+        return total
+
+    async def resolver(self, hash_recebido):
+        """Retorna o ID canônico do documento ou None. No máximo uma sondagem do armazenamento."""
+        candidatos = variantes_id(hash_recebido)
+        for c in candidatos:
+            if c in self.ids:
+                return c
+
+        if not candidatos:
+            return None
+        canonico = next((c for c in candidatos if _ID_HEX.match(c)), candidatos[0])
+        if self.negativo.contem(canonico):
+            return None
+
+        # Pode ter sido assinado por outro processo depois do carregamento
+        self.sondagens_armazenamento += 1
+        if await self._existe(canonico):
+            self.adicionar(canonico)
+            return canonico
+
+        self.negativo.adicionar(canonico)
+        return None
+
+    def estatisticas(self) -> dict:
+        return {
+            "ids": len(self.ids),
+            "carregado": self.carregado,
+            "sondagens_armazenamento": self.sondagens_armazenamento,
+            "metadados": self.metadados.estatisticas(),
+            "negativo": self.negativo.estatisticas()
+        }
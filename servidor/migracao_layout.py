@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+from armazenamento import ObjetoNaoEncontrado
+
+class MigracaoLayout:
+    """
+    Migração online do layout plano para o fragmentado (ab/cd/<nome>) de um
+    ArmazenamentoFragmentado com chaves_legado. Cada passo move uma página de
+    arquivos (rename, em thread); o cursor e os totais ficam em `chave_estado`,
+    então a migração continua de onde parou após reiniciar. Ao fim de uma
+    passada completa, as leituras deixam de procurar no layout plano.
+    """
+    def __init__(self, armazenamento, tamanho_lote=1000, chave_estado="migracao/estado.json"):
+        self.armazenamento = armazenamento
+        self.tamanho_lote = tamanho_lote
+        self.chave_estado = chave_estado
+        self.estado = None
+
+    async def carregar(self):
+        try:
+            self.estado = json.loads(await self.armazenamento.ler(self.chave_estado))
+        except (ObjetoNaoEncontrado, ValueError):
+            self.estado = {"cursor": None, "concluida": False, "movidos": 0, "bytes": 0, "inicio": None, "fim": None}
+        if self.estado["concluida"]:
+            self.armazenamento.legado = False
+        return self.estado
+
+    async def passo(self):
+        """Migra uma página. Retorna True quando a migração terminou."""
+        if self.estado is None:
+            await self.carregar()
+        if self.estado["concluida"]:
+            return True
+        if self.estado["inicio"] is None:
+            self.estado["inicio"] = time.time()
+        movidos, bytes_movidos, proximo = await asyncio.to_thread(
+            self.armazenamento.migrar_pagina, self.estado["cursor"], self.tamanho_lote
+        )
+        self.estado["movidos"] += movidos
+        self.estado["bytes"] += bytes_movidos
+        self.estado["cursor"] = proximo
+        if proximo is None:
+            self.estado["concluida"] = True
+            self.estado["fim"] = time.time()
+        await self.armazenamento.gravar(self.chave_estado, json.dumps(self.estado).encode("utf-8"))
+        if self.estado["concluida"]:
+            self.armazenamento.legado = False
+        return self.estado["concluida"]
+
+    async def executar(self, pausa=0.05):
+        """Laço em segundo plano até a migração terminar, com pausa entre as páginas."""
+        await self.carregar()
+        if self.estado["concluida"]:
+            return
+        print("📦 Migrando arquivos para o layout fragmentado (ab/cd/<nome>)...")
+        while True:
+            try:
+                if await self.passo():
+                    break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # O cursor só avança com a página migrada: ela é refeita depois
+                print(f"⚠️ Erro na migração do layout: {e}")
+            await asyncio.sleep(pausa)
+        print(f"✅ Migração do layout concluída: {self.estado['movidos']} arquivos ({self.estado['bytes'] / 2**20:.1f} MB)")
+
+    def estatisticas(self):
+        return dict(self.estado or {}, legado=self.armazenamento.legado, tamanho_lote=self.tamanho_lote)
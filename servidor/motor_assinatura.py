@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+class FilaCheiaError(Exception):
+    """A fila do motor de assinatura atingiu o limite configurado."""
+    pass
+
+class TempoEsgotadoError(Exception):
+    """Um job passou do tempo máximo permitido."""
+    pass
+
+class _Geracao:
+    # Um ProcessPoolExecutor e seus contadores. Ao ser aposentada, a geração
+    # não recebe novos jobs e é encerrada quando o último job ativo termina.
+    def __init__(self, workers, contexto):
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+        self.enviados = 0
+        self.ativos = 0
+        self.aposentada = False
+
+    def encerrar(self):
+        processos = list((getattr(self.executor, "_processes", None) or {}).values())
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        # Processos presos em job com tempo esgotado precisam ser finalizados
+        for processo in processos:
+            if processo.is_alive():
+                processo.terminate()
+
+class MotorAssinatura:
+    """
+    Executa o pipeline de CPU (assinatura RSA, carimbo e escrita do PDF) em um
+    pool de processos, fora do event loop.
+
+    - workers: tamanho do pool (0 = usa threads do loop, útil em desenvolvimento)
+    - fila_max: quantos jobs podem aguardar além dos que estão executando
+    - timeout: tempo máximo de cada job, em segundos
+    - jobs_por_worker: o pool é reciclado após workers * jobs_por_worker jobs
+      para limitar o crescimento de memória do pypdf
+
+    No contexto spawn cada worker importa o módulo da função enviada: ela deve
+    morar num módulo leve e sem efeitos no import (ver pipeline_assinatura.py).
+    """
+    def __init__(self, workers=2, fila_max=16, timeout=120.0, jobs_por_worker=50, contexto="spawn"):
+        self.workers = max(0, int(workers))
+        self.fila_max = max(0, int(fila_max))
+        self.timeout = float(timeout)
+        self.jobs_por_worker = max(1, int(jobs_por_worker))
+        self._contexto = multiprocessing.get_context(contexto)
+        self._geracao = None
+        self._lock = threading.Lock()
+        self.ativos = 0
+        self.concluidos = 0
+        self.falhas = 0
+        self.timeouts = 0
+        self.rejeitados = 0
+        self.reciclagens = 0
+
+    @classmethod
+    def do_ambiente(cls):
+        return cls(
+            workers=int(os.getenv("ASSINATURA_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            fila_max=int(os.getenv("ASSINATURA_FILA_MAX", "16")),
+            timeout=float(os.getenv("ASSINATURA_TIMEOUT", "120")),
+            jobs_por_worker=int(os.getenv("ASSINATURA_JOBS_POR_WORKER", "50")),
+            contexto=os.getenv("ASSINATURA_CONTEXTO", "spawn")
+        )
+
+    def _obter_geracao(self):
+        with self._lock:
+            g = self._geracao
+            if g is None or g.aposentada:
+                if g is not None:
+                    self.reciclagens += 1
+                g = _Geracao(self.workers, self._contexto)
+                self._geracao = g
+            g.enviados += 1
+            g.ativos += 1
+            if g.enviados >= self.workers * self.jobs_por_worker:
+                g.aposentada = True
+            return g
+
+    def _liberar_geracao(self, g):
+        with self._lock:
+            g.ativos -= 1
+            encerrar = g.aposentada and g.ativos == 0
+        if encerrar:
+            g.encerrar()
+
+    @property
+    def capacidade(self):
+        return max(1, self.workers) + self.fila_max
+
+    async def executar(self, funcao, *args):
+        # funcao e args precisam ser serializáveis (pickle) para ir ao worker
+        if self.ativos >= self.capacidade:
+            self.rejeitados += 1
+            raise FilaCheiaError("Fila de assinatura cheia, tente novamente em instantes.")
+
+        self.ativos += 1
+        g = None
+        try:
+            if self.workers == 0:
+                futuro = asyncio.to_thread(funcao, *args)
+            else:
+                g = self._obter_geracao()
+                futuro = asyncio.wrap_future(g.executor.submit(funcao, *args))
+            resultado = await asyncio.wait_for(futuro, self.timeout)
+            self.concluidos += 1
+            return resultado
+        except asyncio.TimeoutError:
+            # O processo continua preso no job: aposenta a geração para
+            # que seja finalizada quando os outros jobs dela terminarem
+            self.timeouts += 1
+            if g is not None:
+                g.aposentada = True
+            raise TempoEsgotadoError(f"Job excedeu {self.timeout:.0f}s")
+        except Exception:
+            self.falhas += 1
+            raise
+        finally:
+            self.ativos -= 1
+            if g is not None:
+                self._liberar_geracao(g)
+
+    def estatisticas(self) -> dict:
+        return {
+            "workers": self.workers,
+            "fila_max": self.fila_max,
+            "timeout": self.timeout,
+            "jobs_por_worker": self.jobs_por_worker,
+            "em_execucao": min(self.ativos, max(1, self.workers)),
+            "na_fila": max(0, self.ativos - max(1, self.workers)),
+            "concluidos": self.concluidos,
+            "falhas": self.falhas,
+            "timeouts": self.timeouts,
+            "rejeitados": self.rejeitados,
+            "reciclagens": self.reciclagens
+        }
+
+    def encerrar(self):
+        with self._lock:
+            g, self._geracao = self._geracao, None
+        if g is not None:
+            g.encerrar()
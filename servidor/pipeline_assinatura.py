@@ -0,0 +1,830 @@
+"""
+Pipeline de CPU do /assinar (assinatura RSA, carimbo visual e escrita do PDF),
+separado de principal.py para que os workers do motor_assinatura (contexto
+spawn) importem só isto: sem cliente do MongoDB, app, armazenamento, varredor
+nem logs de inicialização. Chaves, fontes e o índice de âncoras são carregados
+uma vez por processo.
+"""
+import base64
+import datetime
+import hashlib
+import io
+import os
+import re
+import shutil
+import threading
+import time
+try:
+    import resource # Só Unix: pico de memória dos workers de assinatura
+except ImportError:
+    resource = None
+
+import qrcode
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from pypdf import PdfReader, PdfWriter, PageObject
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject, StreamObject
+
+from cache_utils import CacheLRU
+from indice_ancoras import IndiceAncoras
+from gerenciador_chaves import GerenciadorChaves
+from biblioteca_assinaturas import preparar_imagem_assinatura
+from fontes_assinatura import RegistroFontes
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CAMINHO_CHAVE_PRIVADA = "chave_privada_assinatura.pem"
+TAMANHO_CHUNK_LEITURA = 1024 * 1024
+
+# Âncoras de assinatura já detectadas, por SHA-256 do PDF original. Entradas sem
+# uso há ANCORAS_DIAS dias são apagadas pelo varredor do armazenamento (principal.py)
+DIRETORIO_ANCORAS = os.path.join(BASE_DIR, "ancoras")
+indice_ancoras = IndiceAncoras(DIRETORIO_ANCORAS)
+
+# Chaves carregadas uma vez por processo, com recarga a quente e rotação
+# (chaves extras em CHAVES_DIR, id da ativa no arquivo CHAVES_DIR/ativa)
+gerenciador_chaves = GerenciadorChaves(
+    CAMINHO_CHAVE_PRIVADA,
+    diretorio_chaves=os.getenv("CHAVES_DIR", "chaves")
+)
+
+def carregar_chave_privada():
+    return gerenciador_chaves.chave()
+
+# Funções para gerar o visual do PDF
+def _desenhar_base_carimbo(c, width):
+    # Parte estática do rodapé: fundo, logo e texto legal
+    # Configuração do Rodapé (Fundo cinza claro)
+    footer_height = 45
+    c.setFillColorRGB(0.96, 0.96, 0.96)
+    c.rect(0, 0, width, footer_height, fill=1, stroke=0)
+    
+    # Logo Simulado (Azul)
+    c.setFillColorRGB(0.2, 0.4, 0.8)
+    c.circle(30, 22, 12, fill=1, stroke=0)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(26, 17, "a")
+    
+    # Textos Legais
+    c.setFillColorRGB(0.2, 0.2, 0.2)
+    c.setFont("Helvetica-Bold", 8)
+    c.drawString(55, 28, "Assinado com Assinatura Eletrônica (Lei 14.063/2020)")
+
+def _gerar_qr_carimbo_png(link_validacao):
+    # QR Code (mantém o link completo funcional)
+    qr = qrcode.QRCode(box_size=2, border=0)
+    qr.add_data(link_validacao)
+    qr.make(fit=True)
+    img_qr = qr.make_image(fill_color="black", back_color="white")
+    
+    qr_bytes = io.BytesIO()
+    img_qr.save(qr_bytes, format='PNG')
+    return qr_bytes.getvalue()
+
+def _desenhar_dados_carimbo(c, hash_doc, link_validacao, width, qr_png):
+    # Parte variável do rodapé: hash, link e QR Code do documento
+    c.setFillColorRGB(0.2, 0.2, 0.2)
+    c.setFont("Helvetica", 6)
+    c.drawString(55, 18, f"Hash SHA256: {hash_doc[:24]}...")
+    
+    # Rótulo curto e clicável (sem URL exibida)
+    texto_link = "Verificar online"
+    c.drawString(55, 8, texto_link)
+    try:
+        tw = stringWidth(texto_link, "Helvetica", 6)
+        c.linkURL(link_validacao, (55, 6, 55 + tw, 12), relative=1)
+    except:
+        pass
+    
+    # QR Code + área clicável
+    qr_x, qr_y, qr_w, qr_h = width - 55, 5, 35, 35
+    c.drawImage(ImageReader(io.BytesIO(qr_png)), qr_x, qr_y, width=qr_w, height=qr_h)
+    c.linkURL(link_validacao, (qr_x, qr_y, qr_x + qr_w, qr_y + qr_h), relative=1)
+
+def gerar_carimbo_pdf(hash_doc, link_validacao, width, height):
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=(width, height))
+    
+    _desenhar_base_carimbo(c, width)
+    _desenhar_dados_carimbo(c, hash_doc, link_validacao, width, _gerar_qr_carimbo_png(link_validacao))
+    
+    c.save()
+    packet.seek(0)
+    return packet
+
+# --- Cache do carimbo de rodapé ---
+# A parte estática (fundo, logo, texto legal) só depende do tamanho da página,
+# então fica num LRU global do processo. A parte variável (hash, link, QR) é
+# renderizada uma vez por documento para cada tamanho de página distinto.
+# Os contadores globais valem para este processo (jobs em threads com
+# ASSINATURA_WORKERS=0); os de cada job voltam na telemetria e são somados
+# nas métricas do processo principal.
+CARIMBO_CACHE_MAX = int(os.getenv("CARIMBO_CACHE_MAX", "32"))
+
+_cache_base_carimbo = CacheLRU(CARIMBO_CACHE_MAX)
+_contadores_carimbo = {"acertos": 0, "falhas": 0}
+_trava_contadores_carimbo = threading.Lock()
+
+def _contar_carimbo(resultado):
+    with _trava_contadores_carimbo:
+        _contadores_carimbo[resultado] += 1
+
+def _chave_tamanho(width, height):
+    return (round(float(width), 2), round(float(height), 2))
+
+def _gerar_base_carimbo(width, height):
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=(width, height))
+    _desenhar_base_carimbo(c, width)
+    c.save()
+    packet.seek(0)
+    return PdfReader(packet).pages[0]
+
+class CacheCarimbo:
+    """
+    Carimbos de rodapé já prontos de um documento.
+    Chave: (hash, link, largura, altura) -> página do carimbo pronta para merge.
+    """
+    def __init__(self):
+        self._paginas = {}
+        self._qr_png = {}
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, hash_doc, link_validacao, width, height):
+        chave = (hash_doc, link_validacao) + _chave_tamanho(width, height)
+        pagina = self._paginas.get(chave)
+        if pagina is not None:
+            self.acertos += 1
+            _contar_carimbo("acertos")
+            return pagina
+
+        self.falhas += 1
+        _contar_carimbo("falhas")
+
+        if link_validacao not in self._qr_png:
+            self._qr_png[link_validacao] = _gerar_qr_carimbo_png(link_validacao)
+
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=(width, height))
+        _desenhar_dados_carimbo(c, hash_doc, link_validacao, width, self._qr_png[link_validacao])
+        c.save()
+        packet.seek(0)
+
+        base = _cache_base_carimbo.obter(
+            _chave_tamanho(width, height),
+            lambda: _gerar_base_carimbo(width, height)
+        )
+        pagina = PageObject.create_blank_page(width=width, height=height)
+        pagina.merge_page(base)
+        pagina.merge_page(PdfReader(packet).pages[0])
+
+        self._paginas[chave] = pagina
+        return pagina
+
+# Compressão dos content streams no PDF final (zlib, 0-9)
+PDF_NIVEL_COMPRESSAO = int(os.getenv("PDF_NIVEL_COMPRESSAO", "6"))
+
+# Escrita do PDF assinado: "reescrita" (documento regravado e comprimido) ou
+# "incremental" (atualização incremental anexada ao original, que fica intacto)
+PDF_MODO_ESCRITA = os.getenv("PDF_MODO_ESCRITA", "reescrita")
+
+def _copiar_dicionario(dicionario):
+    # Cópia rasa mantendo as referências indiretas (não resolve os objetos)
+    copia = DictionaryObject()
+    if dicionario is not None:
+        for chave in dicionario:
+            copia[NameObject(chave)] = dicionario.raw_get(chave)
+    return copia
+
+def _recursos_da_pagina(pagina):
+    # /Resources pode ser herdado do nó /Pages: copia para a página antes de alterar
+    if "/Resources" in pagina:
+        return pagina["/Resources"]
+    no = pagina.get("/Parent")
+    herdado = None
+    while no is not None and herdado is None:
+        no = no.get_object()
+        herdado = no.get("/Resources")
+        no = no.get("/Parent")
+    recursos = _copiar_dicionario(herdado.get_object() if herdado is not None else None)
+    pagina[NameObject("/Resources")] = recursos
+    return recursos
+
+class CarimboCompartilhado:
+    """
+    Carimbo de rodapé como form XObject compartilhado no PdfWriter: o desenho
+    (fundo, textos, QR) é gravado uma vez por tamanho de página e cada página
+    só o referencia com "/VSCarimbo Do". Os links são copiados por página,
+    pois anotações pertencem a uma página só.
+
+    Os content streams originais não são reescritos: /Contents da página vira
+    [q, conteúdo original..., Q q /Nome Do Q], com os streams de abertura e de
+    chamada compartilhados. Assim o mesmo código serve à atualização incremental.
+    """
+    def __init__(self, escritor, cache_carimbo=None):
+        self.escritor = escritor
+        self.cache = cache_carimbo or CacheCarimbo()
+        self._formularios = {}
+        self._abertura = None
+        self._sobreposicoes = 0
+
+    def _adicionar_stream(self, dados):
+        stream = DecodedStreamObject()
+        stream.set_data(dados)
+        return self.escritor._add_object(stream)
+
+    def criar_formulario(self, modelo, width, height):
+        """Converte uma página (ex.: gerada pelo reportlab) em form XObject do escritor."""
+        formulario = DecodedStreamObject()
+        formulario.set_data(modelo.get_contents().get_data())
+        formulario.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+            NameObject("/Resources"): modelo["/Resources"].clone(self.escritor),
+        })
+        return self.escritor._add_object(formulario.flate_encode(PDF_NIVEL_COMPRESSAO))
+
+    def _chamada(self, nome, origem=(0, 0)):
+        deslocamento = b"" if origem == (0, 0) else f"1 0 0 1 {origem[0]:g} {origem[1]:g} cm ".encode()
+        return self._adicionar_stream(b"\nQ\nq " + deslocamento + nome.encode() + b" Do Q\n")
+
+    def incluir(self, pagina, nome, referencia, chamada=None, origem=(0, 0)):
+        """Desenha o form XObject por cima do conteúdo da página, sem reescrevê-lo."""
+        recursos = _recursos_da_pagina(pagina)
+        xobjects = recursos.get("/XObject")
+        xobjects = _copiar_dicionario(xobjects.get_object() if xobjects is not None else None)
+        if nome in xobjects and xobjects.raw_get(nome) != referencia:
+            # Nome já usado pelo documento: escolhe outro (e uma chamada própria)
+            n = 1
+            while f"{nome}_{n}" in xobjects:
+                n += 1
+            nome = NameObject(f"{nome}_{n}")
+            chamada = None
+        xobjects[nome] = referencia
+        recursos[NameObject("/XObject")] = xobjects
+
+        if chamada is None or origem != (0, 0):
+            chamada = self._chamada(nome, origem)
+        if self._abertura is None:
+            self._abertura = self._adicionar_stream(b"q\n")
+
+        conteudo = pagina.raw_get("/Contents") if "/Contents" in pagina else None
+        if isinstance(conteudo, IndirectObject) and isinstance(conteudo.get_object(), ArrayObject):
+            partes = list(conteudo.get_object())
+        elif isinstance(conteudo, ArrayObject):
+            partes = list(conteudo)
+        elif isinstance(conteudo, StreamObject):
+            partes = [self.escritor._add_object(conteudo)]
+        elif conteudo is not None:
+            partes = [conteudo]
+        else:
+            partes = []
+        pagina[NameObject("/Contents")] = ArrayObject([self._abertura] + partes + [chamada])
+
+    def _formulario(self, hash_doc, link_validacao, width, height):
+        chave = _chave_tamanho(width, height)
+        entrada = self._formularios.get(chave)
+        if entrada is not None:
+            return entrada
+
+        modelo = self.cache.obter(hash_doc, link_validacao, width, height)
+        nome = NameObject(f"/VSCarimbo{len(self._formularios)}")
+        referencia = self.criar_formulario(modelo, width, height)
+        anotacoes = [a.get_object() for a in modelo.get("/Annots", [])]
+        entrada = (nome, referencia, self._chamada(nome), anotacoes)
+        self._formularios[chave] = entrada
+        return entrada
+
+    def aplicar(self, pagina, hash_doc, link_validacao, width, height, origem=(0, 0)):
+        """Aplica o carimbo numa página que já está no escritor."""
+        nome, referencia, chamada, anotacoes = self._formulario(hash_doc, link_validacao, width, height)
+        self.incluir(pagina, nome, referencia, chamada, origem)
+
+        if anotacoes:
+            links = pagina.get("/Annots")
+            links = ArrayObject(links.get_object()) if links is not None else ArrayObject()
+            for anotacao in anotacoes:
+                copia = anotacao.clone(self.escritor, force_duplicate=True)
+                if origem != (0, 0):
+                    x1, y1, x2, y2 = [float(v) for v in copia["/Rect"]]
+                    copia[NameObject("/Rect")] = ArrayObject([
+                        FloatObject(x1 + origem[0]), FloatObject(y1 + origem[1]),
+                        FloatObject(x2 + origem[0]), FloatObject(y2 + origem[1])
+                    ])
+                links.append(self.escritor._add_object(copia))
+            pagina[NameObject("/Annots")] = links
+
+    def sobrepor(self, pagina, modelo, width, height, origem=(0, 0)):
+        """Sobrepõe uma página avulsa (ex.: assinaturas) como form XObject próprio."""
+        nome = NameObject(f"/VSSobreposicao{self._sobreposicoes}")
+        self._sobreposicoes += 1
+        self.incluir(pagina, nome, self.criar_formulario(modelo, width, height), origem=origem)
+
+def finalizar_escritor(escritor):
+    """Comprime os content streams e remove objetos idênticos/órfãos antes de gravar."""
+    for pagina in escritor.pages:
+        pagina.compress_content_streams(PDF_NIVEL_COMPRESSAO)
+    escritor.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+def estatisticas_cache_carimbo():
+    """Contadores de acerto/falha do cache de carimbos deste processo (por documento e base global)."""
+    with _trava_contadores_carimbo:
+        carimbos = dict(_contadores_carimbo)
+    return {
+        "carimbos": carimbos,
+        "base": _cache_base_carimbo.estatisticas()
+    }
+
+def _registrar_texto_ancora(coords, text, x, y):
+    if not text or not text.strip():
+        return
+    # Remove pontuação e deixa maiúsculo para comparação robusta
+    curr_text = text.strip().upper().replace(':', '').replace('.', '')
+    
+    # 1. Detecta Labels de Texto
+    if "CONTRATANTE" in curr_text:
+        coords['contratante'] = (x, y)
+    elif "CONTRATADA" in curr_text:
+        coords['contratada'] = (x, y)
+    
+    # 2. Detecta Linhas de Assinatura (Sublinhados)
+    # Procura por sequências de pelo menos 3 underscores
+    if "___" in text:
+        coords.setdefault('linhas', []).append((x, y))
+
+def _texto_operando(operando):
+    if isinstance(operando, str):
+        return operando
+    if isinstance(operando, bytes):
+        return operando.decode('latin-1')
+    return ""
+
+def _pagina_tem_fonte_composta(page):
+    # Fontes Type0 (CID) usam códigos de 2 bytes: o texto cru não é legível
+    try:
+        fontes = page["/Resources"].get_object().get("/Font")
+        if fontes is None:
+            return False
+        for fonte in fontes.get_object().values():
+            if fonte.get_object().get("/Subtype") == "/Type0":
+                return True
+    except Exception:
+        return True
+    return False
+
+# Texto em hex (<5F5F5F>) não aparece literal no stream
+_TEXTO_HEX = re.compile(rb"<[0-9A-Fa-f\s]+>\s*(Tj|')|\[[^\]]*<[0-9A-Fa-f\s]+>[^\]]*\]\s*TJ")
+
+def encontrar_coordenadas_assinatura(page):
+    """
+    Busca coordenadas das palavras chaves para posicionamento inteligente.
+    Retorna dict: {'contratante': (x, y), 'contratada': (x, y), 'linhas': [(x, y), ...]}
+    
+    Lê direto os operadores de texto do content stream (sem extract_text).
+    Páginas sem nenhum indício de âncora no stream são descartadas sem parse.
+    """
+    coords = {}
+    
+    try:
+        if _pagina_tem_fonte_composta(page):
+            return _encontrar_coordenadas_extract_text(page)
+        
+        conteudo = page.get_contents()
+        if conteudo is None:
+            return coords
+        
+        # Saída antecipada: nenhum label, sublinhado ou texto em hex no stream
+        dados = conteudo.get_data()
+        dados_maiusculos = dados.upper()
+        tem_label = b"CONTRATANTE" in dados_maiusculos or b"CONTRATADA" in dados_maiusculos
+        if not tem_label and b"___" not in dados and not _TEXTO_HEX.search(dados):
+            return coords
+        
+        identidade = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        tlm = identidade
+        entrelinha = 0.0
+        
+        def mover(tx, ty):
+            a, b, c, d, e, f = tlm
+            return [a, b, c, d, tx * a + ty * c + e, tx * b + ty * d + f]
+        
+        for operandos, operador in conteudo.operations:
+            if operador == b"BT":
+                tlm = identidade
+            elif operador == b"Tm":
+                tlm = [float(v) for v in operandos]
+            elif operador in (b"Td", b"TD"):
+                tx, ty = float(operandos[0]), float(operandos[1])
+                tlm = mover(tx, ty)
+                if operador == b"TD":
+                    entrelinha = -ty
+            elif operador == b"TL":
+                entrelinha = float(operandos[0])
+            elif operador == b"T*":
+                tlm = mover(0, -entrelinha)
+            elif operador == b"Tj":
+                _registrar_texto_ancora(coords, _texto_operando(operandos[0]), tlm[4], tlm[5])
+            elif operador == b"'":
+                tlm = mover(0, -entrelinha)
+                _registrar_texto_ancora(coords, _texto_operando(operandos[0]), tlm[4], tlm[5])
+            elif operador == b'"':
+                tlm = mover(0, -entrelinha)
+                _registrar_texto_ancora(coords, _texto_operando(operandos[2]), tlm[4], tlm[5])
+            elif operador == b"TJ":
+                texto = "".join(_texto_operando(item) for item in operandos[0])
+                _registrar_texto_ancora(coords, texto, tlm[4], tlm[5])
+    except Exception as e:
+        print(f"Erro na leitura do content stream (ignorado): {e}")
+        
+    return coords
+
+def _encontrar_coordenadas_extract_text(page):
+    # Caminho lento (fontes compostas): usa a extração de texto do pypdf
+    coords = {}
+    
+    def visitor_body(text, cm, tm, fontDict, fontSize):
+        _registrar_texto_ancora(coords, text, tm[4], tm[5])
+    
+    try:
+        page.extract_text(visitor_text=visitor_body)
+    except Exception as e:
+        print(f"Erro na extração de texto (ignorado): {e}")
+        
+    return coords
+
+def localizar_ancoras_assinatura(leitor, sha256_original):
+    """
+    Página e coordenadas das âncoras de assinatura (verifica as últimas 3 páginas).
+    Retorna (indice_pagina, coords) ou (-1, None). Usa o índice persistente
+    por SHA-256 do PDF original para pular a detecção em modelos já vistos.
+    """
+    entrada = indice_ancoras.obter(sha256_original)
+    if entrada is not None:
+        print(f"📌 Âncoras do modelo já conhecidas (página {entrada['pagina'] + 1})")
+        coords = entrada["coords"]
+        if coords:
+            coords = {k: (tuple(v) if k != 'linhas' else [tuple(p) for p in v]) for k, v in coords.items()}
+        return entrada["pagina"], coords
+    
+    coords_encontradas = None
+    indice_pagina_assinatura = -1
+    
+    # Verifica últimas 3 páginas (ou menos se documento for pequeno)
+    total_paginas = len(leitor.pages)
+    range_busca = range(total_paginas - 1, max(-1, total_paginas - 4), -1)
+    
+    for i in range_busca:
+        coords = encontrar_coordenadas_assinatura(leitor.pages[i])
+        if coords:
+            coords_encontradas = coords
+            indice_pagina_assinatura = i
+            print(f"✅ Encontrado na página {i+1}!")
+            break
+    
+    try:
+        indice_ancoras.salvar(sha256_original, indice_pagina_assinatura, coords_encontradas)
+    except Exception as e:
+        print(f"⚠️ Erro ao salvar índice de âncoras (não crítico): {e}")
+    return indice_pagina_assinatura, coords_encontradas
+
+# Fontes das assinaturas: registradas uma vez por processo (inclusive nos
+# workers do motor), configuráveis por FONTES_ASSINATURA e FONTES_ASSINATURA_DIR
+registro_fontes = RegistroFontes.do_ambiente().carregar()
+
+# Imagens de assinatura decodificadas, por SHA-256 dos bytes: um lote com
+# as mesmas imagens decodifica cada uma só uma vez por processo
+_cache_imagens_assinatura = CacheLRU(int(os.getenv("IMAGENS_ASSINATURA_CACHE_MAX", "16")))
+
+def ler_imagem_assinatura(dados_imagem):
+    # Recortada, reduzida para a caixa de 150x60 pt e com a máscara pronta (ver
+    # biblioteca_assinaturas.py); imagens da biblioteca já chegam assim
+    chave = hashlib.sha256(dados_imagem).hexdigest()
+    return _cache_imagens_assinatura.obter(chave, lambda: ImageReader(preparar_imagem_assinatura(dados_imagem)))
+
+def gerar_pagina_assinaturas(nome_contratante, nome_contratada, fonte, width, height, img_contratante=None, img_contratada=None, eh_nova_pagina=False, pos_contratante=None, pos_contratada=None):
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=(width, height))
+    
+    # Seleção de Fonte (TTFs manuscritas do registro_fontes, se configuradas)
+    font_name = registro_fontes.fonte(fonte)
+    c.setFont(font_name, 22)
+    
+    # --- Configuração de Posições ---
+    
+    # Posições padrão (se não houver coordenadas detectadas)
+    x_esq_padrao = width * 0.25
+    y_padrao = height / 2 - 50 if eh_nova_pagina else 85
+    x_dir_padrao = width * 0.75
+    
+    # Define posição final (Prioridade: Posição passada > Padrão)
+    x_ct, y_ct = pos_contratante if pos_contratante else (x_esq_padrao, y_padrao)
+    x_cd, y_cd = pos_contratada if pos_contratada else (x_dir_padrao, y_padrao)
+
+    # --- Desenho da Estrutura (Apenas se for página nova gerada pelo sistema) ---
+    if eh_nova_pagina:
+        # Título
+        c.setFont("Helvetica-Bold", 14)
+        c.drawCentredString(width / 2, height - 100, "PÁGINA DE ASSINATURAS")
+        c.setFont("Helvetica", 10)
+        c.drawCentredString(width / 2, height - 130, "Este documento foi assinado digitalmente conforme Lei 14.063/2020")
+        
+        # Linhas e legendas (apenas se for nova página)
+        c.setLineWidth(1)
+        # Contratante
+        c.line(x_ct - 75, y_ct - 10, x_ct + 75, y_ct - 10)
+        c.drawCentredString(x_ct, y_ct - 25, "CONTRATANTE")
+        # Contratada
+        c.line(x_cd - 75, y_cd - 10, x_cd + 75, y_cd - 10)
+        c.drawCentredString(x_cd, y_cd - 25, "CONTRATADA")
+
+    # --- Inserção das Assinaturas/Nomes ---
+    
+    # Data da assinatura
+    data_assinatura = datetime.datetime.now().strftime("%d/%m/%Y")
+    c.setFont("Helvetica", 8)
+
+    # Contratante
+    if img_contratante:
+        try:
+            img = ler_imagem_assinatura(img_contratante)
+            # Desenha centralizado no ponto X,Y definido
+            c.drawImage(img, x_ct - 75, y_ct, width=150, height=60, mask='auto', preserveAspectRatio=True, anchor='c')
+            # Data abaixo da imagem
+            c.drawCentredString(x_ct, y_ct - 10, f"Assinado em {data_assinatura}")
+        except Exception as e:
+            print(f"Erro img contratante: {e}")
+    elif nome_contratante:
+        c.setFont(font_name, 22)
+        c.drawCentredString(x_ct, y_ct, nome_contratante)
+        # Data abaixo do nome
+        c.setFont("Helvetica", 8)
+        c.drawCentredString(x_ct, y_ct - 10, f"Assinado em {data_assinatura}")
+        
+    # Contratada
+    if img_contratada:
+        try:
+            img = ler_imagem_assinatura(img_contratada)
+            c.drawImage(img, x_cd - 75, y_cd, width=150, height=60, mask='auto', preserveAspectRatio=True, anchor='c')
+            # Data abaixo da imagem
+            c.drawCentredString(x_cd, y_cd - 10, f"Assinado em {data_assinatura}")
+        except Exception as e:
+            print(f"Erro img contratada: {e}")
+    elif nome_contratada:
+        c.setFont(font_name, 22)
+        c.drawCentredString(x_cd, y_cd, nome_contratada)
+        # Data abaixo do nome
+        c.setFont("Helvetica", 8)
+        c.drawCentredString(x_cd, y_cd - 10, f"Assinado em {data_assinatura}")
+
+    c.save()
+    packet.seek(0)
+    return packet
+
+
+def _posicoes_assinatura(coords_encontradas):
+    # Lógica de Decisão de Posição:
+    # 1. Se achou 'linhas' (____), usa elas com prioridade (1ª=Contratante, 2ª=Contratada)
+    # 2. Se não achou linhas, mas achou labels, usa labels.
+    
+    pos_ct = None
+    pos_cd = None
+    
+    linhas = coords_encontradas.get('linhas', [])
+    if linhas:
+        # Ordena linhas por Y decrescente (Topo -> Base)
+        # Assumindo que a primeira linha é Contratante e segunda é Contratada
+        linhas.sort(key=lambda k: k[1], reverse=True)
+        
+        if len(linhas) >= 1:
+            # Assinatura EM CIMA da linha (+10)
+            pos_ct = (linhas[0][0] + 50, linhas[0][1] + 10) 
+            print(f"   -> Contratante na Linha 1: {pos_ct}")
+        
+        if len(linhas) >= 2:
+            pos_cd = (linhas[1][0] + 50, linhas[1][1] + 10)
+            print(f"   -> Contratada na Linha 2: {pos_cd}")
+    
+    # Fallback para Labels se não definiu por linhas
+    if not pos_ct and 'contratante' in coords_encontradas:
+        # Assinatura ABAIXO do label (-50)
+        pos_ct = (coords_encontradas['contratante'][0] + 40, coords_encontradas['contratante'][1] - 50)
+        print(f"   -> Contratante no Label: {pos_ct}")
+        
+    if not pos_cd and 'contratada' in coords_encontradas:
+        pos_cd = (coords_encontradas['contratada'][0] + 40, coords_encontradas['contratada'][1] - 50)
+        print(f"   -> Contratada no Label: {pos_cd}")
+    return pos_ct, pos_cd
+
+def _origem_pagina(pagina):
+    return (float(pagina.mediabox.left), float(pagina.mediabox.bottom))
+
+def aplicar_assinatura_visual(pdf_bytes, id_documento, hash_visual, nome_contratante="", nome_contratada="", fonte="padrao", img_contratante=None, img_contratada=None, telemetria=None, incremental=None, saida=None, sha256_original=None):
+    # pdf_bytes: bytes do PDF ou caminho de um arquivo (lido sob demanda, sem carregar inteiro)
+    # telemetria (opcional): recebe 'paginas' carimbadas, o 'modo' de assinatura e a 'escrita'
+    # incremental (opcional): força o modo de escrita; padrão vem de PDF_MODO_ESCRITA
+    # saida (opcional): arquivo aberto onde o PDF é escrito direto; padrão é um BytesIO novo
+    if telemetria is None:
+        telemetria = {}
+    if incremental is None:
+        incremental = PDF_MODO_ESCRITA == "incremental"
+    telemetria["paginas"] = 0
+    telemetria["modo"] = "sem_assinatura"
+    entrada = open(pdf_bytes, "rb") if isinstance(pdf_bytes, str) else io.BytesIO(pdf_bytes)
+    try:
+        return _aplicar_assinatura_visual(
+            entrada, id_documento, hash_visual, nome_contratante, nome_contratada, fonte,
+            img_contratante, img_contratada, telemetria, incremental, saida, sha256_original
+        )
+    finally:
+        entrada.close()
+
+def _sha256_arquivo(arquivo):
+    sha256 = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(TAMANHO_CHUNK_LEITURA), b""):
+        sha256.update(bloco)
+    arquivo.seek(0)
+    return sha256.hexdigest()
+
+def _aplicar_assinatura_visual(entrada, id_documento, hash_visual, nome_contratante, nome_contratada, fonte, img_contratante, img_contratada, telemetria, incremental, saida, sha256_original):
+    try:
+        leitor = PdfReader(entrada)
+        
+        # Modo incremental: o escritor parte do original e, ao gravar, anexa só
+        # os objetos novos/alterados depois dos bytes originais (que ficam intactos)
+        escritor = None
+        if incremental:
+            try:
+                escritor = PdfWriter(leitor, incremental=True)
+            except Exception as e:
+                print(f"⚠️ Atualização incremental indisponível ({e}). Reescrevendo o documento.")
+                incremental = False
+        if escritor is None:
+            escritor = PdfWriter()
+        telemetria["escrita"] = "incremental" if incremental else "reescrita"
+        
+        # Link agora usa o ID curto e seguro
+        link = f"https://localhost:8000/validar?hash={id_documento}"
+        
+        # Carimbo renderizado uma vez por tamanho de página e compartilhado
+        # entre as páginas como form XObject
+        carimbo = CarimboCompartilhado(escritor)
+        
+        # Variáveis para capturar tamanho da última página
+        last_width = 0
+        last_height = 0
+        
+        if incremental:
+            # Páginas originais mantidas: só o dicionário de cada página muda
+            for pagina in escritor.pages:
+                width = float(pagina.mediabox.width)
+                height = float(pagina.mediabox.height)
+                last_width = width
+                last_height = height
+                carimbo.aplicar(pagina, hash_visual, link, width, height, origem=_origem_pagina(pagina))
+                telemetria["paginas"] += 1
+        else:
+            # Copia todas as páginas e aplica carimbo
+            for i, pagina in enumerate(leitor.pages):
+                width = float(pagina.mediabox.width)
+                height = float(pagina.mediabox.height)
+                last_width = width
+                last_height = height
+                
+                nova_pagina = PageObject.create_blank_page(width=width, height=height)
+                nova_pagina.merge_page(pagina)
+                
+                # Carimbo de rodapé
+                carimbo.aplicar(escritor.add_page(nova_pagina), hash_visual, link, width, height)
+                telemetria["paginas"] += 1
+            
+        # --- Lógica Inteligente de Assinatura ---
+        if any([nome_contratante, nome_contratada, img_contratante, img_contratada]):
+            
+            # Procura (de trás para frente) a página com a linha de assinatura
+            indice_pagina_assinatura, coords_encontradas = localizar_ancoras_assinatura(
+                leitor, sha256_original or _sha256_arquivo(entrada)
+            )
+            
+            if coords_encontradas and indice_pagina_assinatura != -1:
+                print("✅ Detectadas linhas de assinatura existentes. Usando modo Overlay.")
+                telemetria["modo"] = "overlay"
+                
+                pos_ct, pos_cd = _posicoes_assinatura(coords_encontradas)
+
+                # Modo Overlay: Aplica na página encontrada
+                pagina_destino = escritor.pages[indice_pagina_assinatura]
+                
+                # Tamanho da página encontrada
+                w_pag = float(leitor.pages[indice_pagina_assinatura].mediabox.width)
+                h_pag = float(leitor.pages[indice_pagina_assinatura].mediabox.height)
+                
+                assinaturas_pdf = PdfReader(gerar_pagina_assinaturas(
+                    nome_contratante, nome_contratada, fonte, w_pag, h_pag, 
+                    img_contratante, img_contratada, 
+                    eh_nova_pagina=False, # Não cria layout, só joga assinatura
+                    pos_contratante=pos_ct,
+                    pos_contratada=pos_cd
+                ))
+                # Sobreposição como form XObject: o conteúdo da página não é reescrito
+                origem = _origem_pagina(pagina_destino) if incremental else (0, 0)
+                carimbo.sobrepor(pagina_destino, assinaturas_pdf.pages[0], w_pag, h_pag, origem=origem)
+                
+            else:
+                print("⚠️ Nenhuma linha detectada. Criando nova página de assinaturas.")
+                telemetria["modo"] = "pagina_extra"
+                # Modo Página Extra: Cria uma nova página limpa
+                pagina_assinaturas = PageObject.create_blank_page(width=last_width, height=last_height)
+                
+                assinaturas_pdf = PdfReader(gerar_pagina_assinaturas(
+                    nome_contratante, nome_contratada, fonte, last_width, last_height, 
+                    img_contratante, img_contratada, 
+                    eh_nova_pagina=True, # Cria layout completo (título, linhas)
+                    pos_contratante=None, pos_contratada=None
+                ))
+                pagina_assinaturas.merge_page(assinaturas_pdf.pages[0])
+                
+                # Adiciona carimbo também na página de assinaturas
+                carimbo.aplicar(escritor.add_page(pagina_assinaturas), hash_visual, link, last_width, last_height)
+                telemetria["paginas"] += 1
+        
+        telemetria["carimbo"] = {"acertos": carimbo.cache.acertos, "falhas": carimbo.cache.falhas}
+        
+        # Na atualização incremental nada do original é recomprimido ou renumerado
+        if not incremental:
+            finalizar_escritor(escritor)
+        output = saida if saida is not None else io.BytesIO()
+        escritor.write(output)
+        if saida is None:
+            output.seek(0)
+        return output
+    except Exception as e:
+        print(f"Erro visual PDF: {e}")
+        import traceback
+        traceback.print_exc()
+        telemetria["modo"] = "falha"
+        # Devolve o original sem carimbo
+        output = saida if saida is not None else io.BytesIO()
+        output.seek(0)
+        output.truncate()
+        entrada.seek(0)
+        shutil.copyfileobj(entrada, output)
+        if saida is None:
+            output.seek(0)
+        return output
+
+def executar_pipeline_assinatura(conteudo, digest, nome_contratante, nome_contratada, fonte, img_contratante, img_contratada, destino=None):
+    """
+    Pipeline de CPU do /assinar: assinatura RSA, carimbo visual e escrita do PDF.
+    conteudo são os bytes do PDF ou o caminho do upload em disco; digest é o
+    SHA-256 do conteúdo, calculado enquanto o upload chegava.
+    Roda dentro de um worker do motor_assinatura. Retorna (hash_base64, id_chave, id_documento, pdf_bytes, telemetria);
+    com destino (caminho), o PDF é escrito direto nele e volta o caminho no lugar
+    dos bytes, sem atravessar o pool. A telemetria volta para o processo
+    principal, onde as métricas são registradas.
+    """
+    telemetria = {"etapas": {}}
+    
+    inicio = time.perf_counter()
+    carregar_chave_privada()
+    telemetria["etapas"]["chave"] = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    assinatura, id_chave = gerenciador_chaves.assinar_digest(digest)
+    telemetria["etapas"]["assinatura_rsa"] = time.perf_counter() - inicio
+    assinatura_base64 = base64.b64encode(assinatura).decode('utf-8')
+    
+    # GERA ID CURTO E SEGURO (SHA256 da assinatura) - 64 caracteres
+    # Isso resolve o problema de "nome de arquivo muito longo" no Windows
+    id_documento = hashlib.sha256(assinatura).hexdigest()
+    
+    # Aplicação Visual (Rodapé e Nomes na última página)
+    inicio = time.perf_counter()
+    saida = open(destino, "wb") if destino else None
+    try:
+        pdf_final = aplicar_assinatura_visual(
+            conteudo, 
+            id_documento, # ID para o link/QR Code
+            assinatura_base64, # Hash visual para exibir no texto
+            nome_contratante, 
+            nome_contratada, 
+            fonte,
+            img_contratante,
+            img_contratada,
+            telemetria=telemetria,
+            saida=saida,
+            sha256_original=digest.hex()
+        )
+        telemetria["bytes_saida"] = pdf_final.tell() if saida else len(pdf_final.getbuffer())
+    finally:
+        if saida:
+            saida.close()
+    telemetria["etapas"]["carimbo_visual"] = time.perf_counter() - inicio
+    # Pico de memória do processo que executou o job (ru_maxrss vem em KB no Linux)
+    if resource is not None:
+        telemetria["memoria_pico_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return assinatura_base64, id_chave, id_documento, destino or pdf_final.getvalue(), telemetria
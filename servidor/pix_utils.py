@@ -1,29 +1,58 @@
+# Cópia idêntica em api/ e servidor/: altere as duas (python scripts/verificar_copias.py)
 import binascii
+import re
+
+class PayloadPixInvalido(ValueError):
+    """Payload "Copia e Cola" fora do padrão BR Code."""
+    pass
+
+def _crc16(data: bytes, crc: int = 0xFFFF) -> int:
+    # CRC16-CCITT (polinômio 0x1021), por tabela em C via binascii.
+    # Aceita o CRC parcial de um prefixo para continuar o cálculo.
+    return binascii.crc_hqx(data, crc)
 
 def crc16_ccitt(data: str) -> str:
-    crc = 0xFFFF
-    poly = 0x1021
-    data_bytes = data.encode('utf-8')
-    
-    for byte in data_bytes:
-        crc ^= (byte << 8)
-        for _ in range(8):
-            if (crc & 0x8000):
-                crc = (crc << 1) ^ poly
-            else:
-                crc <<= 1
-        crc &= 0xFFFF
-        
-    return f"{crc:04X}"
+    return f"{_crc16(data.encode('utf-8')):04X}"
+
+def _campo(id_campo: str, valor: str) -> str:
+    # Campo TLV do EMV QRCPS: ID (2) + tamanho (2) + valor
+    if len(valor) > 99:
+        raise PayloadPixInvalido(f"Campo {id_campo} excede 99 caracteres")
+    return f"{id_campo}{len(valor):02}{valor}"
+
+def _prefixo_pix(chave: str) -> str:
+    # Parte do payload que não muda entre cobranças do mesmo recebedor
+    return (
+        _campo("00", "01")
+        + _campo("26", _campo("00", "br.gov.bcb.pix") + _campo("01", chave))
+        + _campo("52", "0000")
+        + _campo("53", "986")
+    )
+
+def _sufixo_pix(valor: float, nome: str, cidade: str, txid: str) -> str:
+    return (
+        _campo("54", f"{valor:.2f}")
+        + _campo("58", "BR")
+        + _campo("59", nome)
+        + _campo("60", cidade)
+        + _campo("62", _campo("05", txid))
+        + "6304"
+    )
 
 def gerar_payload_pix(chave: str, nome: str, cidade: str, valor: float, txid: str = "***") -> str:
     """
     Gera o payload "Copia e Cola" do PIX (Padrão BR Code).
     """
+    return gerar_payloads_pix(chave, nome, cidade, [(valor, txid)])[0]
+
+def gerar_payloads_pix(chave: str, nome: str, cidade: str, cobrancas) -> list:
+    """
+    Gera vários payloads PIX do mesmo recebedor em uma chamada.
+    cobrancas: iterável de (valor, txid). Retorna os payloads na mesma ordem.
+    """
     nome = nome[:25] # Limite de 25 chars
     cidade = cidade[:15] # Limite de 15 chars
-    valor_str = f"{valor:.2f}"
-    
+
     # Payload formatado (IDs fixos do padrão EMV QRCPS)
     # 00 - Payload Format Indicator
     # 26 - Merchant Account Information (GUI + Chave)
@@ -35,19 +64,83 @@ def gerar_payload_pix(chave: str, nome: str, cidade: str, valor: float, txid: st
     # 60 - Merchant City
     # 62 - Additional Data Field Template (TxID)
     # 63 - CRC16
-    
-    payload = (
-        f"000201"
-        f"26{len('0014br.gov.bcb.pix01' + str(len(chave)) + chave):02}0014br.gov.bcb.pix01{len(chave):02}{chave}"
-        f"52040000"
-        f"5303986"
-        f"54{len(valor_str):02}{valor_str}"
-        f"5802BR"
-        f"59{len(nome):02}{nome}"
-        f"60{len(cidade):02}{cidade}"
-        f"62{len('0503' + txid):02}0503{txid}"
-        f"6304"
-    )
-    
-    crc = crc16_ccitt(payload)
-    return payload + crc
\ No newline at end of file
+
+    # O prefixo e seu CRC parcial são calculados uma única vez
+    prefixo = _prefixo_pix(chave)
+    crc_prefixo = _crc16(prefixo.encode('utf-8'))
+
+    payloads = []
+    for valor, txid in cobrancas:
+        sufixo = _sufixo_pix(valor, nome, cidade, txid or "***")
+        crc = _crc16(sufixo.encode('utf-8'), crc_prefixo)
+        payloads.append(f"{prefixo}{sufixo}{crc:04X}")
+    return payloads
+
+# --- Leitura e validação de payloads ("Copia e Cola") ---
+
+# Campos cujo valor é, por sua vez, uma lista TLV
+_CAMPOS_TEMPLATE = {f"{i:02}" for i in range(26, 52)} | {"62"} | {f"{i:02}" for i in range(80, 100)}
+_CAMPOS_OBRIGATORIOS = ["00", "52", "53", "58", "59", "60", "63"]
+_VALOR = re.compile(r"^\d{1,10}\.\d{2}$")
+
+def _ler_tlv(texto: str, aninhar: bool) -> dict:
+    campos = {}
+    i = 0
+    while i < len(texto):
+        if i + 4 > len(texto):
+            raise PayloadPixInvalido(f"Campo truncado na posição {i}")
+        id_campo = texto[i:i + 2]
+        tamanho = texto[i + 2:i + 4]
+        if not (id_campo.isdigit() and tamanho.isdigit()):
+            raise PayloadPixInvalido(f"ID/tamanho inválido na posição {i}")
+        fim = i + 4 + int(tamanho)
+        if fim > len(texto):
+            raise PayloadPixInvalido(f"Campo {id_campo} ultrapassa o fim do payload")
+        valor = texto[i + 4:fim]
+        if aninhar and id_campo in _CAMPOS_TEMPLATE:
+            valor = _ler_tlv(valor, aninhar=False)
+        campos[id_campo] = valor
+        i = fim
+    return campos
+
+def ler_payload_pix(payload: str) -> dict:
+    """
+    Lê e valida um payload BR Code. Retorna os campos TLV (templates como
+    dicts aninhados). Lança PayloadPixInvalido se o formato ou o CRC falhar.
+    """
+    payload = payload.strip()
+    if len(payload) < 8 or payload[-8:-4] != "6304":
+        raise PayloadPixInvalido("Payload não termina com o campo CRC (6304)")
+
+    crc_informado = payload[-4:].upper()
+    crc_calculado = crc16_ccitt(payload[:-4])
+    if crc_informado != crc_calculado:
+        raise PayloadPixInvalido(f"CRC inválido: {crc_informado} (esperado {crc_calculado})")
+
+    campos = _ler_tlv(payload, aninhar=True)
+
+    if list(campos)[0] != "00" or campos["00"] != "01":
+        raise PayloadPixInvalido("Payload Format Indicator deve ser o primeiro campo (000201)")
+    faltando = [c for c in _CAMPOS_OBRIGATORIOS if c not in campos]
+    if faltando:
+        raise PayloadPixInvalido(f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+
+    contas_pix = [
+        c for id_campo, c in campos.items()
+        if id_campo in _CAMPOS_TEMPLATE and isinstance(c, dict) and c.get("00", "").lower() == "br.gov.bcb.pix"
+    ]
+    if not contas_pix:
+        raise PayloadPixInvalido("Merchant Account Information do PIX (br.gov.bcb.pix) ausente")
+    if "54" in campos and not _VALOR.match(campos["54"]):
+        raise PayloadPixInvalido(f"Valor inválido: {campos['54']}")
+    if len(campos["59"]) > 25 or len(campos["60"]) > 15:
+        raise PayloadPixInvalido("Nome (máx. 25) ou cidade (máx. 15) do recebedor muito longos")
+
+    return campos
+
+def validar_payload_pix(payload: str) -> bool:
+    try:
+        ler_payload_pix(payload)
+        return True
+    except PayloadPixInvalido:
+        return False
@@ -1,26 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response
 from fastapi.responses import StreamingResponse, RedirectResponse, FileResponse, JSONResponse
 import json
+import re
+import time
+import asyncio
 import datetime
+import zipfile
+import tempfile
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
 import os
-import base64
 import io
 import qrcode
-import urllib.parse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from pypdf import PdfReader, PdfWriter, PageObject
+import qrcode.image.svg
+from cache_utils import CacheLRU
+from motor_assinatura import MotorAssinatura, FilaCheiaError, TempoEsgotadoError
+from indice_documentos import IndiceDocumentos
+from metricas import RegistroMetricas, CONTENT_TYPE_METRICAS
+from armazem_originais import ArmazemOriginais, ChavesOriginaisPlano
+from armazenamento import armazenamento_do_ambiente, ArmazenamentoFragmentado, ObjetoNaoEncontrado
+from migracao_layout import MigracaoLayout
+from spool_upload import UploadSpool
+from varredor_armazenamento import VarredorArmazenamento
+from biblioteca_assinaturas import BibliotecaAssinaturas
+from pipeline_assinatura import executar_pipeline_assinatura, indice_ancoras, registro_fontes
+from respostas_http import CACHE_REVALIDAR, etag_forte, resposta_armazenada
+from senhas import gerar_hash_senha
+from contratos import CacheModelosContrato, valores_contrato
 
 import hashlib
 # --- Integração MongoDB ---
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import Optional, List
 from dotenv import load_dotenv
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -59,18 +73,18 @@ class UsuarioCreate(BaseModel):
     senha: str
     tipoPlano: str = "gratuito" # gratuito, profissional, empresarial
 
+def mensagem_usuario_duplicado(erro):
+    # O índice único que falhou (email ou cpf, ver scripts/initMongo.js) diz qual campo repetiu
+    detalhes = erro.details or {}
+    campos = set(detalhes.get("keyPattern") or detalhes.get("keyValue") or {})
+    if "cpf" in campos or (not campos and "cpf" in str(erro)):
+        return "CPF já cadastrado."
+    return "E-mail já cadastrado."
+
 @app.post("/usuarios")
 async def criar_usuario(usuario: UsuarioCreate):
-    # 1. Verifica se E-mail ou CPF já existem
-    if await db.usuarios.find_one({"email": usuario.email}):
-        raise HTTPException(status_code=400, detail="E-mail já cadastrado.")
-    
-    if await db.usuarios.find_one({"cpf": usuario.cpf}):
-        raise HTTPException(status_code=400, detail="CPF já cadastrado.")
-
-    # 2. Prepara documento
-    # Em produção: usar bcrypt para hash da senha!
-    senha_hash = hashlib.sha256(usuario.senha.encode()).hexdigest()
+    # 1. Prepara documento (hash da senha em thread própria, fora do event loop)
+    senha_hash = await gerar_hash_senha(usuario.senha)
     
     # Define datas de trial se for plano pago
     inicio_trial = None
@@ -96,8 +110,12 @@ async def criar_usuario(usuario: UsuarioCreate):
         "atualizadoEm": datetime.datetime.utcnow()
     }
 
-    # 3. Salva no MongoDB (coleção 'usuarios')
-    resultado = await db.usuarios.insert_one(novo_usuario)
+    # 2. Salva no MongoDB (coleção 'usuarios'): os índices únicos de email e cpf
+    # garantem a unicidade num único round trip, sem corrida entre cadastros
+    try:
+        resultado = await db.usuarios.insert_one(novo_usuario)
+    except DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=mensagem_usuario_duplicado(e))
     
     return {
         "id": str(resultado.inserted_id),
@@ -113,6 +131,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges"],
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -125,197 +144,201 @@ if not os.path.exists(DIRETORIO_ASSINADOS):
 else:
     print(f"📁 Diretório de assinados já existe: {DIRETORIO_ASSINADOS}")
 
-CAMINHO_CHAVE_PRIVADA = "chave_privada_assinatura.pem"
+# Entradas do índice de âncoras (pipeline_assinatura.py) sem uso há ANCORAS_DIAS
+# dias são apagadas pelo varredor do armazenamento
+ANCORAS_DIAS = float(os.getenv("ANCORAS_DIAS", "30"))
 
-def carregar_chave_privada():
-    if not os.path.exists(CAMINHO_CHAVE_PRIVADA):
-        raise Exception("Chave de assinatura nao encontrada. Rode o script de seguranca.")
-        
-    with open(CAMINHO_CHAVE_PRIVADA, "rb") as arquivo_chave:
-        return serialization.load_pem_private_key(
-            arquivo_chave.read(),
-            password=None
-        )
+# Bytes dos documentos (assinados, originais, metadados e contratos) passam pelo
+# backend de armazenamento: ARMAZENAMENTO=fragmentado (padrão: DIRETORIO_ASSINADOS
+# em ab/cd/<nome>), local (tudo em uma pasta só), gridfs ou memoria (ver armazenamento.py)
+armazenamento = armazenamento_do_ambiente(
+    DIRETORIO_ASSINADOS,
+    obter_bucket=lambda: AsyncIOMotorGridFSBucket(db, bucket_name="assinados"),
+    padrao="fragmentado",
+    chaves_legado=ChavesOriginaisPlano()
+)
+print(f"🗄️ Armazenamento de documentos: {armazenamento.nome}")
 
-# Funções para gerar o visual do PDF
-def gerar_carimbo_pdf(hash_doc, link_validacao, width, height):
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=(width, height))
-    
-    # Configuração do Rodapé (Fundo cinza claro)
-    footer_height = 45
-    c.setFillColorRGB(0.96, 0.96, 0.96)
-    c.rect(0, 0, width, footer_height, fill=1, stroke=0)
-    
-    # Logo Simulado (Azul)
-    c.setFillColorRGB(0.2, 0.4, 0.8)
-    c.circle(30, 22, 12, fill=1, stroke=0)
-    c.setFillColorRGB(1, 1, 1)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(26, 17, "a")
-    
-    # Textos Legais
-    c.setFillColorRGB(0.2, 0.2, 0.2)
-    c.setFont("Helvetica-Bold", 8)
-    c.drawString(55, 28, "Assinado com Assinatura Eletrônica (Lei 14.063/2020)")
-    
-    c.setFont("Helvetica", 6)
-    c.drawString(55, 18, f"Hash SHA256: {hash_doc[:24]}...")
-    
-    # Rótulo curto e clicável (sem URL exibida)
-    texto_link = "Verificar online"
-    c.drawString(55, 8, texto_link)
-    try:
-        tw = stringWidth(texto_link, "Helvetica", 6)
-        c.linkURL(link_validacao, (55, 6, 55 + tw, 12), relative=1)
-    except:
-        pass
-    
-    # QR Code (mantém o link completo funcional) + área clicável
-    qr = qrcode.QRCode(box_size=2, border=0)
-    qr.add_data(link_validacao)
-    qr.make(fit=True)
-    img_qr = qr.make_image(fill_color="black", back_color="white")
-    
-    qr_bytes = io.BytesIO()
-    img_qr.save(qr_bytes, format='PNG')
-    qr_bytes.seek(0)
-    
-    qr_x, qr_y, qr_w, qr_h = width - 55, 5, 35, 35
-    c.drawImage(ImageReader(qr_bytes), qr_x, qr_y, width=qr_w, height=qr_h)
-    c.linkURL(link_validacao, (qr_x, qr_y, qr_x + qr_w, qr_y + qr_h), relative=1)
-    
-    c.save()
-    packet.seek(0)
-    return packet
+# Arquivos do layout plano (antes da fragmentação) são movidos em segundo plano;
+# até a migração terminar, as leituras também procuram no layout antigo
+migracao_layout = None
+if isinstance(armazenamento, ArmazenamentoFragmentado):
+    migracao_layout = MigracaoLayout(armazenamento, tamanho_lote=int(os.getenv("MIGRACAO_LOTE", "1000")))
+_tarefa_migracao = None
 
-def encontrar_coordenadas_assinatura(page):
-    """
-    Busca coordenadas das palavras chaves para posicionamento inteligente.
-    Retorna dict: {'contratante': (x, y), 'contratada': (x, y)}
-    """
-    coords = {}
-    
-    def visitor_body(text, cm, tm, fontDict, fontSize):
-        if text and text.strip():
-            # Remove pontuação e deixa maiúsculo para comparação robusta
-            curr_text = text.strip().upper().replace(':', '').replace('.', '')
-            x = tm[4]
-            y = tm[5]
-            
-            # 1. Detecta Labels de Texto
-            if "CONTRATANTE" in curr_text:
-                coords['contratante'] = (x, y)
-                print(f"   -> Label CONTRATANTE encontrado em x={x}, y={y}")
-            elif "CONTRATADA" in curr_text:
-                coords['contratada'] = (x, y)
-                print(f"   -> Label CONTRATADA encontrado em x={x}, y={y}")
-            
-            # 2. Detecta Linhas de Assinatura (Sublinhados)
-            # Procura por sequências de pelo menos 3 underscores
-            if "___" in text:
-                if 'linhas' not in coords:
-                    coords['linhas'] = []
-                coords['linhas'].append((x, y))
-                print(f"   -> Linha (____) encontrada em x={x}, y={y}")
-    
+@app.on_event("startup")
+async def iniciar_migracao_layout():
+    global _tarefa_migracao
+    if migracao_layout is not None:
+        _tarefa_migracao = asyncio.create_task(migracao_layout.executar(pausa=float(os.getenv("MIGRACAO_PAUSA", "0.05"))))
+
+@app.on_event("shutdown")
+async def encerrar_migracao_layout():
+    if _tarefa_migracao is not None:
+        _tarefa_migracao.cancel()
+
+def chave_documento(id_documento, sufixo):
+    # Chave de um arquivo do documento: sufixo ".pdf", "_original.pdf" (legado) ou ".json"
+    return f"{id_documento}{sufixo}"
+
+# Originais endereçados por SHA-256: o mesmo modelo assinado N vezes é guardado uma vez.
+# ORIGINAIS_DIR_TRAVAS: travas dos contadores entre processos (padrão: no temporário do host)
+armazem_originais = ArmazemOriginais(armazenamento, diretorio_travas=os.getenv("ORIGINAIS_DIR_TRAVAS") or None)
+
+# Assinaturas salvas por usuário, já normalizadas (ver biblioteca_assinaturas.py)
+biblioteca_assinaturas = BibliotecaAssinaturas(
+    lambda: db.assinaturas_salvas,
+    armazenamento,
+    CacheLRU(int(os.getenv("BIBLIOTECA_ASSINATURAS_CACHE_MAX", "256")))
+)
+
+# Índice dos documentos assinados para as rotas /validar/* (ver indice_documentos.py)
+indice_documentos = IndiceDocumentos(
+    existe=lambda id_documento: armazenamento.existe(chave_documento(id_documento, ".json")),
+    tamanho_metadados=int(os.getenv("VALIDACAO_CACHE_MAX", "1024")),
+    ttl_negativo=float(os.getenv("VALIDACAO_TTL_NEGATIVO", "30"))
+)
+
+async def carregar_indice_documentos():
     try:
-        print("🔍 Iniciando extração de texto para detectar posições de assinatura...")
-        page.extract_text(visitor_text=visitor_body)
+        total = await indice_documentos.carregar_do_mongo(db.documentos)
+        print(f"📇 Índice de validação carregado do MongoDB: {total} documentos")
     except Exception as e:
-        print(f"Erro na extração de texto (ignorado): {e}")
-        
-    return coords
+        print(f"⚠️ MongoDB indisponível para o índice ({e}). Usando o armazenamento de assinados.")
+        total = await indice_documentos.carregar_do_armazenamento(armazenamento)
+        print(f"📇 Índice de validação carregado do armazenamento: {total} documentos")
 
-def gerar_pagina_assinaturas(nome_contratante, nome_contratada, fonte, width, height, img_contratante=None, img_contratada=None, eh_nova_pagina=False, pos_contratante=None, pos_contratada=None):
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=(width, height))
-    
-    # Seleção de Fonte
-    font_name = "Helvetica"
+@app.on_event("startup")
+async def iniciar_indice_documentos():
+    # Em segundo plano: até terminar, as buscas caem na sondagem única de disco
+    asyncio.create_task(carregar_indice_documentos())
+
+# Varredor do armazenamento (ver varredor_armazenamento.py): recria registros que
+# faltam no MongoDB, apaga os arquivos de documentos e contratos removidos pela
+# API (lápides em documentos_removidos) e assinaturas/originais sem uso, e
+# arquiva originais frios. Desligado por padrão (VARREDOR_ATIVO=1);
+# com VARREDOR_SIMULAR=1 só contabiliza o que faria. Rode em uma instância só.
+VARREDOR_ATIVO = os.getenv("VARREDOR_ATIVO", "0") == "1"
+varredor_armazenamento = VarredorArmazenamento(
+    armazenamento,
+    armazem_originais,
+    lambda: db,
+    tamanho_lote=int(os.getenv("VARREDOR_LOTE", "500")),
+    idade_minima=float(os.getenv("VARREDOR_IDADE_MINIMA_HORAS", "168")) * 3600,
+    dias_frio=float(os.getenv("VARREDOR_DIAS_FRIO", "90")),
+    simular=os.getenv("VARREDOR_SIMULAR", "0") == "1",
+    ao_remover_documento=indice_documentos.remover,
+    ao_terminar_ciclo=lambda: limpar_indice_ancoras()
+)
+_tarefa_varredor = None
+
+async def limpar_indice_ancoras():
+    removidas = await asyncio.to_thread(indice_ancoras.limpar, ANCORAS_DIAS * 86400)
+    return {"ancoras_removidas": removidas}
+
+@app.on_event("startup")
+async def iniciar_varredor_armazenamento():
+    global _tarefa_varredor
+    if VARREDOR_ATIVO:
+        _tarefa_varredor = asyncio.create_task(varredor_armazenamento.executar(
+            pausa_lote=float(os.getenv("VARREDOR_PAUSA", "1")),
+            intervalo_ciclo=float(os.getenv("VARREDOR_INTERVALO", "3600"))
+        ))
+
+@app.on_event("shutdown")
+async def encerrar_varredor_armazenamento():
+    if _tarefa_varredor is not None:
+        _tarefa_varredor.cancel()
+
+async def ler_metadados(id_documento):
+    async def carregar():
+        return json.loads(await armazenamento.ler(chave_documento(id_documento, ".json")))
+    return await indice_documentos.metadados.obter_assincrono(id_documento, carregar)
+
+async def localizar_original(id_documento):
+    # Documentos novos apontam para o armazém (sha256_original); antigos têm {id}_original.pdf
+    # Retorna (chave, etag): o ETag forte vem do hash do conteúdo original
     try:
-        if fonte == "manuscrita":
-            font_name = "Times-Italic" 
-        elif fonte == "serif":
-            font_name = "Times-Roman"
-        elif fonte == "cursiva_simples":
-            font_name = "Times-Italic"
-        
-        c.setFont(font_name, 22)
-    except:
-        font_name = "Helvetica"
-        c.setFont(font_name, 22)
-    
-    # --- Configuração de Posições ---
-    
-    # Posições padrão (se não houver coordenadas detectadas)
-    x_esq_padrao = width * 0.25
-    y_padrao = height / 2 - 50 if eh_nova_pagina else 85
-    x_dir_padrao = width * 0.75
-    
-    # Define posição final (Prioridade: Posição passada > Padrão)
-    x_ct, y_ct = pos_contratante if pos_contratante else (x_esq_padrao, y_padrao)
-    x_cd, y_cd = pos_contratada if pos_contratada else (x_dir_padrao, y_padrao)
-
-    # --- Desenho da Estrutura (Apenas se for página nova gerada pelo sistema) ---
-    if eh_nova_pagina:
-        # Título
-        c.setFont("Helvetica-Bold", 14)
-        c.drawCentredString(width / 2, height - 100, "PÁGINA DE ASSINATURAS")
-        c.setFont("Helvetica", 10)
-        c.drawCentredString(width / 2, height - 130, "Este documento foi assinado digitalmente conforme Lei 14.063/2020")
-        
-        # Linhas e legendas (apenas se for nova página)
-        c.setLineWidth(1)
-        # Contratante
-        c.line(x_ct - 75, y_ct - 10, x_ct + 75, y_ct - 10)
-        c.drawCentredString(x_ct, y_ct - 25, "CONTRATANTE")
-        # Contratada
-        c.line(x_cd - 75, y_cd - 10, x_cd + 75, y_cd - 10)
-        c.drawCentredString(x_cd, y_cd - 25, "CONTRATADA")
-
-    # --- Inserção das Assinaturas/Nomes ---
-    
-    # Data da assinatura
-    data_assinatura = datetime.datetime.now().strftime("%d/%m/%Y")
-    c.setFont("Helvetica", 8)
+        sha256_original = (await ler_metadados(id_documento)).get("sha256_original")
+    except (FileNotFoundError, ValueError):
+        sha256_original = None
+    if sha256_original:
+        # Original arquivado pelo varredor volta para a camada quente na primeira leitura
+        await armazem_originais.restaurar(sha256_original)
+        return armazem_originais.chave(sha256_original), etag_forte(sha256_original)
+    return chave_documento(id_documento, "_original.pdf"), etag_forte(f"{id_documento}-original")
 
-    # Contratante
-    if img_contratante:
-        try:
-            img = ImageReader(io.BytesIO(img_contratante))
-            # Desenha centralizado no ponto X,Y definido
-            c.drawImage(img, x_ct - 75, y_ct, width=150, height=60, mask='auto')
-            # Data abaixo da imagem
-            c.drawCentredString(x_ct, y_ct - 10, f"Assinado em {data_assinatura}")
-        except Exception as e:
-            print(f"Erro img contratante: {e}")
-    elif nome_contratante:
-        c.setFont(font_name, 22)
-        c.drawCentredString(x_ct, y_ct, nome_contratante)
-        # Data abaixo do nome
-        c.setFont("Helvetica", 8)
-        c.drawCentredString(x_ct, y_ct - 10, f"Assinado em {data_assinatura}")
-        
-    # Contratada
-    if img_contratada:
-        try:
-            img = ImageReader(io.BytesIO(img_contratada))
-            c.drawImage(img, x_cd - 75, y_cd, width=150, height=60, mask='auto')
-            # Data abaixo da imagem
-            c.drawCentredString(x_cd, y_cd - 10, f"Assinado em {data_assinatura}")
-        except Exception as e:
-            print(f"Erro img contratada: {e}")
-    elif nome_contratada:
-        c.setFont(font_name, 22)
-        c.drawCentredString(x_cd, y_cd, nome_contratada)
-        # Data abaixo do nome
-        c.setFont("Helvetica", 8)
-        c.drawCentredString(x_cd, y_cd - 10, f"Assinado em {data_assinatura}")
-
-    c.save()
-    packet.seek(0)
-    return packet
+TAMANHO_CHUNK_UPLOAD = 1024 * 1024
+
+# Uploads do /assinar acima de ASSINAR_SPOOL_LIMIAR bytes vão para um temporário
+# em ASSINAR_SPOOL_DIR (padrão: o temporário do sistema) em vez de ficar na memória
+ASSINAR_SPOOL_LIMIAR = int(os.getenv("ASSINAR_SPOOL_LIMIAR", str(4 * 1024 * 1024)))
+ASSINAR_SPOOL_DIR = os.getenv("ASSINAR_SPOOL_DIR") or None
+
+# Motor de execução do pipeline de assinatura (pool de processos).
+# Configurável via ASSINATURA_WORKERS, ASSINATURA_FILA_MAX,
+# ASSINATURA_TIMEOUT e ASSINATURA_JOBS_POR_WORKER.
+motor_assinatura = MotorAssinatura.do_ambiente()
+
+@app.on_event("shutdown")
+def encerrar_motor_assinatura():
+    motor_assinatura.encerrar()
+
+# --- Métricas (formato Prometheus em /metrics) ---
+metricas = RegistroMetricas()
+metrica_etapas_assinatura = metricas.histograma(
+    "verysing_assinatura_etapa_segundos", "Duração de cada etapa do /assinar", rotulos=("etapa",)
+)
+metrica_validacao = metricas.histograma(
+    "verysing_validacao_segundos", "Duração da busca nas rotas /validar/*", rotulos=("rota",)
+)
+metrica_pix_qr = metricas.histograma(
+    "verysing_pix_qr_geracao_segundos", "Duração da renderização do QR Code PIX", rotulos=("formato",)
+)
+metrica_paginas_carimbadas = metricas.contador("verysing_paginas_carimbadas_total", "Páginas carimbadas")
+metrica_cache_carimbo = metricas.contador(
+    "verysing_carimbo_cache_total", "Carimbos de rodapé por resultado do cache (acertos, falhas), somados de todos os workers", rotulos=("resultado",)
+)
+metrica_bytes_entrada = metricas.contador("verysing_assinatura_bytes_entrada_total", "Bytes de PDF recebidos no /assinar")
+metrica_bytes_saida = metricas.contador("verysing_assinatura_bytes_saida_total", "Bytes de PDF assinado gerados")
+metrica_modo_assinatura = metricas.contador(
+    "verysing_assinatura_modo_total", "Assinaturas por modo (overlay, pagina_extra, sem_assinatura, falha)", rotulos=("modo",)
+)
+metrica_uploads_spool = metricas.contador(
+    "verysing_assinatura_uploads_total", "Uploads do /assinar por destino (memoria ou disco)", rotulos=("destino",)
+)
+metrica_memoria_worker = metricas.histograma(
+    "verysing_assinatura_memoria_pico_bytes", "Pico de RSS do processo que executou o job de assinatura",
+    buckets=tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096))
+)
+metrica_originais = metricas.contador(
+    "verysing_originais_total", "Originais persistidos no armazém (gravado ou deduplicado)", rotulos=("resultado",)
+)
+metricas.medidor(
+    "verysing_varredor_bytes_total", "Bytes liberados pelo varredor (orfao: apagados, arquivo: compressão dos originais frios)",
+    lambda: {"orfao": varredor_armazenamento.estado["totais"]["bytes_recuperados"], "arquivo": varredor_armazenamento.estado["totais"]["bytes_arquivados"]},
+    rotulo="acao"
+)
+metricas.medidor("verysing_motor_workers", "Tamanho do pool de assinatura", lambda: motor_assinatura.workers)
+metricas.medidor("verysing_motor_fila_max", "Limite da fila de assinatura", lambda: motor_assinatura.fila_max)
+metricas.medidor("verysing_motor_em_execucao", "Jobs de assinatura executando", lambda: motor_assinatura.estatisticas()["em_execucao"])
+metricas.medidor("verysing_motor_na_fila", "Jobs de assinatura aguardando", lambda: motor_assinatura.estatisticas()["na_fila"])
+
+def registrar_telemetria_assinatura(telemetria, bytes_saida):
+    # Etapas medidas dentro do worker do motor de assinatura
+    for etapa, duracao in telemetria.get("etapas", {}).items():
+        metrica_etapas_assinatura.observar(duracao, etapa=etapa)
+    metrica_paginas_carimbadas.inc(telemetria.get("paginas", 0))
+    for resultado, quantidade in telemetria.get("carimbo", {}).items():
+        metrica_cache_carimbo.inc(quantidade, resultado=resultado)
+    metrica_modo_assinatura.inc(modo=telemetria.get("modo", "sem_assinatura"))
+    metrica_bytes_saida.inc(bytes_saida)
+    if "memoria_pico_bytes" in telemetria:
+        metrica_memoria_worker.observar(telemetria["memoria_pico_bytes"])
+
+@app.get("/metrics")
+async def exportar_metricas():
+    return Response(content=metricas.exportar(), media_type=CONTENT_TYPE_METRICAS)
 
 # --- Integração de Pagamento PIX e Contratos ---
 from pix_utils import gerar_payload_pix
@@ -333,18 +356,43 @@ class ConfirmacaoPagamento(BaseModel):
     cpf: str
     plano: str
     email: Optional[str] = None
+    modelo: Optional[str] = None  # slug da coleção 'modelos'; sem ele, o contrato de adesão padrão
+    locale: Optional[str] = None
+
+# Contratos já renderizados (o corpo estático), por plano/modelo e idioma
+_cache_modelos_contrato = CacheModelosContrato(CacheLRU(int(os.getenv("CONTRATOS_CACHE_MAX", "64"))))
+
+# Dados do recebedor PIX
+# IMPORTANTE: Coloque sua chave PIX real aqui para receber de verdade!
+CHAVE_PIX = os.getenv("CHAVE_PIX", "00000000000") # SUBSTITUA POR SUA CHAVE PIX
+NOME_RECEBEDOR = "VerySing Digital"
+CIDADE_RECEBEDOR = "Sao Paulo"
+
+# Imagens de QR Code já renderizadas, por (payload, formato)
+_cache_qr_pix = CacheLRU(int(os.getenv("PIX_QR_CACHE_MAX", "256")))
+FORMATOS_QR_PIX = {"png": "image/png", "svg": "image/svg+xml"}
+
+def renderizar_qr_pix(payload_pix, formato):
+    if formato == "svg":
+        img_qr = qrcode.make(payload_pix, image_factory=qrcode.image.svg.SvgPathImage, box_size=10, border=2)
+        buffered = io.BytesIO()
+        img_qr.save(buffered)
+        return buffered.getvalue()
+
+    qr = qrcode.QRCode(box_size=10, border=2)
+    qr.add_data(payload_pix)
+    qr.make(fit=True)
+    img_qr = qr.make_image(fill_color="black", back_color="white")
+    
+    buffered = io.BytesIO()
+    img_qr.save(buffered, format="PNG")
+    return buffered.getvalue()
 
 @app.post("/api/pagamento/pix")
 async def criar_pagamento_pix(dados: DadosPagamento):
     # Gera um ID de transação único
     txid = uuid.uuid4().hex[:20] # Limite do PIX é muitas vezes 25 chars, mas vamos manter seguro
     
-    # Chave PIX da empresa (Exemplo: CNPJ ou Email ou Aleatória)
-    # IMPORTANTE: Coloque sua chave PIX real aqui para receber de verdade!
-    CHAVE_PIX = "00000000000" # SUBSTITUA POR SUA CHAVE PIX
-    NOME_RECEBEDOR = "VerySing Digital"
-    CIDADE_RECEBEDOR = "Sao Paulo"
-    
     payload_pix = gerar_payload_pix(
         chave=CHAVE_PIX,
         nome=NOME_RECEBEDOR,
@@ -353,23 +401,42 @@ async def criar_pagamento_pix(dados: DadosPagamento):
         txid=txid
     )
     
-    # Gerar imagem QR Code
-    qr = qrcode.QRCode(box_size=10, border=2)
-    qr.add_data(payload_pix)
-    qr.make(fit=True)
-    img_qr = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img_qr.save(buffered, format="PNG")
-    qr_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
+    # A imagem do QR Code é servida (e cacheada) pela rota GET abaixo
     return {
         "txid": txid,
         "payload_pix": payload_pix,
-        "qr_code_base64": qr_base64,
+        "qr_code_url": f"/api/pagamento/pix/{txid}/qr.png?valor={dados.valor:.2f}",
         "valor": dados.valor
     }
 
+@app.get("/api/pagamento/pix/{txid}/qr.{formato}")
+async def imagem_qr_pix(txid: str, formato: str, valor: float, request: Request):
+    if formato not in FORMATOS_QR_PIX:
+        raise HTTPException(status_code=404, detail="Formato não suportado")
+    if not txid.isalnum() or len(txid) > 25 or valor <= 0:
+        raise HTTPException(status_code=400, detail="Cobrança inválida")
+    
+    # O payload é determinístico (recebedor + valor + txid): mesma URL, mesma imagem
+    payload_pix = gerar_payload_pix(
+        chave=CHAVE_PIX,
+        nome=NOME_RECEBEDOR,
+        cidade=CIDADE_RECEBEDOR,
+        valor=valor,
+        txid=txid
+    )
+    etag = '"' + hashlib.sha256(f"{formato}:{payload_pix}".encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    def gerar():
+        with metrica_pix_qr.medir(formato=formato):
+            return renderizar_qr_pix(payload_pix, formato)
+    
+    imagem = _cache_qr_pix.obter((payload_pix, formato), gerar)
+    return Response(content=imagem, media_type=FORMATOS_QR_PIX[formato], headers=headers)
+
 @app.post("/api/pagamento/confirmar")
 async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
     """
@@ -377,46 +444,32 @@ async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
     Em produção, isso seria chamado por um Webhook do banco.
     """
     
-    # 1. Gerar o PDF do Contrato
-    packet = io.BytesIO()
-    c = canvas.Canvas(packet, pagesize=A4)
-    width, height = A4
-    
-    # Cabeçalho
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width/2, height - 50, "CONTRATO DE ADESÃO - VERYSING")
-    
-    c.setFont("Helvetica", 12)
-    texto = f"""
-    Pelo presente instrumento particular, de um lado VERYSING DIGITAL LTDA., e de outro lado
-    {dados.nome}, portador(a) do CPF {dados.cpf}, doravante denominado(a) CONTRATANTE.
-    
-    O CONTRATANTE adere ao plano {dados.plano.upper()}, com os benefícios descritos na plataforma.
-    
-    O pagamento foi confirmado e a assinatura deste contrato é realizada digitalmente neste ato.
-    
-    Data: {datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
-    """
-    
-    text_object = c.beginText(50, height - 100)
-    for line in texto.split("\n"):
-        text_object.textLine(line)
-    c.drawText(text_object)
-    
-    # Assinatura Digital do Sistema
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawString(50, height - 300, f"Assinado digitalmente por VerySing System")
-    c.drawString(50, height - 315, f"Transação ID: {dados.txid}")
-    
-    c.save()
-    packet.seek(0)
+    # 1. Gerar o PDF do Contrato: modelo estático em cache + campos do pagamento
+    modelo = await _cache_modelos_contrato.obter(db.modelos, dados.plano, dados.modelo, dados.locale)
+    if modelo is None:
+        raise HTTPException(status_code=404, detail="Modelo de contrato não encontrado")
+    pdf_contrato = modelo.preencher(valores_contrato(dados, dados.locale))
     
     # Salvar arquivo
     nome_arquivo = f"contrato_{dados.txid}.pdf"
-    caminho_arquivo = os.path.join(DIRETORIO_ASSINADOS, nome_arquivo)
     
-    with open(caminho_arquivo, "wb") as f:
-        f.write(packet.read())
+    await armazenamento.gravar(nome_arquivo, pdf_contrato)
+
+    # Registro do contrato: é por ele que o varredor sabe que o arquivo ainda é usado
+    # (e a lápide de uma remoção anterior do mesmo txid deixa de valer)
+    try:
+        await db.documentos_removidos.delete_many({"tipo": "contrato", "nome_arquivo": nome_arquivo})
+        await db.contratos.insert_one({
+            "txid": dados.txid,
+            "nome": dados.nome,
+            "cpf": dados.cpf,
+            "email": dados.email,
+            "nome_arquivo": nome_arquivo,
+            "arquivo_chave": nome_arquivo,
+            "criado_em": datetime.datetime.utcnow()
+        })
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar contrato no MongoDB (não crítico): {e}")
         
     # URL para download (ajuste conforme sua rota de arquivos estáticos ou endpoint de download)
     # Supondo que você tenha uma rota para servir arquivos de 'assinados' ou similar
@@ -428,140 +481,210 @@ async def confirmar_pagamento_contrato(dados: ConfirmacaoPagamento):
         "contrato_arquivo": nome_arquivo
     }
 
+# SHA-256 dos contratos servidos em /download, por (chave, versão)
+_cache_etag_downloads = CacheLRU(1024)
+
+async def etag_do_objeto(chave, info):
+    async def calcular():
+        sha256 = hashlib.sha256()
+        async for chunk in armazenamento.ler_faixa(chave):
+            sha256.update(chunk)
+        return etag_forte(sha256.hexdigest())
+    return await _cache_etag_downloads.obter_assincrono((chave, info.versao), calcular)
+
 @app.get("/download/{nome_arquivo}")
-async def download_arquivo(nome_arquivo: str):
-    caminho = os.path.join(DIRETORIO_ASSINADOS, nome_arquivo)
-    if os.path.exists(caminho):
-        return FileResponse(caminho, media_type='application/pdf', filename=nome_arquivo)
-    raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+async def download_arquivo(nome_arquivo: str, request: Request):
+    chave = os.path.basename(nome_arquivo)
+    try:
+        info = await armazenamento.info(chave)
+    except (ObjetoNaoEncontrado, ValueError):
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    etag = await etag_do_objeto(chave, info)
+    # contrato_<txid>.pdf é regravado a cada nova confirmação do mesmo txid: revalida sempre
+    return await resposta_armazenada(request, armazenamento, chave, etag, info=info, filename=nome_arquivo, cache=CACHE_REVALIDAR)
 
-def aplicar_assinatura_visual(pdf_bytes, id_documento, hash_visual, nome_contratante="", nome_contratada="", fonte="padrao", img_contratante=None, img_contratada=None):
+async def gravar_arquivos_documento(id_documento, sha256_original, conteudo, pdf_final, metadados):
+    """
+    Escrita de um documento assinado no armazenamento (o backend local grava
+    fora do event loop). Cada arquivo é gravado de forma atômica; o JSON por
+    último, pois é ele que torna o documento visível para a validação.
+    conteudo: bytes ou UploadSpool; pdf_final: bytes ou caminho de um arquivo
+    (nos backends em disco, só renomeado para o destino).
+    """
+    with metrica_etapas_assinatura.medir(etapa="escrita_pdf"):
+        if isinstance(pdf_final, str):
+            await armazenamento.importar_arquivo(chave_documento(id_documento, ".pdf"), pdf_final)
+        else:
+            await armazenamento.gravar(chave_documento(id_documento, ".pdf"), pdf_final)
+
+    # Original (sem assinatura) no armazém endereçado por conteúdo
+    with metrica_etapas_assinatura.medir(etapa="escrita_original"):
+        if isinstance(conteudo, UploadSpool):
+            conteudo = conteudo.blocos()
+        if await armazem_originais.guardar(sha256_original, conteudo):
+            metrica_originais.inc(resultado="gravado")
+        else:
+            metrica_originais.inc(resultado="deduplicado")
+
+    with metrica_etapas_assinatura.medir(etapa="escrita_json"):
+        await armazenamento.gravar(
+            chave_documento(id_documento, ".json"),
+            json.dumps(metadados, ensure_ascii=False, indent=4).encode("utf-8")
+        )
+
+async def persistir_documento_assinado(id_documento, assinatura_base64, id_chave, conteudo, pdf_final, nome_arquivo, nome_contratante, nome_contratada, sha256_original=None):
+    """
+    Salva o PDF assinado, o original e os metadados para que a página de
+    validação funcione, e registra o documento no MongoDB. Usado pelo
+    /assinar e pelo /assinar/lote. Falhas são registradas e não propagadas.
+    Formatos de conteudo e pdf_final: ver gravar_arquivos_documento.
+    """
     try:
-        leitor = PdfReader(io.BytesIO(pdf_bytes))
-        escritor = PdfWriter()
+        print(f"💾 Salvando documento ID: {id_documento}")
+        chave_pdf = chave_documento(id_documento, ".pdf")
+        if sha256_original is None:
+            sha256_original = hashlib.sha256(conteudo).hexdigest()
         
-        # Link agora usa o ID curto e seguro
-        link = f"https://localhost:8000/validar?hash={id_documento}"
+        # Salva Metadados
+        metadados = {
+            "hash": assinatura_base64, # Mantemos o hash completo nos metadados
+            "id_curto": id_documento,
+            "id_chave": id_chave, # Chave usada (rotação)
+            "sha256_original": sha256_original, # Original no armazém de originais
+            "data_assinatura": datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"),
+            "ip": "187.102.169.26", # Em produção, pegar de request.client.host
+            "signatarios": []
+        }
         
-        # Variáveis para capturar tamanho da última página
-        last_width = 0
-        last_height = 0
+        if nome_contratante:
+            metadados["signatarios"].append({
+                "nome": nome_contratante,
+                "email": "contratante@email.com", # Futuro: pegar do form
+                "tipo": "Parte Contratante"
+            })
         
-        # Copia todas as páginas e aplica carimbo
-        for i, pagina in enumerate(leitor.pages):
-            width = float(pagina.mediabox.width)
-            height = float(pagina.mediabox.height)
-            last_width = width
-            last_height = height
-            
-            nova_pagina = PageObject.create_blank_page(width=width, height=height)
-            nova_pagina.merge_page(pagina)
-            
-            # Carimbo de rodapé
-            carimbo_pdf = PdfReader(gerar_carimbo_pdf(hash_visual, link, width, height))
-            nova_pagina.merge_page(carimbo_pdf.pages[0])
-            
-            escritor.add_page(nova_pagina)
-            
-        # --- Lógica Inteligente de Assinatura ---
-        if any([nome_contratante, nome_contratada, img_contratante, img_contratada]):
-            
-            # Procura em todas as páginas (de trás para frente) para achar a linha de assinatura
-            coords_encontradas = None
-            indice_pagina_assinatura = -1
-            
-            # Verifica últimas 3 páginas (ou menos se documento for pequeno)
-            total_paginas = len(leitor.pages)
-            range_busca = range(total_paginas - 1, max(-1, total_paginas - 4), -1)
-            
-            for i in range_busca:
-                print(f"🔍 Procurando assinaturas na página {i+1}...")
-                coords = encontrar_coordenadas_assinatura(leitor.pages[i])
-                if coords:
-                    coords_encontradas = coords
-                    indice_pagina_assinatura = i
-                    print(f"✅ Encontrado na página {i+1}!")
-                    break
-            
-            if coords_encontradas and indice_pagina_assinatura != -1:
-                print("✅ Detectadas linhas de assinatura existentes. Usando modo Overlay.")
-                
-                # Lógica de Decisão de Posição:
-                # 1. Se achou 'linhas' (____), usa elas com prioridade (1ª=Contratante, 2ª=Contratada)
-                # 2. Se não achou linhas, mas achou labels, usa labels.
-                
-                pos_ct = None
-                pos_cd = None
-                
-                linhas = coords_encontradas.get('linhas', [])
-                if linhas:
-                    # Ordena linhas por Y decrescente (Topo -> Base)
-                    # Assumindo que a primeira linha é Contratante e segunda é Contratada
-                    linhas.sort(key=lambda k: k[1], reverse=True)
-                    
-                    if len(linhas) >= 1:
-                        # Assinatura EM CIMA da linha (+10)
-                        pos_ct = (linhas[0][0] + 50, linhas[0][1] + 10) 
-                        print(f"   -> Contratante na Linha 1: {pos_ct}")
-                    
-                    if len(linhas) >= 2:
-                        pos_cd = (linhas[1][0] + 50, linhas[1][1] + 10)
-                        print(f"   -> Contratada na Linha 2: {pos_cd}")
-                
-                # Fallback para Labels se não definiu por linhas
-                if not pos_ct and 'contratante' in coords_encontradas:
-                    # Assinatura ABAIXO do label (-50)
-                    pos_ct = (coords_encontradas['contratante'][0] + 40, coords_encontradas['contratante'][1] - 50)
-                    print(f"   -> Contratante no Label: {pos_ct}")
-                    
-                if not pos_cd and 'contratada' in coords_encontradas:
-                    pos_cd = (coords_encontradas['contratada'][0] + 40, coords_encontradas['contratada'][1] - 50)
-                    print(f"   -> Contratada no Label: {pos_cd}")
-
-                # Modo Overlay: Aplica na página encontrada
-                pagina_destino = escritor.pages[indice_pagina_assinatura]
-                
-                # Tamanho da página encontrada
-                w_pag = float(leitor.pages[indice_pagina_assinatura].mediabox.width)
-                h_pag = float(leitor.pages[indice_pagina_assinatura].mediabox.height)
-                
-                assinaturas_pdf = PdfReader(gerar_pagina_assinaturas(
-                    nome_contratante, nome_contratada, fonte, w_pag, h_pag, 
-                    img_contratante, img_contratada, 
-                    eh_nova_pagina=False, # Não cria layout, só joga assinatura
-                    pos_contratante=pos_ct,
-                    pos_contratada=pos_cd
-                ))
-                pagina_destino.merge_page(assinaturas_pdf.pages[0])
-                
-            else:
-                print("⚠️ Nenhuma linha detectada. Criando nova página de assinaturas.")
-                # Modo Página Extra: Cria uma nova página limpa
-                pagina_assinaturas = PageObject.create_blank_page(width=last_width, height=last_height)
-                
-                assinaturas_pdf = PdfReader(gerar_pagina_assinaturas(
-                    nome_contratante, nome_contratada, fonte, last_width, last_height, 
-                    img_contratante, img_contratada, 
-                    eh_nova_pagina=True, # Cria layout completo (título, linhas)
-                    pos_contratante=None, pos_contratada=None
-                ))
-                pagina_assinaturas.merge_page(assinaturas_pdf.pages[0])
-                
-                # Adiciona carimbo também na página de assinaturas
-                carimbo_pdf = PdfReader(gerar_carimbo_pdf(hash_visual, link, last_width, last_height))
-                pagina_assinaturas.merge_page(carimbo_pdf.pages[0])
-                
-                escritor.add_page(pagina_assinaturas)
+        if nome_contratada:
+            metadados["signatarios"].append({
+                "nome": nome_contratada,
+                "email": "contratada@email.com",
+                "tipo": "Parte Contratada"
+            })
+
+        await gravar_arquivos_documento(id_documento, sha256_original, conteudo, pdf_final, metadados)
+        indice_documentos.adicionar(id_documento)
+
+        # 3. Salva no MongoDB (Coleção 'documentos' - Português)
+        try:
+            novo_documento = {
+                "name": nome_arquivo,
+                "hash": id_documento, # Usamos o ID curto para busca
+                "path": armazenamento.caminho_local(chave_pdf) or chave_pdf,
+                "status": "signed",
+                "createdAt": datetime.datetime.utcnow(),
+                "updatedAt": datetime.datetime.utcnow(),
+                "ownerEmail": "desconhecido@temp.com", # Placeholder (sem auth ainda)
+                "metadata": metadados # Salva o JSON completo dentro do banco
+            }
+            # Salva na coleção 'documentos'
+            with metrica_etapas_assinatura.medir(etapa="mongo"):
+                await db.documentos.insert_one(novo_documento)
+            print(f"✅ Documento salvo no MongoDB (coleção 'documentos')")
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar no MongoDB (não crítico): {e}")
+        return True
             
-        output = io.BytesIO()
-        escritor.write(output)
-        output.seek(0)
-        return output
     except Exception as e:
-        print(f"Erro visual PDF: {e}")
-        import traceback
-        traceback.print_exc()
-        return io.BytesIO(pdf_bytes)
+        print(f"Erro ao salvar persistencia: {e}")
+        return False
+
+@app.get("/assinar/motor")
+async def estatisticas_motor_assinatura():
+    # Tamanho do pool, profundidade da fila e contadores do motor
+    return motor_assinatura.estatisticas()
+
+@app.get("/armazenamento/varredor")
+async def estatisticas_varredor_armazenamento():
+    # Cursor, ciclo em andamento, último ciclo completo e bytes liberados
+    return dict(varredor_armazenamento.estatisticas(), ativo=VARREDOR_ATIVO)
+
+@app.get("/armazenamento/migracao")
+async def estatisticas_migracao_layout():
+    # Progresso da migração para o layout fragmentado
+    if migracao_layout is None:
+        return {"legado": False, "backend": armazenamento.nome}
+    return migracao_layout.estatisticas()
+
+@app.get("/assinar/fontes")
+async def estatisticas_fontes_assinatura():
+    # Fonte de cada estilo e acertos do cache de subsets (deste processo)
+    return registro_fontes.estatisticas()
+
+# --- Biblioteca de Assinaturas ---
+TAMANHO_MAX_IMAGEM_ASSINATURA = 5 * 1024 * 1024
+ID_ASSINATURA = re.compile(r"^[0-9a-f]{32}$")
+
+def formatar_assinatura(d):
+    return {
+        "id": d["_id"],
+        "name": d.get("nome", "Assinatura"),
+        "width": d.get("largura"),
+        "height": d.get("altura"),
+        "size": d.get("tamanho"),
+        "date": d["criadoEm"].strftime("%d/%m/%Y") if isinstance(d.get("criadoEm"), datetime.datetime) else "N/A",
+        "url": f"/assinaturas-salvas/{d['_id']}/imagem"
+    }
+
+@app.post("/assinaturas-salvas")
+async def salvar_assinatura(email: str = Form(...), imagem: UploadFile = File(...), nome: str = Form("")):
+    dados = await imagem.read(TAMANHO_MAX_IMAGEM_ASSINATURA + 1)
+    if len(dados) > TAMANHO_MAX_IMAGEM_ASSINATURA:
+        raise HTTPException(status_code=413, detail="Imagem de assinatura muito grande")
+    try:
+        assinatura = await biblioteca_assinaturas.salvar(email, dados, nome)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return formatar_assinatura(assinatura)
+
+@app.get("/assinaturas-salvas")
+async def listar_assinaturas(email: str):
+    return [formatar_assinatura(d) for d in await biblioteca_assinaturas.listar(email)]
+
+@app.get("/assinaturas-salvas/{id_assinatura}/imagem")
+async def imagem_assinatura(id_assinatura: str, request: Request):
+    # O PNG de uma assinatura nunca muda: o id serve de ETag forte
+    if not ID_ASSINATURA.match(id_assinatura) or not await armazenamento.existe(biblioteca_assinaturas.chave(id_assinatura)):
+        raise HTTPException(status_code=404, detail="Assinatura não encontrada")
+    return await resposta_armazenada(
+        request, armazenamento, biblioteca_assinaturas.chave(id_assinatura), etag_forte(id_assinatura), media_type="image/png"
+    )
+
+@app.delete("/assinaturas-salvas/{id_assinatura}")
+async def remover_assinatura(id_assinatura: str, email: str):
+    if not await biblioteca_assinaturas.remover(id_assinatura, email):
+        raise HTTPException(status_code=404, detail="Assinatura não encontrada")
+    return {"status": "removida"}
+
+def validar_ids_assinatura(*ids_assinatura):
+    # Ids de assinaturas salvas vindos do formulário: malformados são erro do cliente
+    for id_assinatura in ids_assinatura:
+        if id_assinatura and not ID_ASSINATURA.match(id_assinatura):
+            raise HTTPException(status_code=400, detail="Id de assinatura salva inválido")
+
+async def imagem_do_signatario(upload, id_assinatura):
+    # Imagem enviada no próprio pedido ou, na falta dela, a assinatura salva pelo id
+    if upload:
+        return await upload.read()
+    if not id_assinatura:
+        return None
+    validar_ids_assinatura(id_assinatura)
+    dados = await biblioteca_assinaturas.imagem(id_assinatura)
+    if dados is None:
+        raise HTTPException(status_code=404, detail="Assinatura salva não encontrada")
+    return dados
+
+def _remover_temporario(caminho):
+    if os.path.exists(caminho):
+        os.remove(caminho)
 
 @app.post("/assinar")
 async def assinar_contrato(
@@ -570,209 +693,362 @@ async def assinar_contrato(
     nome_contratada: str = Form(""),
     fonte: str = Form("padrao"),
     img_contratante: UploadFile = File(None),
-    img_contratada: UploadFile = File(None)
+    img_contratada: UploadFile = File(None),
+    assinatura_contratante: str = Form(""), # id de uma assinatura salva (/assinaturas-salvas)
+    assinatura_contratada: str = Form("")
 ):
+    validar_ids_assinatura(assinatura_contratante, assinatura_contratada)
     try:
         print(f"--- NOVA SOLICITAÇÃO DE ASSINATURA ---")
         print(f"Nome Contratante: '{nome_contratante}' | Imagem Contratante: {img_contratante.filename if img_contratante else 'Não enviada'}")
         print(f"Nome Contratada: '{nome_contratada}' | Imagem Contratada: {img_contratada.filename if img_contratada else 'Não enviada'}")
         
-        conteudo = await arquivo.read()
-        
-        # Lê imagens se existirem
-        bytes_img_contratante = await img_contratante.read() if img_contratante else None
-        bytes_img_contratada = await img_contratada.read() if img_contratada else None
-        
-        # 1. Assinatura Criptográfica
-        chave_privada = carregar_chave_privada()
-        assinatura = chave_privada.sign(
-            conteudo,
-            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-            hashes.SHA256()
-        )
-        assinatura_base64 = base64.b64encode(assinatura).decode('utf-8')
-        
-        # GERA ID CURTO E SEGURO (SHA256 da assinatura) - 64 caracteres
-        # Isso resolve o problema de "nome de arquivo muito longo" no Windows
-        id_documento = hashlib.sha256(assinatura).hexdigest()
-        print(f"✅ ID CURTO GERADO: {id_documento}") # Log de confirmação
-        
-        # 2. Aplicação Visual (Rodapé e Nomes na última página)
-        pdf_final = aplicar_assinatura_visual(
-            conteudo, 
-            id_documento, # ID para o link/QR Code
-            assinatura_base64, # Hash visual para exibir no texto
-            nome_contratante, 
-            nome_contratada, 
-            fonte,
-            bytes_img_contratante,
-            bytes_img_contratada
-        )
-        
-        # --- PERSISTÊNCIA PARA VALIDAÇÃO ---
-        # Salva o arquivo e metadados para que a página de validação funcione
-        try:
-            print(f"💾 Salvando documento ID: {id_documento}")
-            caminho_pdf = os.path.join(DIRETORIO_ASSINADOS, f"{id_documento}.pdf")
-            print(f"   -> Caminho PDF: {caminho_pdf}")
-            caminho_original = os.path.join(DIRETORIO_ASSINADOS, f"{id_documento}_original.pdf")
-            caminho_json = os.path.join(DIRETORIO_ASSINADOS, f"{id_documento}.json")
-            print(f"   -> Caminho JSON: {caminho_json}")
-            
-            # Salva PDF Assinado
-            with open(caminho_pdf, "wb") as f:
-                f.write(pdf_final.getvalue())
-
-            # Salva PDF Original (Sem Assinatura)
-            with open(caminho_original, "wb") as f:
-                f.write(conteudo)
+        # Lê o upload em blocos, calculando o SHA-256 que será assinado; acima
+        # do limiar ele vai para o disco e o worker lê de lá
+        async with UploadSpool(ASSINAR_SPOOL_LIMIAR, ASSINAR_SPOOL_DIR) as upload:
+            with metrica_etapas_assinatura.medir(etapa="leitura_upload"):
+                await upload.receber(arquivo, TAMANHO_CHUNK_UPLOAD)
+            metrica_bytes_entrada.inc(upload.tamanho)
+            metrica_uploads_spool.inc(destino="disco" if upload.em_disco else "memoria")
             
-            # Salva Metadados
-            metadados = {
-                "hash": assinatura_base64, # Mantemos o hash completo nos metadados
-                "id_curto": id_documento,
-                "data_assinatura": datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S"),
-                "ip": "187.102.169.26", # Em produção, pegar de request.client.host
-                "signatarios": []
-            }
+            # Lê imagens se existirem (enviadas agora ou salvas na biblioteca)
+            bytes_img_contratante = await imagem_do_signatario(img_contratante, assinatura_contratante)
+            bytes_img_contratada = await imagem_do_signatario(img_contratada, assinatura_contratada)
             
-            if nome_contratante:
-                metadados["signatarios"].append({
-                    "nome": nome_contratante,
-                    "email": "contratante@email.com", # Futuro: pegar do form
-                    "tipo": "Parte Contratante"
-                })
+            # O PDF assinado é escrito pelo worker direto em arquivo: nos backends
+            # em disco já no diretório final (a persistência só renomeia)
+            destino = await armazenamento.criar_temporario()
+            if destino is None:
+                fd, destino = tempfile.mkstemp(dir=ASSINAR_SPOOL_DIR, prefix="assinado-", suffix=".pdf")
+                os.close(fd)
             
-            if nome_contratada:
-                metadados["signatarios"].append({
-                    "nome": nome_contratada,
-                    "email": "contratada@email.com",
-                    "tipo": "Parte Contratada"
-                })
-
-            with open(caminho_json, "w", encoding="utf-8") as f:
-                json.dump(metadados, f, ensure_ascii=False, indent=4)
-
-            # 3. Salva no MongoDB (Coleção 'documentos' - Português)
             try:
-                novo_documento = {
-                    "name": arquivo.filename,
-                    "hash": id_documento, # Usamos o ID curto para busca
-                    "path": caminho_pdf,
-                    "status": "signed",
-                    "createdAt": datetime.datetime.utcnow(),
-                    "updatedAt": datetime.datetime.utcnow(),
-                    "ownerEmail": "desconhecido@temp.com", # Placeholder (sem auth ainda)
-                    "metadata": metadados # Salva o JSON completo dentro do banco
-                }
-                # Salva na coleção 'documentos'
-                await db.documentos.insert_one(novo_documento)
-                print(f"✅ Documento salvo no MongoDB (coleção 'documentos')")
-            except Exception as e:
-                print(f"⚠️ Erro ao salvar no MongoDB (não crítico): {e}")
+                # 1 e 2. Assinatura criptográfica + aplicação visual, no pool de processos
+                try:
+                    assinatura_base64, id_chave, id_documento, _, telemetria = await motor_assinatura.executar(
+                        executar_pipeline_assinatura,
+                        upload.origem(),
+                        upload.sha256.digest(),
+                        nome_contratante,
+                        nome_contratada,
+                        fonte,
+                        bytes_img_contratante,
+                        bytes_img_contratada,
+                        destino
+                    )
+                except FilaCheiaError as e:
+                    raise HTTPException(status_code=503, detail=str(e))
+                except TempoEsgotadoError as e:
+                    raise HTTPException(status_code=504, detail=str(e))
+                print(f"✅ ID CURTO GERADO: {id_documento}") # Log de confirmação
+                registrar_telemetria_assinatura(telemetria, telemetria["bytes_saida"])
                 
-        except Exception as e:
-            print(f"Erro ao salvar persistencia: {e}")
+                # --- PERSISTÊNCIA PARA VALIDAÇÃO ---
+                await persistir_documento_assinado(
+                    id_documento, assinatura_base64, id_chave, upload, destino,
+                    arquivo.filename, nome_contratante, nome_contratada,
+                    sha256_original=upload.sha256.hexdigest()
+                )
+            except BaseException:
+                await asyncio.to_thread(_remover_temporario, destino)
+                raise
         
-        # Retorna o PDF modificado para download
-        pdf_final.seek(0) # Reset para envio
-        return StreamingResponse(
-            pdf_final, 
+        # Retorna o PDF assinado servido do arquivo (sendfile), sem carregá-lo:
+        # do destino final ou, se ele não foi movido para lá, do temporário
+        caminho_final = armazenamento.caminho_local(chave_documento(id_documento, ".pdf"))
+        temporario = await asyncio.to_thread(os.path.exists, destino)
+        return FileResponse(
+            destino if temporario else caminho_final,
             media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename=assinado_{arquivo.filename}"}
+            filename=f"assinado_{arquivo.filename}",
+            background=BackgroundTask(_remover_temporario, destino) if temporario else None
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/validar/dados/{hash}")
-async def obter_dados_validacao(hash: str):
-    # Função auxiliar para tentar formatos diferentes de hash
-    def tentar_encontrar(h_test):
-        print(f"🔍 Buscando metadados para hash: {h_test}")
-        nomes_teste = [
-            h_test,
-            h_test.replace(' ', '+'), # Correção comum de query param
-            h_test.replace('+', '-').replace('/', '_').rstrip('='), # URL Safe
-            urllib.parse.unquote(h_test) # Decoded
-        ]
-        for nome in nomes_teste:
-            p = os.path.join(DIRETORIO_ASSINADOS, f"{nome}.json")
-            # print(f"   - Testando: {p}") # Verbose
-            if os.path.exists(p):
-                print(f"   ✅ Encontrado em: {p}")
-                return p
-        print(f"   ❌ Não encontrado após {len(nomes_teste)} tentativas.")
-        return None
+# --- Assinatura em Lote ---
+# Quantos arquivos do lote ficam em andamento ao mesmo tempo, contando os já
+# assinados que ainda não entraram no ZIP (padrão: um por worker do motor)
+LOTE_PARALELISMO = int(os.getenv("LOTE_PARALELISMO", "0")) or max(1, motor_assinatura.workers)
+LOTE_MAX_ARQUIVOS = int(os.getenv("LOTE_MAX_ARQUIVOS", "2000"))
+LOTE_TENTATIVAS_FILA = 5
+
+class _SaidaZip:
+    """
+    Destino sem seek para o zipfile: o ZIP é escrito com data descriptors e
+    os bytes prontos são drenados a cada arquivo, sem guardar o lote inteiro.
+    """
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        dados = b"".join(self._partes)
+        self._partes = []
+        return dados
+
+def _nome_unico(nome, usados):
+    # Evita entradas repetidas no ZIP de saída (ex.: mesmo nome em pastas diferentes)
+    base, ext = os.path.splitext(nome)
+    candidato = nome
+    n = 1
+    while candidato in usados:
+        n += 1
+        candidato = f"{base}_{n}{ext}"
+    usados.add(candidato)
+    return candidato
+
+def _entradas_lote(arquivos, arquivo_zip):
+    """
+    Lista (nome, leitor) dos PDFs do lote. leitor() é uma corrotina que lê os
+    bytes só quando o arquivo entra no motor, para não carregar o lote inteiro.
+    """
+    entradas = []
+    for arquivo in arquivos or []:
+        if arquivo is None or not arquivo.filename:
+            continue
+        entradas.append((arquivo.filename, arquivo.read))
+
+    if arquivo_zip is not None and arquivo_zip.filename:
+        try:
+            zip_entrada = zipfile.ZipFile(arquivo_zip.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Arquivo ZIP inválido")
+        for info in zip_entrada.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            if os.path.basename(info.filename).startswith("._"):
+                continue # Metadados do macOS
+            async def ler(info=info):
+                # Descompressão fora do event loop
+                return await asyncio.to_thread(zip_entrada.read, info)
+            entradas.append((info.filename, ler))
+    return entradas
+
+async def _assinar_item_lote(nome, ler, config):
+    resultado = {"arquivo": nome, "status": "erro", "id_documento": None}
+    try:
+        conteudo = await ler()
+        digest = hashlib.sha256(conteudo).digest()
+        if not conteudo.startswith(b"%PDF"):
+            resultado["erro"] = "Arquivo não é um PDF"
+            return resultado, None
+        metrica_bytes_entrada.inc(len(conteudo))
+        
+        # O motor pode estar cheio com pedidos do /assinar: espera e tenta de novo
+        for tentativa in range(LOTE_TENTATIVAS_FILA):
+            try:
+                assinatura_base64, id_chave, id_documento, bytes_pdf_final, telemetria = await motor_assinatura.executar(
+                    executar_pipeline_assinatura,
+                    conteudo,
+                    digest,
+                    config["nome_contratante"],
+                    config["nome_contratada"],
+                    config["fonte"],
+                    config["img_contratante"],
+                    config["img_contratada"]
+                )
+                break
+            except FilaCheiaError:
+                if tentativa == LOTE_TENTATIVAS_FILA - 1:
+                    raise
+                await asyncio.sleep(0.5 * (tentativa + 1))
+        registrar_telemetria_assinatura(telemetria, len(bytes_pdf_final))
+        
+        salvo = await persistir_documento_assinado(
+            id_documento, assinatura_base64, id_chave, conteudo, bytes_pdf_final,
+            os.path.basename(nome), config["nome_contratante"], config["nome_contratada"],
+            sha256_original=digest.hex()
+        )
+        resultado.update({
+            "status": "assinado" if salvo else "assinado_sem_persistencia",
+            "id_documento": id_documento,
+            "modo": telemetria.get("modo"),
+            "bytes": len(bytes_pdf_final)
+        })
+        return resultado, bytes_pdf_final
+    except (FilaCheiaError, TempoEsgotadoError) as e:
+        resultado["erro"] = str(e)
+        return resultado, None
+    except Exception as e:
+        print(f"Erro no lote ({nome}): {e}")
+        resultado["erro"] = str(e)
+        return resultado, None
 
-    caminho_encontrado = tentar_encontrar(hash)
+async def gerar_zip_lote(entradas, config):
+    """
+    Assina os PDFs em paralelo e gera o ZIP de saída em streaming: cada PDF
+    entra no ZIP assim que fica pronto; o manifesto (manifesto.json) vai no fim.
+    """
+    saida = _SaidaZip()
+    # PDFs já são comprimidos internamente: armazenados sem deflate
+    zip_saida = zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_STORED)
+    # Janela deslizante: no máximo LOTE_PARALELISMO tarefas vivas, inclusive as já
+    # concluídas cujo PDF ainda não foi escrito. Uma nova só começa depois que o
+    # PDF anterior foi entregue ao cliente, então um cliente lento não acumula PDFs.
+    restantes = iter(entradas)
+    tarefas = set()
+    def completar_janela():
+        while len(tarefas) < LOTE_PARALELISMO:
+            entrada = next(restantes, None)
+            if entrada is None:
+                return
+            nome, ler = entrada
+            tarefas.add(asyncio.create_task(_assinar_item_lote(nome, ler, config)))
+    manifesto = []
+    nomes_usados = {"manifesto.json"}
+    inicio = time.perf_counter()
+    try:
+        completar_janela()
+        while tarefas:
+            prontas, _ = await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                resultado, bytes_pdf_final = tarefa.result()
+                tarefas.discard(tarefa)
+                if bytes_pdf_final is not None:
+                    nome_saida = _nome_unico(f"assinado_{os.path.basename(resultado['arquivo'])}", nomes_usados)
+                    zip_saida.writestr(nome_saida, bytes_pdf_final)
+                    resultado["arquivo_assinado"] = nome_saida
+                    yield saida.drenar()
+                manifesto.append(resultado)
+            completar_janela()
+
+        assinados = sum(1 for r in manifesto if r["id_documento"])
+        resumo = {
+            "total": len(manifesto),
+            "assinados": assinados,
+            "falhas": len(manifesto) - assinados,
+            "duracao_segundos": round(time.perf_counter() - inicio, 3),
+            "documentos": manifesto
+        }
+        zip_saida.writestr(
+            "manifesto.json",
+            json.dumps(resumo, ensure_ascii=False, indent=2),
+            compress_type=zipfile.ZIP_DEFLATED
+        )
+        zip_saida.close()
+        yield saida.drenar()
+        print(f"📦 Lote concluído: {assinados}/{len(manifesto)} assinados")
+    finally:
+        # Cliente desconectou (ou erro): não deixa tarefas órfãs no motor
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+@app.post("/assinar/lote")
+async def assinar_lote(
+    arquivos: List[UploadFile] = File(None),
+    arquivo_zip: UploadFile = File(None),
+    nome_contratante: str = Form(""),
+    nome_contratada: str = Form(""),
+    fonte: str = Form("padrao"),
+    img_contratante: UploadFile = File(None),
+    img_contratada: UploadFile = File(None),
+    assinatura_contratante: str = Form(""),
+    assinatura_contratada: str = Form("")
+):
+    """
+    Assina vários PDFs com a mesma configuração de signatários.
+    Aceita uma lista de PDFs (campo 'arquivos') e/ou um ZIP ('arquivo_zip').
+    Responde com um ZIP em streaming contendo os PDFs assinados e manifesto.json
+    (arquivo, status e id_documento de cada item).
+    """
+    validar_ids_assinatura(assinatura_contratante, assinatura_contratada)
+    entradas = _entradas_lote(arquivos, arquivo_zip)
+    if not entradas:
+        raise HTTPException(status_code=400, detail="Nenhum PDF enviado no lote")
+    if len(entradas) > LOTE_MAX_ARQUIVOS:
+        raise HTTPException(status_code=413, detail=f"Lote excede {LOTE_MAX_ARQUIVOS} arquivos")
+    
+    print(f"--- NOVO LOTE DE ASSINATURA: {len(entradas)} arquivo(s) ---")
     
-    if caminho_encontrado:
-        with open(caminho_encontrado, "r", encoding="utf-8") as f:
-            return JSONResponse(content=json.load(f))
+    # Configuração compartilhada: imagens lidas uma única vez para o lote todo
+    config = {
+        "nome_contratante": nome_contratante,
+        "nome_contratada": nome_contratada,
+        "fonte": fonte,
+        "img_contratante": await imagem_do_signatario(img_contratante, assinatura_contratante),
+        "img_contratada": await imagem_do_signatario(img_contratada, assinatura_contratada)
+    }
     
-    return JSONResponse(content={"erro": "Documento não encontrado"}, status_code=404)
+    return StreamingResponse(
+        gerar_zip_lote(entradas, config),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=lote_assinado.zip"}
+    )
+
+@app.get("/validar/dados/{hash}")
+async def obter_dados_validacao(hash: str):
+    with metrica_validacao.medir(rota="dados"):
+        id_documento = await indice_documentos.resolver(hash)
+        
+        if id_documento:
+            try:
+                return JSONResponse(content=await ler_metadados(id_documento))
+            except FileNotFoundError:
+                indice_documentos.remover(id_documento)
+        
+        return JSONResponse(content={"erro": "Documento não encontrado"}, status_code=404)
 
 @app.get("/validar/arquivo-original/{hash}")
-async def baixar_arquivo_original(hash: str):
+async def baixar_arquivo_original(hash: str, request: Request):
     # Busca o arquivo original (sem assinatura) pelo ID
-    caminho_pdf = os.path.join(DIRETORIO_ASSINADOS, f"{hash}_original.pdf")
+    with metrica_validacao.medir(rota="arquivo_original"):
+        id_documento = await indice_documentos.resolver(hash)
+        chave, etag = await localizar_original(id_documento) if id_documento else (None, None)
+        encontrado = chave is not None and await armazenamento.existe(chave)
     
-    if os.path.exists(caminho_pdf):
-        return FileResponse(caminho_pdf, media_type="application/pdf", filename="documento_original.pdf")
+    if encontrado:
+        return await resposta_armazenada(request, armazenamento, chave, etag, filename="documento_original.pdf")
     raise HTTPException(status_code=404, detail="Arquivo original não encontrado")
 
 @app.get("/validar/visualizar/{hash}")
-async def visualizar_arquivo_validacao(hash: str):
+async def visualizar_arquivo_validacao(hash: str, request: Request):
     # Endpoint específico para VISUALIZAÇÃO (Content-Disposition: inline)
     # Isso evita que o navegador baixe o arquivo automaticamente no iframe
-    def tentar_encontrar_pdf(h_test):
-        nomes_teste = [
-            h_test,
-            h_test.replace(' ', '+'),
-            h_test.replace('+', '-').replace('/', '_').rstrip('='),
-            urllib.parse.unquote(h_test)
-        ]
-        for nome in nomes_teste:
-            p = os.path.join(DIRETORIO_ASSINADOS, f"{nome}.pdf")
-            if os.path.exists(p):
-                return p
-        return None
-
-    caminho_pdf = tentar_encontrar_pdf(hash)
+    with metrica_validacao.medir(rota="visualizar"):
+        id_documento = await indice_documentos.resolver(hash)
+        # O índice vem do Mongo: o registro pode existir sem o PDF
+        encontrado = id_documento is not None and await armazenamento.existe(chave_documento(id_documento, ".pdf"))
     
-    if caminho_pdf:
+    if encontrado:
         # 'inline' força a exibição no navegador
-        return FileResponse(
-            caminho_pdf, 
-            media_type="application/pdf", 
+        # O PDF assinado nunca muda depois de gravado: o próprio ID é o ETag
+        return await resposta_armazenada(
+            request,
+            armazenamento,
+            chave_documento(id_documento, ".pdf"), 
+            etag_forte(id_documento),
             headers={"Content-Disposition": "inline; filename=documento_visualizacao.pdf"}
         )
     raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
 @app.get("/validar/arquivo/{hash}")
-async def baixar_arquivo_validacao(hash: str):
-    # Mesma lógica de busca flexível para o PDF
-    def tentar_encontrar_pdf(h_test):
-        nomes_teste = [
-            h_test,
-            h_test.replace(' ', '+'),
-            h_test.replace('+', '-').replace('/', '_').rstrip('='),
-            urllib.parse.unquote(h_test)
-        ]
-        for nome in nomes_teste:
-            p = os.path.join(DIRETORIO_ASSINADOS, f"{nome}.pdf")
-            if os.path.exists(p):
-                return p
-        return None
-
-    caminho_pdf = tentar_encontrar_pdf(hash)
+async def baixar_arquivo_validacao(hash: str, request: Request):
+    # Mesma resolução de hash da validação
+    with metrica_validacao.medir(rota="arquivo"):
+        id_documento = await indice_documentos.resolver(hash)
+        encontrado = id_documento is not None and await armazenamento.existe(chave_documento(id_documento, ".pdf"))
     
-    if caminho_pdf:
-        return FileResponse(caminho_pdf, media_type="application/pdf", filename="documento_assinado.pdf")
+    if encontrado:
+        return await resposta_armazenada(
+            request, armazenamento, chave_documento(id_documento, ".pdf"), etag_forte(id_documento), filename="documento_assinado.pdf"
+        )
     raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
+@app.get("/validar/indice")
+async def estatisticas_indice_validacao():
+    return indice_documentos.estatisticas()
+
 @app.get("/validar")
 async def redirecionar_validacao_q(hash: str):
     print(f"🔄 Redirecionando validação (Query) para: {hash[:30]}...")
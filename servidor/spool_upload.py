@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from armazenamento import blocos_arquivo, TAMANHO_CHUNK_ARMAZENAMENTO
+
+class UploadSpool:
+    """
+    Upload recebido em blocos, com o SHA-256 calculado durante a leitura.
+    Fica em memória até `limiar` bytes; acima disso vai inteiro para um
+    arquivo temporário em `diretorio`, e o worker de assinatura lê do disco.
+    Usado com `async with`: o temporário é apagado na saída.
+    """
+    def __init__(self, limiar, diretorio=None):
+        self.limiar = max(0, int(limiar))
+        self.diretorio = diretorio
+        self.sha256 = hashlib.sha256()
+        self.tamanho = 0
+        self.dados = None
+        self.caminho = None
+
+    async def receber(self, arquivo, tamanho_chunk):
+        partes = []
+        destino = None
+        try:
+            while True:
+                chunk = await arquivo.read(tamanho_chunk)
+                if not chunk:
+                    break
+                self.sha256.update(chunk)
+                self.tamanho += len(chunk)
+                if destino is None and self.tamanho > self.limiar:
+                    # Passou do limiar: o que já chegou e o resto vão para o disco
+                    fd, self.caminho = tempfile.mkstemp(dir=self.diretorio, prefix="upload-", suffix=".pdf")
+                    destino = os.fdopen(fd, "wb")
+                    await asyncio.to_thread(destino.writelines, partes)
+                    partes = []
+                if destino is not None:
+                    await asyncio.to_thread(destino.write, chunk)
+                else:
+                    partes.append(chunk)
+        finally:
+            if destino is not None:
+                destino.close()
+        if self.caminho is None:
+            self.dados = b"".join(partes)
+        return self
+
+    @property
+    def em_disco(self):
+        return self.caminho is not None
+
+    def origem(self):
+        # O que o pipeline de assinatura recebe: caminho (em disco) ou bytes
+        return self.caminho if self.em_disco else self.dados
+
+    async def blocos(self):
+        if self.em_disco:
+            async for bloco in blocos_arquivo(self.caminho):
+                yield bloco
+            return
+        for posicao in range(0, len(self.dados), TAMANHO_CHUNK_ARMAZENAMENTO):
+            yield self.dados[posicao:posicao + TAMANHO_CHUNK_ARMAZENAMENTO]
+
+    def descartar(self):
+        if self.caminho and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+        self.dados = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *erro):
+        await asyncio.to_thread(self.descartar)
@@ -0,0 +1,348 @@
+import asyncio
+import datetime
+import json
+import time
+
+from armazenamento import ObjetoNaoEncontrado
+
+SUFIXOS_DOCUMENTO = ("_original.pdf", ".json", ".pdf") # _original.pdf antes de .pdf
+
+def _contagens():
+    return {
+        "examinados": 0,
+        "orfaos": {},            # tipo -> objetos removidos (ou que seriam, na simulação)
+        "recuperados": {},       # tipo -> registros recriados no Mongo a partir dos arquivos
+        "bytes_recuperados": 0,  # órfãos apagados
+        "arquivados": 0,
+        "bytes_arquivados": 0,   # economia da compressão dos originais frios
+        "erros": 0
+    }
+
+class VarredorArmazenamento:
+    """
+    Reconcilia o armazenamento dos assinados com o MongoDB, um lote por vez:
+
+    - {id}.pdf / {id}.json / {id}_original.pdf sem registro em 'documentos'
+      (campo hash): se há lápide em 'documentos_removidos' (gravada pelo
+      DELETE /api/documentos), apaga os arquivos e libera a referência do
+      original; sem lápide, o registro é recriado a partir do {id}.json (a
+      gravação no Mongo no /assinar não é crítica e o /validar lê do
+      armazenamento);
+    - contrato_<txid>.pdf sem registro em 'contratos' (nome_arquivo): com
+      lápide, apaga o arquivo; sem, recria o registro (contratos anteriores
+      ao registro existir, ou com falha no Mongo);
+    - assinaturas/<id>.png sem registro em 'assinaturas_salvas';
+    - originais/ (armazém por SHA-256) que nenhum documento referencia, só
+      depois de um ciclo completo sem registros de documento recuperados;
+    - originais referenciados sem acesso há `dias_frio` dias vão para a
+      camada fria do armazém (comprimidos; voltam na primeira leitura).
+
+    Só objetos gravados há mais de `idade_minima` segundos são apagados ou
+    recuperados, para não concorrer com uma assinatura em andamento. O cursor da listagem e os
+    totais ficam em `chave_estado` no próprio armazenamento: cada passo lista
+    só um lote e a varredura continua de onde parou, inclusive após reiniciar.
+    `ao_terminar_ciclo` (corrotina opcional) roda ao fim de cada ciclo, para
+    limpezas fora do armazenamento; o dict que ela retorna vai para o ciclo.
+    """
+    def __init__(self, armazenamento, armazem_originais, obter_db, tamanho_lote=500,
+                 idade_minima=7 * 86400, dias_frio=90, simular=False,
+                 ao_remover_documento=None, ao_terminar_ciclo=None, chave_estado="varredor/estado.json"):
+        self.armazenamento = armazenamento
+        self.armazem_originais = armazem_originais
+        self._obter_db = obter_db
+        self.tamanho_lote = tamanho_lote
+        self.idade_minima = idade_minima
+        self.dias_frio = dias_frio
+        self.simular = simular
+        self._ao_remover_documento = ao_remover_documento
+        self._ao_terminar_ciclo = ao_terminar_ciclo
+        self.chave_estado = chave_estado
+        self.estado = None
+
+    async def _carregar_estado(self):
+        if self.estado is None:
+            try:
+                self.estado = json.loads(await self.armazenamento.ler(self.chave_estado))
+            except (ObjetoNaoEncontrado, ValueError):
+                self.estado = {"cursor": None, "ciclos": 0, "inicio_ciclo": None, "ciclo_atual": _contagens(), "ultimo_ciclo": None, "totais": _contagens()}
+        return self.estado
+
+    async def _salvar_estado(self):
+        await self.armazenamento.gravar(self.chave_estado, json.dumps(self.estado).encode("utf-8"))
+
+    def _classificar(self, chave):
+        # (tipo, identificador) da chave; None para o que o varredor não conhece
+        if chave.startswith(self.chave_estado.split("/")[0] + "/"):
+            return None
+        prefixo_originais = self.armazem_originais.prefixo
+        prefixo_frio = self.armazem_originais.prefixo_frio
+        if chave.startswith(prefixo_frio + prefixo_originais) and chave.endswith(".pdf.gz"):
+            return "original", chave.rsplit("/", 1)[-1][:-len(".pdf.gz")]
+        if chave.startswith(prefixo_originais):
+            nome = chave.rsplit("/", 1)[-1]
+            for sufixo in (".pdf", ".refs"):
+                if nome.endswith(sufixo):
+                    return "original", nome[:-len(sufixo)]
+            return None
+        if chave.startswith("assinaturas/") and chave.endswith(".png"):
+            return "assinatura", chave[len("assinaturas/"):-len(".png")]
+        nome = chave[len("contratos/"):] if chave.startswith("contratos/") else chave
+        if "/" in nome:
+            return None
+        if nome.startswith("contrato_") and nome.endswith(".pdf"):
+            return "contrato", nome
+        if chave != nome:
+            return None
+        for sufixo in SUFIXOS_DOCUMENTO:
+            if nome.endswith(sufixo) and len(nome) > len(sufixo):
+                return "documento", nome[:-len(sufixo)]
+        return None
+
+    async def _antigo(self, chave, limite):
+        try:
+            modificado = (await self.armazenamento.tempos(chave)).modificado
+        except ObjetoNaoEncontrado:
+            return False
+        return modificado is not None and time.time() - modificado >= limite
+
+    async def _tamanho(self, chave):
+        try:
+            return (await self.armazenamento.info(chave)).tamanho
+        except ObjetoNaoEncontrado:
+            return 0
+
+    async def _existentes(self, colecao, campo, valores, filtro=None):
+        if not valores:
+            return set()
+        encontrados = set()
+        async for doc in colecao.find({**(filtro or {}), campo: {"$in": list(valores)}}, projection={campo: 1}):
+            valor = doc
+            for parte in campo.split("."):
+                valor = valor.get(parte) if isinstance(valor, dict) else None
+            encontrados.add(valor)
+        return encontrados
+
+    async def _apagar(self, chaves):
+        liberados = 0
+        for chave in chaves:
+            tamanho = await self._tamanho(chave)
+            if self.simular or await self.armazenamento.remover(chave):
+                liberados += tamanho
+        return liberados
+
+    async def _tamanho_original(self, sha256):
+        chaves = (self.armazem_originais.chave(sha256), self.armazem_originais.chave_fria(sha256), self.armazem_originais.chave_refs(sha256))
+        return sum([await self._tamanho(chave) for chave in chaves])
+
+    async def _metadados(self, id_documento):
+        # {id}.json do documento; None se não existe ou está ilegível
+        try:
+            metadados = json.loads(await self.armazenamento.ler(f"{id_documento}.json"))
+        except (ObjetoNaoEncontrado, ValueError):
+            return None
+        return metadados if isinstance(metadados, dict) else None
+
+    async def _criado_em(self, chave):
+        modificado = (await self.armazenamento.tempos(chave)).modificado
+        return datetime.datetime.utcfromtimestamp(modificado) if modificado is not None else datetime.datetime.utcnow()
+
+    async def _recuperar_documento(self, id_documento, chave, metadados):
+        # Mesmo formato do registro gravado em persistir_documento_assinado
+        chave_pdf = f"{id_documento}.pdf"
+        criado_em = await self._criado_em(chave)
+        registro = {
+            "name": chave_pdf,
+            "hash": id_documento,
+            "path": self.armazenamento.caminho_local(chave_pdf) or chave_pdf,
+            "status": "signed",
+            "createdAt": criado_em,
+            "updatedAt": criado_em,
+            "ownerEmail": "desconhecido@temp.com",
+            "metadata": metadados,
+            "recuperado": True
+        }
+        if not self.simular:
+            await self._obter_db().documentos.update_one({"hash": id_documento}, {"$setOnInsert": registro}, upsert=True)
+
+    async def _recuperar_contrato(self, nome, chave):
+        registro = {
+            "txid": nome[len("contrato_"):-len(".pdf")],
+            "nome_arquivo": nome,
+            "arquivo_chave": chave,
+            "criado_em": await self._criado_em(chave),
+            "recuperado": True
+        }
+        if not self.simular:
+            await self._obter_db().contratos.update_one({"nome_arquivo": nome}, {"$setOnInsert": registro}, upsert=True)
+
+    async def _remover_documento(self, id_documento, metadados):
+        chaves = [f"{id_documento}{sufixo}" for sufixo in SUFIXOS_DOCUMENTO]
+        sha256_original = (metadados or {}).get("sha256_original")
+        liberados = await self._apagar(chaves)
+        if not self.simular:
+            if sha256_original:
+                # O original só some quando nenhum outro documento o usa
+                tamanho_original = await self._tamanho_original(sha256_original)
+                if await self.armazem_originais.liberar(sha256_original) == 0:
+                    liberados += tamanho_original
+            if self._ao_remover_documento:
+                self._ao_remover_documento(id_documento)
+            # Arquivos apagados: a lápide já cumpriu o papel
+            await self._obter_db().documentos_removidos.delete_many({"tipo": "documento", "hash": id_documento})
+        return liberados
+
+    async def _remover_contrato(self, nome, chave):
+        liberados = await self._apagar([chave])
+        if not self.simular:
+            await self._obter_db().documentos_removidos.delete_many({"tipo": "contrato", "nome_arquivo": nome})
+        return liberados
+
+    def _originais_conciliados(self):
+        # O último ciclo completo não recriou nenhum registro de documento: todo
+        # documento no armazenamento tem registro, e o Mongo diz quem usa cada original
+        ultimo = self.estado["ultimo_ciclo"] if self.estado else None
+        return bool(ultimo) and ultimo.get("recuperados") is not None and not ultimo["recuperados"].get("documento")
+
+    async def _processar_originais(self, grupos, referenciados, contagens):
+        conciliados = self._originais_conciliados()
+        for sha256, chave in grupos.items():
+            if sha256 not in referenciados:
+                # .refs muda a cada nova referência: conta para a idade junto com o PDF
+                chave_refs = self.armazem_originais.chave_refs(sha256)
+                if conciliados and await self._antigo(chave, self.idade_minima) and (
+                        not await self.armazenamento.existe(chave_refs) or await self._antigo(chave_refs, self.idade_minima)):
+                    if self.simular:
+                        liberados = await self._tamanho_original(sha256)
+                    else:
+                        liberados = await self.armazem_originais.remover(sha256)
+                    self._contar_orfao(contagens, "original", liberados)
+                continue
+            # Referenciado: arquiva se a cópia quente está sem acesso há dias_frio dias (0 desliga)
+            if not self.dias_frio:
+                continue
+            try:
+                tempos = await self.armazenamento.tempos(self.armazem_originais.chave(sha256))
+            except ObjetoNaoEncontrado:
+                continue
+            if tempos.acessado is None or time.time() - tempos.acessado < self.dias_frio * 86400:
+                continue
+            economia = 0 if self.simular else await self.armazem_originais.arquivar(sha256)
+            if economia is not None:
+                contagens["arquivados"] += 1
+                contagens["bytes_arquivados"] += economia
+
+    def _contar_orfao(self, contagens, tipo, liberados):
+        contagens["orfaos"][tipo] = contagens["orfaos"].get(tipo, 0) + 1
+        contagens["bytes_recuperados"] += liberados
+
+    def _contar_recuperado(self, contagens, tipo):
+        contagens["recuperados"][tipo] = contagens["recuperados"].get(tipo, 0) + 1
+
+    async def _processar_lote(self, chaves, contagens):
+        # Agrupa o lote por tipo (guardando uma chave de cada para a idade)
+        grupos = {"documento": {}, "contrato": {}, "assinatura": {}, "original": {}}
+        for chave in chaves:
+            classificacao = self._classificar(chave)
+            if classificacao:
+                tipo, identificador = classificacao
+                grupos[tipo].setdefault(identificador, chave)
+
+        # Uma consulta por tipo e por lote; se o Mongo falhar, nada é apagado
+        db = self._obter_db()
+        documentos = await self._existentes(db.documentos, "hash", grupos["documento"])
+        contratos = await self._existentes(db.contratos, "nome_arquivo", grupos["contrato"])
+        assinaturas = await self._existentes(db.assinaturas_salvas, "_id", grupos["assinatura"])
+        # Lápides dos registros apagados pela API (DELETE /api/documentos)
+        documentos_removidos = await self._existentes(db.documentos_removidos, "hash", grupos["documento"], {"tipo": "documento"})
+        contratos_removidos = await self._existentes(db.documentos_removidos, "nome_arquivo", grupos["contrato"], {"tipo": "contrato"})
+
+        for id_documento, chave in grupos["documento"].items():
+            if id_documento in documentos or not await self._antigo(chave, self.idade_minima):
+                continue
+            metadados = await self._metadados(id_documento)
+            if id_documento in documentos_removidos:
+                self._contar_orfao(contagens, "documento", await self._remover_documento(id_documento, metadados))
+            elif metadados is not None:
+                # Sem registro e sem lápide não quer dizer abandonado (sem o {id}.json, fica como está)
+                await self._recuperar_documento(id_documento, chave, metadados)
+                self._contar_recuperado(contagens, "documento")
+        for nome, chave in grupos["contrato"].items():
+            if nome in contratos or not await self._antigo(chave, self.idade_minima):
+                continue
+            if nome in contratos_removidos:
+                self._contar_orfao(contagens, "contrato", await self._remover_contrato(nome, chave))
+            else:
+                await self._recuperar_contrato(nome, chave)
+                self._contar_recuperado(contagens, "contrato")
+        for id_assinatura, chave in grupos["assinatura"].items():
+            if id_assinatura not in assinaturas and await self._antigo(chave, self.idade_minima):
+                self._contar_orfao(contagens, "assinatura", await self._apagar([chave]))
+        # Depois da recuperação: os registros recriados acima também referenciam originais
+        originais = await self._existentes(db.documentos, "metadata.sha256_original", grupos["original"])
+        await self._processar_originais(grupos["original"], originais, contagens)
+
+    async def passo(self):
+        """Processa um lote a partir do checkpoint. Retorna True quando o ciclo terminou."""
+        estado = await self._carregar_estado()
+        if estado["inicio_ciclo"] is None:
+            estado["inicio_ciclo"] = time.time()
+        chaves, proximo = await self.armazenamento.listar_pagina(estado["cursor"], self.tamanho_lote)
+
+        lote = _contagens()
+        lote["examinados"] = len(chaves)
+        await self._processar_lote(chaves, lote)
+        for contagens in (estado["ciclo_atual"], estado["totais"]):
+            for campo, valor in lote.items():
+                if isinstance(valor, dict):
+                    # setdefault: estados gravados antes de "recuperados" existir
+                    por_tipo = contagens.setdefault(campo, {})
+                    for tipo, quantidade in valor.items():
+                        por_tipo[tipo] = por_tipo.get(tipo, 0) + quantidade
+                else:
+                    contagens[campo] += valor
+
+        estado["cursor"] = proximo
+        if proximo is None:
+            estado["ciclos"] += 1
+            estado["ultimo_ciclo"] = dict(estado["ciclo_atual"], inicio=estado["inicio_ciclo"], fim=time.time())
+            if self._ao_terminar_ciclo and not self.simular:
+                estado["ultimo_ciclo"].update(await self._ao_terminar_ciclo() or {})
+            estado["ciclo_atual"] = _contagens()
+            estado["inicio_ciclo"] = None
+        await self._salvar_estado()
+        return proximo is None
+
+    async def executar(self, pausa_lote=1.0, intervalo_ciclo=3600.0):
+        """Laço em segundo plano: um lote por vez, com pausa entre lotes e entre ciclos."""
+        while True:
+            try:
+                terminou = await self.passo()
+                if terminou:
+                    ciclo = self.estado["ultimo_ciclo"]
+                    print(f"🧹 Varredura do armazenamento concluída: {ciclo['examinados']} objetos, "
+                          f"{sum(ciclo['orfaos'].values())} órfãos ({ciclo['bytes_recuperados'] / 2**20:.1f} MB), "
+                          f"{sum(ciclo.get('recuperados', {}).values())} registros recuperados, "
+                          f"{ciclo['arquivados']} originais arquivados ({ciclo['bytes_arquivados'] / 2**20:.1f} MB)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Lote não concluído: o cursor não avança e o lote é refeito depois
+                print(f"⚠️ Erro no varredor do armazenamento: {e}")
+                if self.estado is not None:
+                    self.estado["totais"]["erros"] += 1
+                terminou = False
+            await asyncio.sleep(intervalo_ciclo if terminou else pausa_lote)
+
+    def estatisticas(self):
+        estado = self.estado or {}
+        return {
+            "simular": self.simular,
+            "tamanho_lote": self.tamanho_lote,
+            "idade_minima_s": self.idade_minima,
+            "dias_frio": self.dias_frio,
+            "cursor": estado.get("cursor"),
+            "ciclos": estado.get("ciclos", 0),
+            "ciclo_atual": estado.get("ciclo_atual"),
+            "ultimo_ciclo": estado.get("ultimo_ciclo"),
+            "totais": estado.get("totais")
+        }
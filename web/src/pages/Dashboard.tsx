@@ -27,7 +27,7 @@ function Dashboard() {
     const fetchActivities = async () => {
       if (!userEmail) return;
       try {
-        const response = await axios.get(`${API_URL}/api/documentos?email=${userEmail}`);
+        const response = await axios.get(`${API_URL}/api/documentos?email=${userEmail}&limite=5`);
         // Ordenar por data (mais recente primeiro) e pegar os 5 primeiros
         const docs = response.data
           .sort((a: any, b: any) => {
@@ -41,8 +41,17 @@ export default function MeusDocumentos() {
     if (!userEmail) return;
     setIsLoading(true);
     try {
-      const response = await axios.get(`${API_URL}/api/documentos?email=${userEmail}`);
-      const docs = response.data.map((d: any) => ({
+      // A listagem é paginada: segue o X-Proximo-Cursor até a última página
+      const todos: any[] = [];
+      let cursor: string | undefined;
+      do {
+        const response = await axios.get(`${API_URL}/api/documentos`, {
+          params: { email: userEmail, limite: 500, cursor }
+        });
+        todos.push(...response.data);
+        cursor = response.headers['x-proximo-cursor'] || undefined;
+      } while (cursor);
+      const docs = todos.map((d: any) => ({
         ...d,
         type: getFileType(d.name)
       }));
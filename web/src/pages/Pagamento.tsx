@@ -72,7 +72,7 @@ function Pagamento() {
   // PIX State
   const [userName, setUserName] = useState('');
   const [userCpf, setUserCpf] = useState('');
-  const [pixData, setPixData] = useState<{ qr_code_base64: string; payload_pix: string; txid: string; valor: number } | null>(null);
+  const [pixData, setPixData] = useState<{ qr_code_url: string; payload_pix: string; txid: string; valor: number } | null>(null);
   const [contratoUrl, setContratoUrl] = useState<string | null>(null);
 
   const toggleMenu = () => setIsMenuOpen(!isMenuOpen);
@@ -969,7 +969,7 @@ function Pagamento() {
                   <div style={{ textAlign: 'center', background: 'white', padding: '1.5rem', borderRadius: '12px' }}>
                     <p style={{ color: '#333', marginBottom: '1rem', fontWeight: 'bold' }}>Escaneie o QR Code para pagar</p>
                     <img
-                      src={`data:image/png;base64,${pixData.qr_code_base64}`}
+                      src={`${API_URL}${pixData.qr_code_url}`}
                       alt="QR Code PIX"
                       style={{ maxWidth: '200px', width: '100%', marginBottom: '1rem' }}
                     />